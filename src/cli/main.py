@@ -1,142 +1,164 @@
+import json
 import os
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from openpyxl import Workbook
 
-import scheduler
 from constants import *
+from helpers.apihelper import ApiHelper
+from helpers.logger import ConsoleLogger
 from oauth2client import tools
+from services import scheduler
+from services.cache import SolutionCache
+from services.horizon import RollingHorizon
+from services.solvers import SOLVER_NAMES
 
 
-def publish_sched(sched, api, year):
+def publish_sched(schedule, clin_data, api, year):
     """
     Publishes the block and weekend assignments as events to Google 
-    calendar.
+    calendar. Weeks are counted from ISO week 1 of `year`, and may run into
+    the following years.
     """
-    for division in sched.divisions.values():
-        for block_num in range(len(division.assignments)):
-            clinician = division.assignments[block_num]
-            for j in range(BLOCK_SIZE, 0, -1):
-                week_start = datetime.strptime(
-                    '{0}/{1:02d}/1/08:00/'.format(
-                        year,
-                        BLOCK_SIZE * (block_num + 1) - (j - 1)),
-                    '%G/%V/%u/%H:%M/')
-                week_end = week_start + timedelta(hours=WEEK_HOURS)
-                summary = '[scheduler] {} - DIV:{} on call'.format(
-                    clinician.name, division.name)
-                api.create_event(
-                    week_start.isoformat(),
-                    week_end.isoformat(),
-                    [clinician.email],
-                    summary
-                )
-
-    for clinician in sched.clinicians.values():
-        for week_num in clinician.weekends_assigned:
-            weekend_start = datetime.strptime(
-                '{0}/{1:02d}/5/17:00/'.format(
-                    year,
-                    week_num),
-                '%G/%V/%u/%H:%M/')
-            weekend_end = weekend_start + timedelta(hours=WEEKEND_HOURS)
-            summary = '[scheduler] {} - on call'.format(clinician.name)
+    divAssignments, weekendAssignments, _ = schedule
+    week_one = datetime.strptime('{0}/01/1/08:00/'.format(year), '%G/%V/%u/%H:%M/')
+
+    for division, assignments in divAssignments.items():
+        # one assignment per week
+        for week_idx, clin_name in enumerate(assignments):
+            week_start = week_one + timedelta(weeks=week_idx)
+            week_end = week_start + timedelta(hours=WEEK_HOURS)
+            summary = '[scheduler] {} - DIV:{} on call'.format(
+                clin_name, division)
             api.create_event(
-                weekend_start.isoformat(),
-                weekend_end.isoformat(),
-                [clinician.email],
+                week_start.isoformat(),
+                week_end.isoformat(),
+                [clin_data[clin_name]['email']],
                 summary
             )
 
+    for week_idx, clin_name in enumerate(weekendAssignments):
+        if clin_name is None: continue
+        # fri 5pm
+        weekend_start = week_one + timedelta(weeks=week_idx, days=4, hours=17 - 8)
+        weekend_end = weekend_start + timedelta(hours=WEEKEND_HOURS)
+        summary = '[scheduler] {} - on call'.format(clin_name)
+        api.create_event(
+            weekend_start.isoformat(),
+            weekend_end.isoformat(),
+            [clin_data[clin_name]['email']],
+            summary
+        )
+
+
+def write_to_excel(schedule, year):
+    """
+    Writes the schedule in the same layout as the yearly export of the GUI.
+    """
+    divAssignments, weekendAssignments, holidayMap = schedule
+    longWeekends = list(holidayMap.values())
+    divisions = list(divAssignments.keys())
 
-def write_to_excel(scheduler, year):
     wb = Workbook()
     sheet = wb.active
-    col_index = 0
-    divisions = list(scheduler.divisions.values())
-
-    for col_index in range(len(divisions)):
-        division = divisions[col_index]
-        sheet.cell(1, col_index + 1, division.name)
-        for row_index in range(len(division.assignments)):
-            clinician = division.assignments[row_index]
-            sheet.cell(2 * (row_index + 1), col_index + 1, clinician.name)
-            sheet.cell(2 * (row_index + 1) + 1, col_index + 1, clinician.name)
-
-    weekend_assignments = [
-        _ for clinician in scheduler.clinicians.values()
-        for _ in clinician.get_weekend_vars(
-            lambda x: x.get_value() == 1.0
-        )
-    ]
-    weekend_assignments.sort(key=lambda x: x.week_num)
-    col_index += 1
-    sheet.cell(1, col_index + 1, "Weekends")
-    for wa in weekend_assignments:
-        if wa.week_num in scheduler.long_weekends:
-            sheet.cell((wa.week_num + 1), col_index +
-                       1, wa.clinician.name + "****")
-        else:
-            sheet.cell((wa.week_num + 1), col_index + 1, wa.clinician.name)
+    for col, header in enumerate(['Week Number'] + divisions + ['Weekend']):
+        sheet.cell(row=1, column=col + 1, value=header)
+
+    for i, weekendClinician in enumerate(weekendAssignments):
+        weekNum = i + 1
+        sheet.cell(row=i + 2, column=1, value=str(weekNum) + '*' if weekNum in longWeekends else str(weekNum))
+        for col, division in enumerate(divisions):
+            sheet.cell(row=i + 2, column=col + 2, value=divAssignments[division][i])
+        sheet.cell(row=i + 2, column=len(divisions) + 2, value=weekendClinician)
 
     wb.save('{}-schedule.xlsx'.format(year))
 
 
+def all_day(evt, key):
+    return datetime.strptime(evt[key].get('date'), '%Y-%m-%d')
+
+
 def generate_schedule(args):
-    global NUM_BLOCKS
-    if args.blocks: NUM_BLOCKS = args.blocks
+    num_blocks = args.blocks or NUM_BLOCKS * args.years
+    with open(args.config, 'r') as f:
+        clin_data = json.load(f)
 
-    sched = scheduler.Scheduler(args.config, NUM_BLOCKS)
-    requests_off = []
-    long_weekends = set()
+    request_dict = defaultdict(list)
+    holidays = []
 
     if args.calendar:
         print("Retrieving {} calendar events from {}...".format(args.year, args.calendar))
-        api = scheduler.API(args.calendar, args)
+        api = ApiHelper(args.calendar)
         start_date = datetime(args.year, 1, 1)
-        end_date = start_date + timedelta(weeks=52)
+        end_date = start_date + timedelta(weeks=52 * args.years)
         events = api.get_events(
             start_date.isoformat() + 'Z', end_date.isoformat() + 'Z')
 
-        requests_off = list(filter(lambda x: '[request] ' in x['summary'], events))
-        # populate long weekends
-        lw_events = list(filter(lambda x: '[holiday] ' in x['summary'], events))
-        for evt in lw_events:
-            start = datetime.strptime(
-                evt['start'].get('date'),
-                '%Y-%m-%d'
-            )
-
-            # Fri statutory holidays are associated with their regular weeknum
-            # Mon statutory holidays are associated with their weeknum - 1
-            #   (i.e.: the previous weeknum)
-            if start.isoweekday() == 1:
-                long_weekends.add(start.isocalendar()[1] - 1)
-            elif start.isoweekday() == 5:
-                long_weekends.add(start.isocalendar()[1])
+        # all day events end on the following day
+        for evt in filter(lambda x: '[request] ' in x['summary'], events):
+            clin_name = evt['summary'].replace('[request] ', '').strip()
+            request_dict[clin_name].append(
+                (all_day(evt, 'start'), all_day(evt, 'end') - timedelta(days=1)))
+        holidays = [all_day(evt, 'start') for evt in events if '[holiday] ' in evt['summary']]
 
     print("Populating scheduler...")
-    sched.set_timeoff(requests_off)
-    sched.set_long_weekends(list(long_weekends))
-    sched.build_lp()
-    if sched.solve_lp():
+    # spreading assignments out is too strict for small departments, and
+    # time off is only a preference unless asked otherwise
+    constraints = [key for key in scheduler.Scheduler.CONSTRAINT_MAPPING
+                   if (args.spread or key not in ('spreadBlocks', 'spreadWeekends'))
+                   and (args.hard_timeoff or key != 'hardTimeOff')]
+    inputs = dict(
+        clin_data=clin_data, request_dict=request_dict,
+        holidays=holidays, constraints=constraints,
+        formulations={'preventConsecutiveBlocks': args.consecutive_blocks,
+                      'spreadBlocks': args.spread_rows, 'spreadWeekends': args.spread_rows}
+    )
+    budget = dict(threads=args.threads, time_limit=args.time_limit,
+                  gap_rel=args.gap_rel, gap_abs=args.gap_abs)
+    if args.years > 1:
+        sched = RollingHorizon(ConsoleLogger(), args.year, num_blocks, window_blocks=args.window,
+                               commit_blocks=args.commit, **inputs)
+    else:
+        sched = scheduler.Scheduler(ConsoleLogger(), num_blocks, **inputs)
+
+    if args.portfolio > 1 and args.years == 1:
+        schedule = sched.generate_portfolio(args.portfolio, solvers=(args.solver,),
+                                            compiled=args.compiled, elastic=args.elastic, **budget)
+    else:
+        # the windows of a horizon depend on each other's solutions, only
+        # single year schedules are cached
+        cache = None if args.no_cache or args.years > 1 else SolutionCache()
+        schedule = sched.generate(verbose=args.verbose, compiled=args.compiled, solver=args.solver,
+                                  decompose=args.decompose, two_stage=args.two_stage, elastic=args.elastic,
+                                  presolve=not args.no_presolve, cache=cache, **budget)
+    if schedule is not None:
         print("Found a feasible schedule!")
-        sched.assign_schedule()
-        write_to_excel(sched, args.year)
+        if not sched.optimal:
+            gap = 'unknown' if sched.gap is None else '{:.2%}'.format(sched.gap)
+            print("The solve budget ran out, this is the best schedule found (gap: {}).".format(gap))
+        violations = [_ for window in getattr(sched, 'windows', [sched]) for _ in window.violations]
+        if violations:
+            print("WARNING: The schedule violates {} constraint row(s):".format(len(violations)))
+            for violation in violations:
+                print("  {}".format(violation))
+        write_to_excel(schedule, args.year)
 
         if args.publish:
             print("Publishing {} schedule to {}...".format(args.year, args.calendar))
-            publish_sched(sched, api, args.year)
+            publish_sched(schedule, clin_data, api, args.year)
+    elif sched.infeasibility:
+        print("ERROR: The configuration cannot be scheduled, see above.")
     else:
         print("ERROR: Could not find a feasible schedule.")
         print("Try adjusting min/max values for clinicians.")
 
 
 def clear_schedule(args):
-    api = scheduler.API(args.calendar, args)
+    api = ApiHelper(args.calendar)
     start_date = datetime(args.year, 1, 1)
-    end_date = start_date + timedelta(weeks=52)
+    end_date = start_date + timedelta(weeks=52 * args.years)
 
     print("Clearing previously generated {} schedule from {}...".format(args.year, args.calendar))
     api.delete_events(start_date.isoformat() + 'Z',
@@ -153,15 +175,57 @@ if __name__ == '__main__':
     parser_gen.add_argument('--calendar', type=str, default=None)
     parser_gen.add_argument('--publish', action='store_true', default=False)
     parser_gen.add_argument('--blocks', type=int)
+    parser_gen.add_argument('--solver', choices=list(SOLVER_NAMES.keys()), default='cbc',
+                            help='solver backend, solvers other than cbc run in-process')
+    parser_gen.add_argument('--threads', type=int, default=0,
+                            help='number of solver threads, 0 uses the solver default (all cores for cp-sat)')
+    parser_gen.add_argument('--time-limit', type=float, default=None,
+                            help='stop after this many seconds and use the best schedule found')
+    parser_gen.add_argument('--gap-rel', type=float, default=None,
+                            help='stop once the best schedule is proven within this relative gap')
+    parser_gen.add_argument('--gap-abs', type=float, default=None,
+                            help='stop once the best schedule is proven within this absolute gap')
+    parser_gen.add_argument('--compiled', action='store_true', default=False,
+                            help='compile the model to arrays instead of building pulp expressions')
+    parser_gen.add_argument('--consecutive-blocks', default='tight',
+                            choices=scheduler.Scheduler.CONSTRAINT_FORMULATIONS['preventConsecutiveBlocks'],
+                            help='row formulation of the consecutive blocks constraint, compact also uses one weekend helper per block across divisions')
+    parser_gen.add_argument('--spread', action='store_true', default=False,
+                            help='spread out the blocks and weekends of each clinician')
+    parser_gen.add_argument('--spread-rows', default='full',
+                            choices=scheduler.Scheduler.CONSTRAINT_FORMULATIONS['spreadBlocks'],
+                            help='add all spread rows up front, or only the rows that solutions violate')
+    parser_gen.add_argument('--hard-timeoff', action='store_true', default=False,
+                            help='never assign blocks or weekends that clinicians requested off')
+    parser_gen.add_argument('--no-presolve', action='store_true', default=False,
+                            help='keep the variables and rows that the constraints fix to 0 in the model')
+    parser_gen.add_argument('--decompose', action='store_true', default=False,
+                            help='solve independent parts of the model in parallel processes')
+    parser_gen.add_argument('--two-stage', action='store_true', default=False,
+                            help='solve the blocks first, then the weekends with the blocks fixed')
+    parser_gen.add_argument('--elastic', action='store_true', default=False,
+                            help='always return a schedule, violating min/max, consecutive and balance rows at a penalty')
+    parser_gen.add_argument('--portfolio', type=int, default=1, metavar='N',
+                            help='race N differently seeded solver runs in parallel, the first optimal run wins (single year only)')
+    parser_gen.add_argument('--years', type=int, default=1,
+                            help='schedule this many years, in overlapping windows that carry the balance forward')
+    parser_gen.add_argument('--window', type=int, default=NUM_BLOCKS,
+                            help='number of blocks solved at a time when scheduling several years')
+    parser_gen.add_argument('--commit', type=int, default=NUM_BLOCKS // 2,
+                            help='number of blocks kept from each window when scheduling several years')
+    parser_gen.add_argument('--no-cache', action='store_true', default=False,
+                            help='always solve, instead of returning the stored schedule of the same inputs')
+    parser_gen.add_argument('--verbose', action='store_true', default=False)
     parser_gen.set_defaults(func=generate_schedule)
 
     parser_clear = subparsers.add_parser('clear', help='clear generated schedule')
     parser_clear.add_argument('calendar', type=str)
     parser_clear.add_argument('year', type=int)
+    parser_clear.add_argument('--years', type=int, default=1)
     parser_clear.set_defaults(func=clear_schedule)
 
     args = parser.parse_args()
 
-    start_time = time.clock()
+    start_time = time.perf_counter()
     args.func(args)
-    print('time = {} seconds'.format(time.clock() - start_time))
+    print('time = {} seconds'.format(time.perf_counter() - start_time))
@@ -286,6 +286,38 @@ class ExcelHelper:
         wb.close()
         return holidays
 
+    @staticmethod
+    def loadYearlySchedule(filename):
+        """
+        Loads a schedule saved by `saveYearlySchedule`. Returns the division
+        assignments, weekend assignments and long weekends (week numbers
+        marked with `*`), in the form returned by the scheduler.
+        """
+        wb = load_workbook(filename, read_only=True)
+        ws = wb.active
+        rows = [[cell.value for cell in row] for row in ws.iter_rows()]
+        wb.close()
+
+        if not rows or len(rows[0]) < 3 or rows[0][-1] != 'Weekend':
+            raise ExcelFormatException(file=filename, message='Incorrect format for yearly schedule file!')
+
+        divisions = rows[0][1:-1]
+        divAssignments = {div: [] for div in divisions}
+        weekendAssignments = []
+        longWeekends = []
+
+        for row in rows[1:]:
+            if row[0] is None: break
+
+            weekText = str(row[0])
+            if weekText.endswith('*'):
+                longWeekends.append(int(weekText[:-1]))
+            for div, clinName in zip(divisions, row[1:-1]):
+                divAssignments[div].append(clinName or '')
+            weekendAssignments.append(row[-1] or '')
+
+        return divAssignments, weekendAssignments, longWeekends
+
     @staticmethod
     def getColumn(table, col_idx):
         rows = table.rowCount()
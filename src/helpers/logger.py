@@ -17,4 +17,15 @@ class Logger:
         colour = LEVELCOLOURS[level]
 
         self.output.moveCursor(QTextCursor.End)
-        self.output.insertHtml('<span style="color:{2}">[{0}] {1}</span><br>'.format(timestamp, line, colour))
\ No newline at end of file
+        self.output.insertHtml('<span style="color:{2}">[{0}] {1}</span><br>'.format(timestamp, line, colour))
+
+
+class ConsoleLogger:
+    """
+    Logger with the same interface as `Logger` that writes to stdout, for
+    use outside of the GUI.
+    """
+
+    def write_line(self, line, level='INFO'):
+        timestamp = datetime.now().time().strftime('%H:%M:%S')
+        print('[{0}] {1}: {2}'.format(timestamp, level, line))
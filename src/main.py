@@ -1,4 +1,6 @@
 # pylint: disable=undefined-variable
+import multiprocessing
+
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
@@ -15,6 +17,8 @@ def main():
     app.exec_()
 
 if __name__ == '__main__':
+    # portfolio runs are started as processes of the frozen executable
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as ex:
@@ -0,0 +1,70 @@
+import asyncio
+
+from services.solvers import CancelToken, SolveCancelled
+
+
+class AsyncRun:
+    """
+    A scheduler run in an executor of the running asyncio event loop, see
+    `Scheduler.generate_async`. Awaiting the run returns its result, and
+    `async for` over it yields its `services.stats.Progress` events until
+    it ends. Events are queued, so they are not lost if the run is only
+    iterated over later; a run has a single consumer of its events.
+
+    `func` is called in the executor with a callable that receives the
+    progress events, and the `CancelToken` of the run.
+
+    Attributes:
+        cancel_token (CancelToken): The token that cancels the run
+    """
+
+    def __init__(self, func, executor=None):
+        loop = asyncio.get_running_loop()
+        self.cancel_token = CancelToken()
+        self._events = asyncio.Queue()
+
+        def progress(event):
+            loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+        self._future = loop.run_in_executor(executor, func, progress, self.cancel_token)
+        # the events of the run are delivered before its result, so the
+        # end of the events follows them
+        self._future.add_done_callback(lambda _: self._events.put_nowait(None))
+
+    def cancel(self):
+        """
+        Cancels the run: its solver process is terminated, and awaiting the
+        run raises `asyncio.CancelledError`.
+        """
+        self.cancel_token.cancel()
+
+    def done(self):
+        return self._future.done()
+
+    def __await__(self):
+        return self._result().__await__()
+
+    async def _result(self):
+        try:
+            return await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            # the task awaiting the run was cancelled. stop the run, and wait
+            # for it to unwind so that its scheduler can be used again
+            self.cancel()
+            await asyncio.wait([self._future])
+            if not self._future.cancelled():
+                self._future.exception()
+            raise
+        except SolveCancelled:
+            raise asyncio.CancelledError()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._events.get()
+        if event is None:
+            # keep the end for later iterations
+            self._events.put_nowait(None)
+            raise StopAsyncIteration
+        return event
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+
+# part of every cache key. bump it whenever a change of the model or of the
+# solvers may change the schedule found for the same inputs, so that the
+# schedules stored by earlier versions are no longer returned
+ENGINE_VERSION = 1
+
+
+def _encode(obj):
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError('Cannot encode {!r} in a cache key'.format(obj))
+
+
+def _merge_ranges(ranges):
+    """
+    Returns the time-off `ranges` (inclusive (start, end) pairs of days) as
+    a sorted list of disjoint ranges, merging the ranges that overlap or
+    touch.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _carry(carry):
+    if carry is None: return None
+    return dict(
+        num_weekends=carry.num_weekends, num_long_weekends=carry.num_long_weekends,
+        weekends=carry.weekends, long_weekends=carry.long_weekends,
+        blocks=sorted([clin, div, count] for (clin, div), count in carry.blocks.items()),
+        last_block=carry.last_block, last_weekend=carry.last_weekend
+    )
+
+
+def cache_key(inputs, options):
+    """
+    Returns the canonical hash of the scheduler `inputs` (the arguments of
+    `Scheduler.update`, by name) and of the `generate` `options` that
+    change the schedule found. Inputs that are equivalent for the program
+    hash the same: the time off of each clinician is sorted, time-off
+    requests are merged into disjoint ranges, and holidays and constraints
+    are sets. The order of the clinicians and of their divisions is kept,
+    as it decides which of several optimal schedules is found.
+    """
+    clinicians = [
+        [
+            clin_name,
+            sorted(set(clin_object.get('blocks_off', []))),
+            sorted(set(clin_object.get('weekends_off', []))),
+            [[div_name, _['min'], _['max']] for div_name, _ in clin_object['divisions'].items()]
+        ]
+        for clin_name, clin_object in inputs['clin_data'].items()
+    ]
+    requests = {
+        clin_name: _merge_ranges(ranges)
+        for clin_name, ranges in dict(inputs['request_dict']).items() if ranges
+    }
+    payload = dict(
+        engine=ENGINE_VERSION, num_blocks=inputs['num_blocks'], clinicians=clinicians, requests=requests,
+        holidays=sorted(set(inputs['holidays'])), constraints=set(inputs['constraints']),
+        formulations=inputs['formulations'], start=inputs['start'], carry=_carry(inputs['carry']),
+        options=options
+    )
+    text = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=_encode)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SolutionCache:
+    """
+    A disk-backed cache of solved schedules, keyed by `cache_key`. Each
+    entry is a JSON file in `directory`. Reading an entry marks it as used,
+    and storing an entry evicts the least recently used entries beyond
+    `max_entries`. Entries that cannot be read are dropped, as misses.
+
+    Attributes:
+        directory (str): The directory of the entries
+        max_entries (int): The number of entries kept
+        hits (int): The number of lookups that found an entry
+        misses (int): The number of lookups that did not
+    """
+
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.scheduler', 'cache')
+
+    def __init__(self, directory=None, max_entries=100):
+        self.directory = directory or SolutionCache.DEFAULT_DIRECTORY
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.json'.format(key))
+
+    def get(self, key):
+        """
+        Returns the entry stored under `key`, or `None`.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError):
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Stores the JSON serializable `entry` under `key`, then evicts the
+        least recently used entries.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # written aside and moved in place, so that readers never see a
+        # partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self._evict()
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        for path in self._entries():
+            self._remove(path)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, _) for _ in names if _.endswith('.json')]
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
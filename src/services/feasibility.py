@@ -0,0 +1,199 @@
+import itertools
+import math
+
+from constants import *
+
+
+def max_assignments(length, windows, off=()):
+    """
+    Returns the largest number of slots of a sequence of `length` slots that
+    can be assigned, where `windows` is a list of `(offsets, limit)` pairs:
+    for every position `i`, at most `limit` of the slots `i + offset` can be
+    assigned (e.g. `((0, 1), 1)` forbids consecutive assignments). The
+    slots in `off` (1-based) cannot be assigned.
+    """
+    span = max([max(offsets) for offsets, _ in windows] + [0])
+    # the best count per state, i.e. per assignment of the last `span` slots
+    best = {(): 0}
+    for pos in range(length):
+        following = {}
+        for state, count in best.items():
+            for bit in ((0,) if pos + 1 in off else (0, 1)):
+                slots = state + (bit,)
+                if any(pos >= max(offsets) and sum(slots[len(slots) - 1 - max(offsets) + _] for _ in offsets) > limit
+                       for offsets, limit in windows):
+                    continue
+                key = slots[-span:] if span else ()
+                following[key] = max(following.get(key, -1), count + bit)
+        best = following
+    return max(best.values())
+
+
+def balance_bounds(clinicians, num_items, past, counts):
+    """
+    Returns the (min, max) number of items per clinician name that balance
+    `num_items` items (plus `past` items before the schedule, of which each
+    clinician worked `counts`) over the clinicians.
+    """
+    total = num_items + past
+    bounds = {}
+    for clinician in clinicians:
+        done = counts.get(clinician.name, 0)
+        bounds[clinician.name] = (max(math.floor(total / len(clinicians)) - done, 0),
+                                  max(math.ceil(total / len(clinicians)) - done, 0))
+    return bounds
+
+
+def check_feasibility(num_blocks, divisions, clinicians, constraints, long_weekends=(), carry=None):
+    """
+    Looks for reasons why no schedule can satisfy the enabled
+    `constraints` (keys of `Scheduler.CONSTRAINT_MAPPING`), using counting
+    and flow bounds over the min/max blocks of each division
+    (`Division.bound_dict`), the number of blocks and the number of
+    blocks/weekends each clinician can work under the consecutive and spread
+    rules. `long_weekends` are the long weekend weeks of the schedule and
+    `carry` the optional `services.horizon.Carry` of the schedule.
+
+    With 'hardTimeOff', clinicians cannot work their blocks/weekends off.
+
+    Returns a list of explanations, empty if none was found. Only
+    infeasibility that follows from counting is detected: inputs that pass
+    may still have no schedule.
+    """
+    reasons = []
+    if not clinicians: return ['No clinicians are configured.']
+
+    num_weekends = num_blocks * BLOCK_SIZE
+    coverage = 'coverage' in constraints
+    min_max = 'minMaxBlocks' in constraints
+    hard = 'hardTimeOff' in constraints
+
+    def blocks_off(clinician):
+        return set(_ for _ in clinician.blocks_off if 1 <= _ <= num_blocks) if hard else set()
+
+    def weekends_off(clinician):
+        return set(_ for _ in clinician.weekends_off if 1 <= _ <= num_weekends) if hard else set()
+
+    # blocks a clinician can work, across all divisions. without the
+    # consecutive blocks rows, a clinician may work several divisions in the
+    # same block
+    rules = []
+    if 'preventConsecutiveBlocks' in constraints: rules.append(((0, 1), 1))
+    if 'spreadBlocks' in constraints: rules.append(((0, 2, 4), 2))
+    single = 'preventConsecutiveBlocks' in constraints and num_blocks > 1
+    block_cap = max_assignments(num_blocks, rules) if single else None
+    rule_str = ' under the {} block rules'.format(
+        'consecutive/spread' if 'spreadBlocks' in constraints else 'consecutive') if single else ''
+
+    def block_bound(clinician, division):
+        # most blocks of `division` that `clinician` can work
+        bound = num_blocks if block_cap is None else block_cap
+        if min_max: bound = min(bound, division.bound_dict[clinician.name][1])
+        return bound
+
+    if min_max:
+        for division in divisions:
+            for clinician in division.clinicians:
+                min_, max_ = division.bound_dict[clinician.name]
+                if min_ > max_:
+                    reasons.append('{}: the minimum blocks of division {} ({}) are above the maximum ({}).'.format(
+                        clinician.name, division.name, min_, max_))
+
+        for clinician in clinicians:
+            mins = sum(division.bound_dict[clinician.name][0] for division in divisions
+                       if clinician.name in division.bound_dict)
+            off = blocks_off(clinician)
+            if block_cap is None:
+                cap = (num_blocks - len(off)) * sum(clinician.name in division.bound_dict for division in divisions)
+            else:
+                cap = max_assignments(num_blocks, rules, off) if off else block_cap
+            if mins > cap:
+                reasons.append('{}: the minimum blocks add up to {}, but only {} of the {} blocks can be worked{}{}.'.format(
+                    clinician.name, mins, cap, num_blocks, rule_str, ' around their blocks off' if off else ''))
+
+    if coverage:
+        if min_max:
+            for division in divisions:
+                mins = sum(division.bound_dict[_.name][0] for _ in division.clinicians)
+                if mins > num_blocks:
+                    reasons.append('Division {}: the minimum blocks of its clinicians add up to {}, more than the {} blocks.'.format(
+                        division.name, mins, num_blocks))
+
+        # every division needs one clinician per block: for each set of
+        # divisions, their clinicians must be able to cover all of their
+        # blocks (Hall's condition of the clinician -> division flow)
+        violated = []
+        for size in range(1, len(divisions) + 1):
+            for subset in itertools.combinations(divisions, size):
+                names = set(_.name for _ in subset)
+                if any(_ <= names for _ in violated): continue
+
+                supply = 0
+                for clinician in clinicians:
+                    bounds = [block_bound(clinician, _) for _ in subset if clinician.name in _.bound_dict]
+                    if not bounds: continue
+                    supply += sum(bounds) if block_cap is None else min(block_cap, sum(bounds))
+                demand = size * num_blocks
+                if supply < demand:
+                    violated.append(names)
+                    if size == 1:
+                        reasons.append('Division {}: its {} clinician(s) can cover at most {} of the {} blocks{}.'.format(
+                            subset[0].name, len(subset[0].clinicians), supply, num_blocks, rule_str))
+                    else:
+                        reasons.append('Divisions {}: their clinicians can cover at most {} of their {} blocks{}.'.format(
+                            ', '.join(_.name for _ in subset), supply, demand, rule_str))
+
+        if hard:
+            for division in divisions:
+                blocks = [b for b in range(1, num_blocks + 1)
+                          if all(b in blocks_off(_) for _ in division.clinicians)]
+                if blocks:
+                    reasons.append('Division {}: all of its clinicians are off in block(s) {}.'.format(
+                        division.name, ', '.join(str(_) for _ in blocks)))
+
+    # weekends a clinician can work
+    rules = []
+    if 'preventConsecutiveWeekends' in constraints: rules.append(((0, 1), 1))
+    if 'spreadWeekends' in constraints: rules.append(((0, 1, 2, 3), 1))
+    weekend_cap = max_assignments(num_weekends, rules)
+    rule_str = ' under the {} weekend rules'.format('/'.join(
+        name for key, name in (('preventConsecutiveWeekends', 'consecutive'), ('spreadWeekends', 'spread'))
+        if key in constraints)) if rules else ''
+
+    if coverage and weekend_cap * len(clinicians) < num_weekends:
+        reasons.append('The {} clinician(s) can cover at most {} of the {} weekends{}.'.format(
+            len(clinicians), weekend_cap * len(clinicians), num_weekends, rule_str))
+    if coverage and hard:
+        weeks = [w for w in range(1, num_weekends + 1) if all(w in weekends_off(_) for _ in clinicians)]
+        if weeks:
+            reasons.append('All clinicians are off on weekend(s) {}.'.format(', '.join(str(_) for _ in weeks)))
+
+    if 'balancedWeekends' in constraints:
+        bounds = balance_bounds(
+            clinicians, num_weekends, carry.num_weekends if carry else 0, carry.weekends if carry else {})
+        for clinician in clinicians:
+            min_ = bounds[clinician.name][0]
+            off = weekends_off(clinician)
+            cap = max_assignments(num_weekends, rules, off) if off else weekend_cap
+            if min_ > cap:
+                reasons.append('{}: balancing the weekends takes at least {} weekends, but only {} can be worked{}{}.'.format(
+                    clinician.name, min_, cap, rule_str, ' around their weekends off' if off else ''))
+        if coverage and sum(_[1] for _ in bounds.values()) < num_weekends:
+            reasons.append('Balancing the weekends leaves at most {} of the {} weekends covered.'.format(
+                sum(_[1] for _ in bounds.values()), num_weekends))
+
+    long_weekends = set(_ for _ in long_weekends if 1 <= _ <= num_weekends)
+    if 'balancedLongWeekends' in constraints and long_weekends:
+        bounds = balance_bounds(
+            clinicians, len(long_weekends), carry.num_long_weekends if carry else 0,
+            carry.long_weekends if carry else {})
+        for clinician in clinicians:
+            min_ = bounds[clinician.name][0]
+            if min_ > len(long_weekends):
+                reasons.append('{}: balancing the long weekends takes at least {}, but there are only {}.'.format(
+                    clinician.name, min_, len(long_weekends)))
+        if coverage and sum(_[1] for _ in bounds.values()) < len(long_weekends):
+            reasons.append('Balancing the long weekends leaves at most {} of the {} long weekends covered.'.format(
+                sum(_[1] for _ in bounds.values()), len(long_weekends)))
+
+    return reasons
@@ -0,0 +1,206 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from constants import *
+from services.scheduler import Scheduler
+
+
+class Carry:
+    """
+    The assignments committed before the schedule of a `Scheduler`, which
+    its balance and consecutive assignment constraints take into account.
+
+    Attributes:
+        num_weekends (int): The number of weekends before the schedule
+        num_long_weekends (int): The number of long weekends before the schedule
+        weekends (dict): The number of weekends worked by each clinician
+        long_weekends (dict): The number of long weekends worked by each clinician
+        blocks (dict): The number of blocks worked by each clinician, keyed
+            by (clinician, division) name pairs
+        last_block (set): The clinicians who worked the last block before
+            the schedule
+        last_weekend (set): The clinicians who worked the last weekend before
+            the schedule
+    """
+
+    def __init__(self, num_weekends=0, num_long_weekends=0, weekends={}, long_weekends={}, blocks={},
+                 last_block=(), last_weekend=()):
+        self.num_weekends = num_weekends
+        self.num_long_weekends = num_long_weekends
+        self.weekends = dict(weekends)
+        self.long_weekends = dict(long_weekends)
+        self.blocks = dict(blocks)
+        self.last_block = set(last_block)
+        self.last_weekend = set(last_weekend)
+
+    def advance(self, scheduler, num_blocks):
+        """
+        Returns the carry after the first `num_blocks` blocks of the schedule
+        solved by `scheduler`, which started after this carry.
+        """
+        num_weeks = num_blocks * BLOCK_SIZE
+        long_weeks = set(w for w in scheduler.long_weekends if 1 <= w <= num_weeks)
+        carry = Carry(
+            self.num_weekends + num_weeks, self.num_long_weekends + len(long_weeks),
+            self.weekends, self.long_weekends, self.blocks
+        )
+
+        blocks, weekends = scheduler.get_solution()
+        layout = scheduler.layout
+        for clinician in scheduler.clinicians.values():
+            name = clinician.name
+            c = layout.clinician_pos(name)
+            for week_num in (np.flatnonzero(weekends[c, :num_weeks]) + 1).tolist():
+                carry.weekends[name] = carry.weekends.get(name, 0) + 1
+                if week_num in long_weeks:
+                    carry.long_weekends[name] = carry.long_weekends.get(name, 0) + 1
+                if week_num == num_weeks:
+                    carry.last_weekend.add(name)
+
+            counts = np.count_nonzero(blocks[c, :, :num_blocks], axis=1)
+            for d in np.flatnonzero(counts).tolist():
+                key = (name, layout.divisions[d])
+                carry.blocks[key] = carry.blocks.get(key, 0) + int(counts[d])
+            if blocks[c, :, num_blocks - 1].any():
+                carry.last_block.add(name)
+
+        return carry
+
+
+class RollingHorizon:
+    """
+    Schedules a horizon of several years as a sequence of overlapping
+    windows. Each window is solved as a `Scheduler` program of
+    `window_blocks` blocks, and only its first `commit_blocks` blocks are
+    kept; the next window starts right after them. The weekends, long
+    weekends and blocks committed so far are carried into the next window
+    (see `Carry`), so that the balance constraints hold over the whole
+    horizon and no consecutive blocks or weekends are assigned across
+    window boundaries. The last window keeps all of its blocks.
+
+    The min/max blocks of each clinician are given per year (`NUM_BLOCKS`
+    blocks, as in a single year schedule), and are pro-rated to the end of
+    each window.
+
+    Weeks are counted from the Monday of ISO week 1 of `year`, so dates in
+    later years map past week 52 instead of wrapping around.
+
+    Attributes:
+        start (date): The Monday of the first week of the horizon
+        num_blocks (int): The number of blocks of the horizon
+        window_blocks (int): The number of blocks of each window
+        commit_blocks (int): The number of blocks kept from each window
+        windows (list): The `Scheduler` of each window solved by the last
+            call to `generate`
+        optimal (bool): Whether every window was solved to optimality
+        gap (float): The largest proven relative gap of the windows, or
+            `None` if the gap of a window is unknown
+        infeasibility (list): The reasons why the window that failed cannot
+            be scheduled, see `Scheduler.check_feasibility`
+    """
+
+    def __init__(self, logger, year, num_blocks, clin_data={}, request_dict=[], holidays=[], constraints=[],
+                 formulations={}, window_blocks=NUM_BLOCKS, commit_blocks=NUM_BLOCKS // 2):
+        if not 0 < commit_blocks <= window_blocks:
+            raise ValueError('The committed blocks must be between 1 and the window size ({})'.format(window_blocks))
+
+        jan4 = date(year, 1, 4)
+        self.start = jan4 - timedelta(days=jan4.isoweekday() - 1)
+        self.num_blocks = num_blocks
+        self.window_blocks = window_blocks
+        self.commit_blocks = commit_blocks
+        self.windows = []
+        self.optimal = False
+        self.gap = None
+        self.infeasibility = []
+
+        self._logger = logger
+        self._inputs = dict(
+            request_dict=request_dict, holidays=holidays, constraints=constraints, formulations=formulations
+        )
+        self._clin_data = clin_data
+
+    def generate(self, **kwargs):
+        """
+        Solves the windows of the horizon in turn, passing `kwargs` to
+        `Scheduler.generate`. Each window is warm started with the blocks
+        and weekends of the previous window that were not committed.
+
+        Returns the schedule of the whole horizon, in the form returned by
+        `Scheduler.generate`, or `None` if a window has no feasible schedule.
+        """
+        carry = Carry()
+        div_assignments, weekend_assignments, holiday_map = {}, [], None
+        initial = None
+        self.windows = []
+        self.optimal = True
+        self.gap = 0.0
+        self.infeasibility = []
+
+        offset = 0
+        while offset < self.num_blocks:
+            num_blocks = min(self.window_blocks, self.num_blocks - offset)
+            last = offset + num_blocks == self.num_blocks
+            commit = num_blocks if last else self.commit_blocks
+
+            scheduler = Scheduler(
+                self._logger, num_blocks, clin_data=self._window_data(offset, offset + num_blocks, carry),
+                start=self.start + timedelta(weeks=offset * BLOCK_SIZE), carry=carry, **self._inputs
+            )
+            self.windows.append(scheduler)
+            schedule = scheduler.generate(initial=initial, **kwargs)
+            if schedule is None:
+                self._logger.write_line('Could not find a feasible schedule for blocks {} to {} of the horizon.'.format(
+                    offset + 1, offset + num_blocks), level='ERROR')
+                self.optimal = False
+                self.gap = None
+                self.infeasibility = scheduler.infeasibility
+                return None
+            self.optimal = self.optimal and scheduler.optimal
+            self.gap = None if self.gap is None or scheduler.gap is None else max(self.gap, scheduler.gap)
+
+            # the first window starts with the horizon, so its holidays are
+            # already mapped to the weeks of the horizon
+            if holiday_map is None:
+                holiday_map = schedule[2]
+
+            num_weeks = commit * BLOCK_SIZE
+            for div_name, assignments in schedule[0].items():
+                div_assignments.setdefault(div_name, []).extend(assignments[:num_weeks])
+            weekend_assignments.extend(schedule[1][:num_weeks])
+
+            initial = (
+                {div_name: assignments[num_weeks:] for div_name, assignments in schedule[0].items()},
+                schedule[1][num_weeks:], {}
+            )
+            carry = carry.advance(scheduler, commit)
+            offset += commit
+
+        return (div_assignments, weekend_assignments, holiday_map)
+
+    def _window_data(self, offset, end_block, carry):
+        """
+        Returns the clinician data of the window of blocks `offset` + 1 to
+        `end_block` of the horizon, with the yearly min/max blocks pro-rated
+        to the end of the window and reduced by the blocks already carried.
+        Blocks/weekends off of the configuration are horizon numbers, and are
+        shifted to the window.
+        """
+        data = {}
+        for clin_name, clin_object in self._clin_data.items():
+            clin_object = dict(clin_object)
+            if 'blocks_off' in clin_object:
+                clin_object['blocks_off'] = [_ - offset for _ in clin_object['blocks_off']]
+            if 'weekends_off' in clin_object:
+                clin_object['weekends_off'] = [_ - offset * BLOCK_SIZE for _ in clin_object['weekends_off']]
+
+            divisions = {}
+            for div_name, div_object in clin_object['divisions'].items():
+                done = carry.blocks.get((clin_name, div_name), 0)
+                max_ = max(math.ceil(div_object['max'] * end_block / NUM_BLOCKS) - done, 0)
+                min_ = min(max(math.floor(div_object['min'] * end_block / NUM_BLOCKS) - done, 0), max_)
+                divisions[div_name] = {'min': min_, 'max': max_}
+            data[clin_name] = dict(clin_object, divisions=divisions)
+        return data
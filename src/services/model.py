@@ -0,0 +1,401 @@
+import numpy as np
+import pulp
+
+
+class ModelLayout:
+    """
+    Array-backed layout of the scheduling variables. Every LP variable is
+    a column of the model, identified by its integer index.
+
+    Attributes:
+        clinicians (list): The clinician names, in model order
+        divisions (list): The division names, in model order
+        num_blocks (int): The number of blocks in the schedule
+        num_weekends (int): The number of weekends in the schedule
+        block_index (numpy.ndarray): A clinician x division x block array of
+            column indices, -1 where the clinician does not cover the division
+            and `REMOVED` where presolve removed the column
+        weekend_index (numpy.ndarray): A clinician x week array of column
+            indices, `REMOVED` where presolve removed the column
+        adjacency_index (numpy.ndarray): A clinician x division x block array of
+            column indices of the block-adjacent weekend helpers, -1 if none
+            and `REMOVED` where presolve removed the helper. With compact
+            helpers, which cover all divisions, the division axis has length 1
+        min_blocks (numpy.ndarray): A clinician x division array of the minimum
+            number of blocks of each assignment
+        max_blocks (numpy.ndarray): A clinician x division array of the maximum
+            number of blocks of each assignment
+        num_cols (int): The number of columns allocated so far
+    """
+    # the index of a column removed by presolve. like -1, it is skipped by
+    # `RowBlock.from_padded`, which counts the rows it empties
+    REMOVED = -2
+
+    def __init__(self, clinicians, divisions, num_blocks, num_weekends):
+        self.clinicians = list(clinicians)
+        self.divisions = list(divisions)
+        self.num_blocks = num_blocks
+        self.num_weekends = num_weekends
+
+        shape = (len(self.clinicians), len(self.divisions), num_blocks)
+        self.block_index = np.full(shape, -1, dtype=np.int64)
+        self.adjacency_index = np.full(shape, -1, dtype=np.int64)
+        self.weekend_index = np.full(
+            (len(self.clinicians), num_weekends), -1, dtype=np.int64)
+
+        self.min_blocks = np.zeros(shape[:2], dtype=np.int64)
+        self.max_blocks = np.zeros(shape[:2], dtype=np.int64)
+
+        self.num_cols = 0
+        self._clin_pos = {name: i for i, name in enumerate(self.clinicians)}
+        self._div_pos = {name: i for i, name in enumerate(self.divisions)}
+
+    def clinician_pos(self, name):
+        return self._clin_pos[name]
+
+    def division_pos(self, name):
+        return self._div_pos[name]
+
+    def new_column(self):
+        """
+        Allocates a new column and returns its index.
+        """
+        self.num_cols += 1
+        return self.num_cols - 1
+
+    def helper_blocks(self, values):
+        """
+        Returns the value of the block(s) of each block-adjacent weekend
+        helper for a vector of column `values`, in the shape of
+        `adjacency_index`: summed over the divisions for compact helpers.
+        """
+        blocks = np.where(self.block_index >= 0, values[self.block_index], 0)
+        if self.adjacency_index.shape[1] != blocks.shape[1]:
+            blocks = blocks.sum(axis=1, keepdims=True)
+        return blocks
+
+    def coverage_mask(self):
+        """
+        Returns a clinician x division boolean array, true where the
+        clinician covers the division.
+        """
+        return self.block_index[:, :, 0] != -1
+
+
+class RowBlock:
+    """
+    A family of linear rows stored in compressed sparse row (CSR) form.
+
+    Attributes:
+        indptr (numpy.ndarray): Row `i` spans `indices[indptr[i]:indptr[i + 1]]`
+        indices (numpy.ndarray): The column index of each nonzero
+        data (numpy.ndarray): The coefficient of each nonzero
+        sense (numpy.ndarray): The sense of each row, one of `pulp.LpConstraintLE`,
+            `pulp.LpConstraintEQ` or `pulp.LpConstraintGE`
+        rhs (numpy.ndarray): The right-hand side of each row
+        num_removed (int): The number of rows left out because presolve
+            removed all of their columns
+        nums (numpy.ndarray): The block or week number of each row, or
+            `None` if the rows are not tied to one
+    """
+
+    def __init__(self, indptr, indices, data, sense, rhs, num_removed=0, nums=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.sense = sense
+        self.rhs = rhs
+        self.num_removed = num_removed
+        self.nums = nums
+
+    def __len__(self):
+        return len(self.rhs)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @classmethod
+    def from_padded(cls, cols, sense, rhs, coefs=1.0, nums=None):
+        """
+        Builds a row block from a 2D array of column indices, one row per
+        constraint, padded with -1. `coefs` and `rhs` are broadcast against
+        the shape of `cols` and its number of rows, respectively. `nums` are
+        the optional block or week numbers of the rows, broadcast against
+        all but the last dimension of `cols`. Rows without any column are
+        dropped if 0 satisfies them, and counted in `num_removed` if presolve
+        removed their columns (see `ModelLayout.REMOVED`). The others are
+        kept empty, so that they make the program infeasible.
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        if nums is not None:
+            nums = np.broadcast_to(np.asarray(nums, dtype=np.int64), cols.shape[:-1]).reshape(-1)
+        cols = cols.reshape(-1, cols.shape[-1]) if cols.size else cols.reshape(0, 1)
+        mask = cols >= 0
+        counts = mask.sum(axis=1)
+        data = np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape)
+        rhs = np.broadcast_to(np.asarray(rhs, dtype=float), (cols.shape[0],))
+
+        satisfied = {pulp.LpConstraintLE: rhs >= 0, pulp.LpConstraintEQ: rhs == 0, pulp.LpConstraintGE: rhs <= 0}
+        keep = (counts > 0) | ~satisfied[sense]
+        num_removed = int(np.count_nonzero(~keep & (cols == ModelLayout.REMOVED).any(axis=1)))
+
+        mask &= keep[:, None]
+        indptr = np.concatenate(([0], np.cumsum(counts[keep])))
+        return cls(
+            indptr, cols[mask], data[mask],
+            np.full(int(keep.sum()), sense, dtype=np.int64), rhs[keep].copy(), num_removed,
+            None if nums is None else nums[keep]
+        )
+
+    @classmethod
+    def concat(cls, blocks):
+        """
+        Stacks the rows of the supplied row blocks into a single block.
+        """
+        num_removed = sum(_.num_removed for _ in blocks)
+        blocks = [_ for _ in blocks if len(_)]
+        if not blocks:
+            return cls.empty(num_removed)
+
+        nums = None
+        if all(_.nums is not None for _ in blocks):
+            nums = np.concatenate([_.nums for _ in blocks])
+        offsets = np.cumsum([0] + [_.nnz for _ in blocks[:-1]])
+        indptr = np.concatenate(
+            [[0]] + [_.indptr[1:] + offset for _, offset in zip(blocks, offsets)])
+        return cls(
+            indptr,
+            np.concatenate([_.indices for _ in blocks]),
+            np.concatenate([_.data for _ in blocks]),
+            np.concatenate([_.sense for _ in blocks]),
+            np.concatenate([_.rhs for _ in blocks]), num_removed, nums
+        )
+
+    @classmethod
+    def empty(cls, num_removed=0):
+        return cls(
+            np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64),
+            np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0), num_removed
+        )
+
+    def to_pulp(self, lp_vars):
+        """
+        Returns the rows of this block as `pulp.LpConstraint`s over the
+        supplied list of `pulp` variables, indexed by column.
+        """
+        indptr, indices, data = self.indptr.tolist(), self.indices.tolist(), self.data.tolist()
+        constraints = []
+        for i in range(len(self)):
+            start, end = indptr[i], indptr[i + 1]
+            expr = pulp.LpAffineExpression(
+                (lp_vars[j], a) for j, a in zip(indices[start:end], data[start:end]))
+            constraints.append(
+                pulp.LpConstraint(expr, int(self.sense[i]), rhs=float(self.rhs[i])))
+        return constraints
+
+
+class ModelMatrix:
+    """
+    A compiled integer program: the constraint matrix in CSR form together
+    with the objective vector, independent of any `pulp` expressions.
+
+    Attributes:
+        rows (RowBlock): All constraint rows of the program
+        objective (numpy.ndarray): The objective coefficient of each column
+        maximize (bool): Whether the objective is maximized
+        col_names (list): The name of each column, or `None` to use generic names
+        upper (numpy.ndarray): The upper bound of each (non-negative integer)
+            column, or `None` if all columns are binary
+    """
+
+    # characters that are not allowed in LP/MPS names (same as `pulp`)
+    ILLEGAL_CHARS = '-+[] ->/'
+
+    def __init__(self, rows, objective, maximize=True, col_names=None, upper=None):
+        self.rows = rows
+        self.objective = np.asarray(objective, dtype=float)
+        self.maximize = maximize
+        self.col_names = col_names
+        self.upper = upper
+
+    def col_upper(self):
+        """
+        Returns the upper bound of each column.
+        """
+        return np.ones(self.num_cols) if self.upper is None else np.asarray(self.upper, dtype=float)
+
+    @property
+    def num_rows(self):
+        return len(self.rows)
+
+    @property
+    def num_cols(self):
+        return len(self.objective)
+
+    @property
+    def nnz(self):
+        return self.rows.nnz
+
+    def _names(self, rename):
+        if rename or self.col_names is None:
+            col_names = ['C{:07d}'.format(j) for j in range(self.num_cols)]
+        else:
+            table = str.maketrans(ModelMatrix.ILLEGAL_CHARS, '_' * len(ModelMatrix.ILLEGAL_CHARS))
+            col_names = [_.translate(table) for _ in self.col_names]
+        row_names = ['_C{}'.format(i + 1) for i in range(self.num_rows)]
+        return col_names, row_names
+
+    def components(self):
+        """
+        Returns the column indices of each independent part of the program,
+        i.e. of each connected component of the graph in which columns are
+        adjacent if they share a row. Columns without any row are collected
+        in one last part.
+        """
+        indptr, indices = self.rows.indptr, self.rows.indices
+        counts = np.diff(indptr)
+        starts = indptr[:-1][counts > 0]
+
+        # propagate the smallest column index of each row to all of its
+        # columns, with pointer jumping, until every row has a single label
+        labels = np.arange(self.num_cols)
+        while len(starts):
+            row_min = np.minimum.reduceat(labels[indices], starts)
+            new = labels.copy()
+            np.minimum.at(new, indices, np.repeat(row_min, counts[counts > 0]))
+            new = new[new]
+            if np.array_equal(new, labels): break
+            labels = new
+
+        labels[np.bincount(indices, minlength=self.num_cols) == 0] = self.num_cols
+        order = np.argsort(labels, kind='stable')
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        return np.split(order, bounds) if self.num_cols else []
+
+    def submatrix(self, cols):
+        """
+        Returns the program restricted to the supplied columns, with the
+        rows that only involve these columns.
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        remap = np.full(self.num_cols, -1, dtype=np.int64)
+        remap[cols] = np.arange(len(cols))
+
+        rows = self.rows
+        counts = np.diff(rows.indptr)
+        inside = remap[rows.indices] >= 0
+        selected = counts > 0
+        selected[selected] = np.logical_and.reduceat(inside, rows.indptr[:-1][selected])
+        entries = np.repeat(selected, counts)
+
+        block = RowBlock(
+            np.concatenate(([0], np.cumsum(counts[selected]))),
+            remap[rows.indices[entries]], rows.data[entries],
+            rows.sense[selected], rows.rhs[selected]
+        )
+        col_names = [self.col_names[j] for j in cols.tolist()] if self.col_names is not None else None
+        upper = self.upper[cols] if self.upper is not None else None
+        return ModelMatrix(block, self.objective[cols], self.maximize, col_names, upper)
+
+    def to_csc(self):
+        """
+        Returns the constraint matrix in compressed sparse column form as
+        (indptr, row indices, data).
+        """
+        row_of = np.repeat(np.arange(self.num_rows), np.diff(self.rows.indptr))
+        order = np.argsort(self.rows.indices, kind='stable')
+        counts = np.bincount(self.rows.indices, minlength=self.num_cols)
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return indptr, row_of[order], self.rows.data[order]
+
+    def write_mps(self, path, rename=False):
+        """
+        Streams the program to `path` in (free) MPS format, using the same
+        layout as `pulp.LpProblem.writeMPS`. Returns the column names used.
+        """
+        col_names, row_names = self._names(rename)
+        mps_sense = {pulp.LpConstraintLE: 'L', pulp.LpConstraintEQ: 'E', pulp.LpConstraintGE: 'G'}
+        indptr, row_idx, data = self.to_csc()
+
+        with open(path, 'w') as f:
+            f.write('*SENSE:{}\n'.format('Maximize' if self.maximize else 'Minimize'))
+            f.write('NAME          scheduler\n')
+            f.write('ROWS\n')
+            f.write(' N  OBJ\n')
+            for name, sense in zip(row_names, self.rows.sense.tolist()):
+                f.write(' {}  {}\n'.format(mps_sense[sense], name))
+
+            f.write('COLUMNS\n')
+            f.write("    MARK      'MARKER'                 'INTORG'\n")
+            for j, name in enumerate(col_names):
+                start, end = indptr[j], indptr[j + 1]
+                if self.objective[j] != 0:
+                    f.write('    {}  OBJ  {: .12e}\n'.format(name, self.objective[j]))
+                f.write(''.join(
+                    '    {}  {}  {: .12e}\n'.format(name, row_names[i], a)
+                    for i, a in zip(row_idx[start:end].tolist(), data[start:end].tolist())
+                ))
+            f.write("    MARK      'MARKER'                 'INTEND'\n")
+
+            f.write('RHS\n')
+            for name, rhs in zip(row_names, self.rows.rhs.tolist()):
+                f.write('    RHS       {}  {: .12e}\n'.format(name, rhs))
+
+            f.write('BOUNDS\n')
+            for name, upper in zip(col_names, self.col_upper().tolist()):
+                if upper == 1:
+                    f.write(' BV BND       {}\n'.format(name))
+                else:
+                    f.write(' UP BND       {}  {: .12e}\n'.format(name, upper))
+            f.write('ENDATA\n')
+
+        return col_names
+
+    def write_lp(self, path, rename=False):
+        """
+        Streams the program to `path` in CPLEX LP format. Returns the column
+        names used.
+        """
+        col_names, row_names = self._names(rename)
+        lp_sense = {pulp.LpConstraintLE: '<=', pulp.LpConstraintEQ: '=', pulp.LpConstraintGE: '>='}
+
+        def terms(cols, coefs):
+            terms = [
+                '{} {:.12g} {}'.format('-' if a < 0 else '+', abs(a), col_names[j])
+                for j, a in zip(cols, coefs)
+            ]
+            # keep lines short, some readers limit the line length
+            return '\n '.join(' '.join(terms[i:i + 4]) for i in range(0, len(terms), 4))
+
+        with open(path, 'w') as f:
+            f.write('\\* scheduler *\\\n')
+            f.write('Maximize\n' if self.maximize else 'Minimize\n')
+            nonzero = np.flatnonzero(self.objective)
+            f.write('OBJ: {}\n'.format(terms(nonzero.tolist(), self.objective[nonzero].tolist())))
+
+            f.write('Subject To\n')
+            indptr = self.rows.indptr.tolist()
+            indices, data = self.rows.indices.tolist(), self.rows.data.tolist()
+            for i, name in enumerate(row_names):
+                start, end = indptr[i], indptr[i + 1]
+                f.write('{}: {} {} {:.12g}\n'.format(
+                    name, terms(indices[start:end], data[start:end]),
+                    lp_sense[int(self.rows.sense[i])], self.rows.rhs[i]
+                ))
+
+            binary = self.col_upper() == 1
+            if not binary.all():
+                f.write('Bounds\n')
+                for j in np.flatnonzero(~binary).tolist():
+                    f.write('{} <= {:.12g}\n'.format(col_names[j], self.upper[j]))
+                f.write('Generals\n')
+                for j in np.flatnonzero(~binary).tolist():
+                    f.write('{}\n'.format(col_names[j]))
+
+            f.write('Binaries\n')
+            for j in np.flatnonzero(binary).tolist():
+                f.write('{}\n'.format(col_names[j]))
+            f.write('End\n')
+
+        return col_names
@@ -0,0 +1,199 @@
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import time
+
+
+class PortfolioRun:
+    """
+    The configuration of a single run of a portfolio.
+
+    Attributes:
+        index (int): The position of the run in the portfolio
+        seed (int): The seed of the clinician shuffle and of the solver
+        shuffle (bool): Whether the clinicians are shuffled before the model
+            is built (the first run keeps the configured order)
+        solver (str): The solver key, see `services.solvers.SOLVER_NAMES`
+    """
+
+    def __init__(self, index, seed, shuffle, solver):
+        self.index = index
+        self.seed = seed
+        self.shuffle = shuffle
+        self.solver = solver
+
+    def __str__(self):
+        return 'run {} ({}, seed {}{})'.format(
+            self.index, self.solver, self.seed, ', shuffled' if self.shuffle else '')
+
+
+class PortfolioResult:
+    """
+    The outcome of a single run of a portfolio.
+
+    Attributes:
+        run (PortfolioRun): The configuration of the run
+        schedule (tuple): The schedule, in the form returned by
+            `Scheduler.generate`, or `None` if no schedule was found
+        optimal (bool): Whether the schedule is proven optimal (within the
+            target gap)
+        gap (float): The proven relative gap of the schedule, or `None`
+        objective (float): The objective value of the schedule
+        violations (list): The `Violation`s of the schedule in elastic mode
+        time (float): The wall time of the run, in seconds
+        error (str): The error raised by the run, if any
+    """
+
+    def __init__(self, run, schedule=None, optimal=False, gap=None, objective=None, violations=(), time=0.0,
+                 error=None):
+        self.run = run
+        self.schedule = schedule
+        self.optimal = optimal
+        self.gap = gap
+        self.objective = objective
+        self.violations = list(violations)
+        self.time = time
+        self.error = error
+
+
+class _NullLogger:
+    def write_line(self, line, level='INFO'):
+        pass
+
+
+def _start_session():
+    # own process group, so the solver processes can be killed with the run
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # unwind on termination, so temporary solver files are removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+
+def _solve_run(results, run, inputs, compiled, budget):
+    """
+    Builds and solves the scheduling problem for one run of the portfolio,
+    in its own process.
+    """
+    from services.scheduler import Scheduler
+
+    _start_session()
+    start = time.time()
+    try:
+        scheduler = Scheduler(_NullLogger(), **inputs)
+        schedule = scheduler.generate(
+            shuffle=run.shuffle, compiled=compiled, solver=run.solver, seed=run.seed, **budget)
+        results.put(PortfolioResult(
+            run, schedule, scheduler.optimal, scheduler.gap,
+            scheduler.objective_value if schedule is not None else None, scheduler.violations,
+            time.time() - start
+        ))
+    except Exception as ex:
+        results.put(PortfolioResult(run, time=time.time() - start, error=str(ex)))
+
+
+def _kill(process):
+    """
+    Terminates a run together with its solver processes.
+    """
+    if not process.is_alive(): return
+
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except OSError:
+            process.terminate()
+    elif os.name == 'nt':
+        subprocess.call(
+            ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        process.terminate()
+    process.join()
+
+
+class Portfolio:
+    """
+    Races differently seeded and shuffled builds and solves of the same
+    scheduling problem in separate processes. The first run that proves its
+    schedule optimal (or within the target gap of the budget) wins and the
+    other runs are terminated. If no run proves optimality, the best
+    schedule found by any run is returned.
+
+    Attributes:
+        runs (list): The `PortfolioRun` configurations
+        compiled (bool): Whether the runs use a compiled program
+        results (list): The `PortfolioResult` of each run that finished,
+            in order of completion
+        winner (PortfolioResult): The result whose schedule was returned
+    """
+
+    def __init__(self, num_runs=None, solvers=('cbc',), compiled=False, seed=1):
+        num_runs = num_runs or os.cpu_count() or 1
+        self.runs = [
+            PortfolioRun(i, seed + i, i > 0, solvers[i % len(solvers)])
+            for i in range(num_runs)
+        ]
+        self.compiled = compiled
+        self.results = []
+        self.winner = None
+
+    def solve(self, num_blocks, clin_data={}, request_dict=[], holidays=[], constraints=[],
+              formulations={}, start=None, carry=None, logger=None, **budget):
+        """
+        Solves the scheduling problem described by the arguments of
+        `Scheduler`, with the solve budget (`threads`, `time_limit`, `gap_rel`,
+        `gap_abs`) of `Scheduler.generate` applied to every run. Returns the
+        winning schedule, or `None` if no run found one.
+        """
+        logger = logger or _NullLogger()
+        inputs = dict(
+            num_blocks=num_blocks, clin_data=clin_data,
+            # requests may use local named tuples, which cannot be pickled
+            request_dict={name: [tuple(_) for _ in request_dict[name]] for name in request_dict},
+            holidays=list(holidays), constraints=list(constraints), formulations=dict(formulations),
+            start=start, carry=carry
+        )
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_solve_run, args=(results, run, inputs, self.compiled, budget), daemon=True)
+            for run in self.runs
+        ]
+        for process in processes:
+            process.start()
+
+        self.results = []
+        self.winner = None
+        try:
+            while len(self.results) < len(processes):
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    # a run that died without a result will never report
+                    if not any(_.is_alive() for _ in processes) and results.empty(): break
+                    continue
+
+                self.results.append(result)
+                if result.error is not None:
+                    logger.write_line('Portfolio {} failed: {}'.format(result.run, result.error), level='WARNING')
+                    continue
+
+                logger.write_line('Portfolio {} finished in {:.2f} seconds, objective: {}'.format(
+                    result.run, result.time, result.objective))
+                if result.schedule is not None and (
+                        self.winner is None or result.objective > self.winner.objective):
+                    self.winner = result
+                if result.optimal:
+                    self.winner = result
+                    break
+        finally:
+            for process in processes:
+                _kill(process)
+
+        if self.winner is None: return None
+        logger.write_line('Portfolio winner: {}'.format(self.winner.run))
+        return self.winner.schedule
@@ -3,49 +3,66 @@ import math
 import os
 import random
 import sys
+import tempfile
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import numpy as np
 import pulp
 
 from constants import *
+from services.aio import AsyncRun
+from services.cache import cache_key
+from services.feasibility import balance_bounds, check_feasibility
+from services.model import ModelLayout, ModelMatrix, RowBlock
+from services.portfolio import Portfolio
+from services.solvers import CbcSolver, DecomposedSolver, SolveBudget, SolveCancelled, SolveResult, combine_results, get_solver
+from services.stats import Progress, StageStats
 
 
 class Variable:
     """
-    General LP variable.
+    General LP variable, a column of the program. Variables are compact
+    records: the name and the `pulp` variable are only built on demand
+    (for the `pulp` problem and LP/MPS exports), and the value is read from
+    the solution stored in the registry.
 
     Attributes:
-        name (str): The name of the variable
+        col (int): The column index of the variable
+        registry (VariableRegistry): The registry holding the variable
+        name (str): The name of the variable, defined by each kind of variable
         min (float): The minimum value that the variable can take
         max (float): The maximum value that the variable can take
     """
+    __slots__ = ('col', 'registry', '_var')
+    kind = None
+    min = 0
+    max = 1
 
-    def __init__(self, name, min_, max_):
-        self.name = name
-        self.min = min_
-        self.max = max_
-
-        self._init_var()
-
-    def _init_var(self):
-        self._var = pulp.LpVariable(
-            self.name, lowBound=self.min, upBound=self.max, cat="Integer"
-        )
+    def __init__(self):
+        self.col = None
+        self.registry = None
+        self._var = None
 
     def get_var(self):
         """
         Returns:
             The underlying `pulp` variable.
         """
+        if self._var is None:
+            self._var = pulp.LpVariable(
+                self.name, lowBound=self.min, upBound=self.max, cat="Integer"
+            )
         return self._var
 
     def get_value(self):
         """
         Returns:
-            The value of the variable.
+            The value of the variable, or `None` before a solution is loaded.
         """
-        return self._var.varValue
+        return self.registry.value(self.col)
 
 
 class WeekendVariable(Variable):
@@ -57,14 +74,18 @@ class WeekendVariable(Variable):
         clinician (Clinician): The clinician corresponding to this weekend assignment
         week_num (int): The week number corresponding to this weekend assignment
     """
+    __slots__ = ('clinician', 'week_num')
+    kind = 'weekend'
+    division = None
 
     def __init__(self, clinician, week_num):
+        Variable.__init__(self)
         self.clinician = clinician
         self.week_num = week_num
 
-        Variable.__init__(self, '{},weekend_{}'.format(
-            self.clinician.name, self.week_num
-        ), 0, 1)
+    @property
+    def name(self):
+        return '{},weekend_{}'.format(self.clinician.name, self.week_num)
 
 
 class BlockVariable(Variable):
@@ -78,28 +99,157 @@ class BlockVariable(Variable):
         block_num (int): The block number corresponding to this block assignment
         division (Division): The division corresponding to this block assignment
     """
+    __slots__ = ('clinician', 'block_num', 'division')
+    kind = 'block'
 
     def __init__(self, clinician, block_num, division):
+        Variable.__init__(self)
         self.clinician = clinician
         self.block_num = block_num
         self.division = division
 
-        Variable.__init__(self, '{},div_{},block_{}'.format(
-            self.clinician.name, self.division, self.block_num
-        ), 0, 1)
+    @property
+    def name(self):
+        return '{},div_{},block_{}'.format(self.clinician.name, self.division, self.block_num)
+
+
+class AdjacencyVariable(Variable):
+    """
+    Represents a 0-1 helper variable that is at most 1 when a clinician
+    works both a given block and the weekend adjacent to it.
+
+    Attributes:
+        clinician (Clinician): The clinician corresponding to this helper
+        block_num (int): The block number of the block assignment
+        division (Division): The division of the block assignment, or `None`
+            if the helper covers the block in all divisions
+        week_num (int): The week number of the adjacent weekend
+    """
+    __slots__ = ('clinician', 'block_num', 'division', 'week_num')
+    kind = 'adjacency'
+
+    def __init__(self, clinician, block_num, division, week_num):
+        Variable.__init__(self)
+        self.clinician = clinician
+        self.block_num = block_num
+        self.division = division
+        self.week_num = week_num
+
+    @property
+    def name(self):
+        if self.division is None:
+            return '{}_adjacency,block_{}__weekend_{}'.format(
+                self.clinician.name, self.block_num, self.week_num)
+        return '{}_adjacency,div_{},block_{}__weekend_{}'.format(
+            self.clinician.name, self.division, self.block_num, self.week_num)
+
+
+class SlackVariable(Variable):
+    """
+    Represents a non-negative slack variable of elastic mode, by which a
+    clinician may violate a single row of a relaxed constraint family.
+
+    Attributes:
+        index (int): The number of the slack variable
+        clinician (Clinician): The clinician of the row
+        constraint (str): The key of the constraint, see `CONSTRAINT_MAPPING`
+        division (str): The division of the first column of the row, if any
+        num (int): The block or week number of the row, if any
+        sense (int): The sense of the row, `pulp.LpConstraintLE` or
+            `pulp.LpConstraintGE`
+    """
+    __slots__ = ('index', 'clinician', 'constraint', 'division', 'num', 'sense', 'max')
+    kind = 'slack'
+
+    def __init__(self, index, constraint, sense, var, num, max_):
+        Variable.__init__(self)
+        self.index = index
+        self.clinician = var.clinician
+        self.constraint = constraint
+        self.division = var.division
+        self.num = num
+        self.sense = sense
+        self.max = max_
+
+    @property
+    def name(self):
+        return '{},slack_{}_{}'.format(self.clinician.name, self.constraint, self.index)
+
+
+class Violation:
+    """
+    A constraint violated by a schedule of elastic mode.
+
+    Attributes:
+        constraint (str): The key of the constraint, see `CONSTRAINT_MAPPING`
+        clinician (str): The name of the clinician
+        division (str): The division of the violated row, if any
+        num (int): The block or week number of the violated row, if any
+        amount (float): By how much the row is violated
+        above (bool): Whether the row is violated from above (a maximum)
+            or from below (a minimum)
+    """
+
+    DESCRIPTIONS = {
+        'minMaxBlocks': '{amount:g} block(s) {side} the {bound} of division {division}',
+        'balancedWeekends': '{amount:g} weekend(s) {side} the balanced {bound}',
+        'balancedLongWeekends': '{amount:g} long weekend(s) {side} the balanced {bound}',
+        'preventConsecutiveBlocks': 'consecutive blocks from block {num}',
+        'preventConsecutiveWeekends': 'consecutive weekends from week {num}'
+    }
+
+    def __init__(self, constraint, clinician, division, num, amount, above):
+        self.constraint = constraint
+        self.clinician = clinician
+        self.division = division
+        self.num = num
+        self.amount = amount
+        self.above = above
+
+    def __str__(self):
+        return '{}: {}'.format(self.clinician, Violation.DESCRIPTIONS[self.constraint].format(
+            amount=self.amount, side='above' if self.above else 'below', bound='maximum' if self.above else 'minimum',
+            division=self.division, num=self.num
+        ))
+
+
+class VariableRegistry:
+    """
+    Holds the solution of the program for its LP variables, which read
+    their values from it by column.
+
+    Attributes:
+        values (numpy.ndarray): The value of each column in the current
+            solution, or `None` before a solution is loaded
+    """
+
+    def __init__(self):
+        self.values = None
+
+    def add(self, var):
+        """
+        Registers a new LP variable.
+        """
+        var.registry = self
+
+    def value(self, col):
+        """
+        Returns the value of the given column in the current solution.
+        """
+        return None if self.values is None else float(self.values[col])
 
 
 class Division:
     """
-    Represents a given division comprised of multiple clinicians.
+    Represents a given division comprised of multiple clinicians. Divisions
+    are inputs of the program only, the variables and assignments of a
+    solve are kept by its `Scheduler`.
 
     Attributes:
         name (str): The name of the division
         clinicians (list): A list of `Clinician` objects that are covering this division
         bound_dict (dict): A dictionary mapping each clinician to a tuple (min, max)
             that represents the bounds on the number of blocks they can be assigned to
-        assignments (list): A list of `Clinician` objects where the index corresponds to
-            the block number of the assignment
     """
 
     def __init__(self, name):
@@ -107,8 +257,6 @@ class Division:
         self.clinicians = []
         self.bound_dict = dict()
 
-        self.assignments = []
-
     def add_clinician(self, clinician, min_, max_):
         """
         Adds a clinician to this division with block assignment  bounds 
@@ -126,39 +274,11 @@ class Division:
             del self.bound_dict[clinician.name]
             self.clinicians.remove(clinician)
 
-    def reset(self):
-        """
-        Resets division to pre-solving state
-        """
-        self.assignments = []
-
-    def get_vars(self):
-        """
-        Returns all block variables corresponding to this division, across all
-        clinicians.
-        """
-        block_vars = [
-            _ for clinician in self.clinicians for _ in clinician.get_block_vars()]
-        return list(filter(lambda x: x.division == self.name, block_vars))
-
-    def get_vars_by_block_num(self, block_num):
-        """
-        Returns all block variables corresponding to this division, across all
-        clinicians whose block number is equal to `block_num`.
-        """
-        return list(filter(lambda x: x.block_num == block_num, self.get_vars()))
-
-    def get_vars_by_name(self, name):
-        """
-        Returns all block variables corresponding to this division with
-        a clinician whose name is equal to `name`.
-        """
-        return list(filter(lambda x: x.clinician.name == name, self.get_vars()))
-
 
 class Clinician:
     """
-    Stores data regarding a given clinician.
+    Stores data regarding a given clinician. Like divisions, clinicians are
+    inputs of the program only.
     """
 
     def __init__(self, name, email, blocks_off=[], weekends_off=[]):
@@ -166,127 +286,685 @@ class Clinician:
         self.email = email
         self.blocks_off = blocks_off
         self.weekends_off = weekends_off
-        self.weekends_assigned = []
 
-        self._vars = []
 
-    def add_var(self, var):
+class Scheduler:
+    """
+    Implements a scheduling algorithm using LP in order to create a fair
+    schedule based on the supplied clinician and division data.
+
+    `start` is the Monday of the first week of the schedule. If it is not
+    set, dates are mapped to the weeks of the schedule by their ISO week
+    number. `carry` holds the assignments committed before the schedule
+    (see `services.horizon.Carry`), which the balance and consecutive
+    assignment constraints take into account.
+
+    The inputs (clinicians, divisions, long weekends, constraints) are
+    parsed once and never changed by a solve; setting them replaces them
+    rather than changing them in place. Everything a solve builds or finds
+    is kept by the scheduler itself, so one scheduler must not run two
+    solves at once. `fork` returns a scheduler that shares the inputs but
+    has its own solve state, for concurrent solves in threads.
+    """
+    # the attributes that hold the inputs, which forks share
+    INPUTS = (
+        'num_blocks', 'num_weekends', 'start', 'carry', 'clinicians', 'divisions', 'holiday_map',
+        'long_weekends', 'constraints', 'formulations', '_inputs', '_logger'
+    )
+
+    def __init__(self, logger, num_blocks, clin_data={}, request_dict=[], holidays=[], constraints=[],
+                 formulations={}, start=None, carry=None):
+        self._logger = logger
+        self._init_state()
+        self.update(num_blocks, clin_data=clin_data, request_dict=request_dict, holidays=holidays,
+                    constraints=constraints, formulations=formulations, start=start, carry=carry)
+
+    def _init_state(self):
+        """
+        Sets up an empty solve state: no program, no solution.
+        """
+        self.variables = VariableRegistry()
+        self.problem = None
+        self.stats = StageStats()
+        self.schedule = None
+        self.objective_value = None
+        self.solution_time = None
+        self.optimal = False
+        self.gap = None
+        self.objective_loss = None
+        self.lazy_rounds = 0
+        self.lazy_rows = 0
+        self.lazy_unchecked = 0
+        self.infeasibility = []
+        self.elastic = False
+        self.violations = []
+        self.presolve = True
+        self.presolve_cols = 0
+        self.presolve_rows = 0
+        self._full_solve = None
+        self._status = None
+        self._presolve_infeasibility = []
+        self._progress = None
+        self._cancel = None
+
+    def fork(self, constraints=None, formulations=None):
+        """
+        Returns a new scheduler over the same inputs, with a solve state of
+        its own and no program. The inputs are shared, not copied, so that
+        many forks can run `generate` concurrently in threads, e.g. with
+        different shuffles, or with the `constraints`/`formulations` given
+        here instead of the current ones.
+        """
+        scheduler = Scheduler.__new__(Scheduler)
+        for name in Scheduler.INPUTS:
+            setattr(scheduler, name, getattr(self, name))
+        scheduler._init_state()
+
+        if constraints is not None:
+            scheduler.set_constraints(constraints)
+            scheduler._inputs = dict(scheduler._inputs, constraints=constraints)
+        if formulations is not None:
+            scheduler.set_formulations(formulations)
+            scheduler._inputs = dict(scheduler._inputs, formulations=formulations)
+        return scheduler
+
+    def update(self, num_blocks, clin_data={}, request_dict=[], holidays=[], constraints=[],
+               formulations={}, start=None, carry=None):
         """
-        Adds a new LP variable to this clinician.
+        Replaces all scheduler inputs, keeping the current program. The next
+        call to `generate` patches the program instead of rebuilding it when
+        only requests, holidays, min/max bounds or the carry changed.
         """
-        if var not in self._vars:
-            self._vars.append(var)
+        self.num_blocks = num_blocks
+        self.num_weekends = num_blocks * BLOCK_SIZE
+        self.start = start
+        self.carry = carry
+        self._inputs = dict(
+            num_blocks=num_blocks, clin_data=clin_data, request_dict=request_dict,
+            holidays=holidays, constraints=constraints, formulations=formulations,
+            start=start, carry=carry
+        )
+
+        self.set_long_weekends(holidays)
+        self.set_data(clin_data)
+        self.set_timeoff(request_dict)
+        self.set_constraints(constraints)
+        self.set_formulations(formulations)
 
-    def remove_var(self, var):
+    def generate(self, verbose=False, shuffle=False, compiled=False, initial=None, solver='cbc',
+                 threads=0, time_limit=None, gap_rel=None, gap_abs=None, seed=None, decompose=False,
+                 two_stage=False, elastic=False, presolve=True, progress=None, cancel=None, cache=None):
+        """
+        Builds and solves the scheduling program, and returns the schedule
+        (division assignments, weekend assignments and the holiday map), or
+        `None` if none was found. A program built by a previous call is
+        patched rather than rebuilt, unless its structure changed or
+        `shuffle` is set.
+
+        `compiled` skips the `pulp` expressions (see `get_matrix`); other
+        `solver`s than CBC, `decompose`, `two_stage` and `cancel` need it.
+        The budget arguments are those of `SolveBudget`: if it runs out,
+        the best schedule found is returned, and `self.optimal`/`self.gap`
+        tell how good it is. The inputs are checked first, see `_precheck`;
+        the other options are described by `_solve_program` (`solver`,
+        `decompose`), `get_start_values` (`initial`), `_solve_lazy`,
+        `_solve_two_stage`, `_add_slack` (`elastic`), `_presolve`, `_stage`
+        (`progress`, `cancel`) and `_cache_key` (`cache`).
+        """
+        if elastic and two_stage:
+            raise ValueError('The two-stage solve does not support elastic mode')
+
+        self.stats = StageStats(trace_memory=verbose, listener=progress)
+        self.stats.start()
+        self.objective_loss = None
+        self.violations = []
+        self.elastic = elastic
+        self.presolve = presolve
+        self._progress = progress
+        self._cancel = cancel
+        key = None
+        if cache is not None:
+            key = self._cache_key(dict(
+                shuffle=shuffle, compiled=compiled, solver=solver, threads=threads, time_limit=time_limit,
+                gap_rel=gap_rel, gap_abs=gap_abs, seed=seed, decompose=decompose, two_stage=two_stage,
+                elastic=elastic, presolve=presolve, initial=None if initial is None else initial[:2]
+            ))
+        try:
+            if key is not None:
+                with self.stats.stage('cache'):
+                    entry = cache.get(key)
+                if entry is not None:
+                    self._load_cache_entry(entry)
+                    self._logger.write_line('Loaded the schedule from the cache.')
+                    return self.schedule
+
+            if not self._precheck(): return None
+            budget = SolveBudget(threads, time_limit, gap_rel, gap_abs)
+            compiled = compiled or solver != 'cbc' or decompose or two_stage or cancel is not None
+            schedule = self._generate(verbose, shuffle, compiled, initial, solver, budget, seed, decompose, two_stage)
+            if key is not None and schedule is not None:
+                cache.put(key, self._cache_entry())
+            return schedule
+        except SolveCancelled:
+            # the program may be half built or patched
+            self._model_structure = None
+            self.schedule, self.optimal, self.gap = None, False, None
+            raise
+        finally:
+            self.stats.stop()
+            self._progress = self._cancel = None
+
+    def _cache_key(self, options):
         """
-        Removes an existing LP variable from this clinician.
+        Returns the key of a run of `generate` with the supplied `options`
+        in a `services.cache.SolutionCache` (see `services.cache.cache_key`),
+        or `None` if the run is not cached because it shuffles without a
+        seed. A run whose key is stored returns the stored schedule without
+        building or solving the program, and the schedules found are stored.
         """
-        if var in self._vars:
-            self._vars.remove(var)
+        if options['shuffle'] and options['seed'] is None: return None
+        return cache_key(self._inputs, options)
 
-    def reset(self):
+    def _cache_entry(self):
         """
-        Resets clinician to pre-solving state
+        Returns the schedule of the last run and its solve outcome, in the
+        form stored by `services.cache.SolutionCache`. The holiday map is
+        left out, it follows from the holidays of the key.
         """
-        self._vars = []
-        self.weekends_assigned = []
+        div_assignments, weekend_assignments, _ = self.schedule
+        return dict(
+            divisions=list(div_assignments.items()), weekends=weekend_assignments,
+            optimal=self.optimal, gap=self.gap, objective=self.objective_value,
+            violations=[
+                [_.constraint, _.clinician, _.division, _.num, _.amount, _.above] for _ in self.violations
+            ]
+        )
 
-    def get_vars(self, predicate=None):
+    def _load_cache_entry(self, entry):
+        """
+        Restores the schedule and solve outcome of a cache entry, see
+        `_cache_entry`. The program and its solution are left untouched.
+        """
+        self.schedule = (dict(entry['divisions']), entry['weekends'], self.holiday_map)
+        self.optimal = entry['optimal']
+        self.gap = entry['gap']
+        self.objective_value = entry['objective']
+        self.violations = [Violation(*_) for _ in entry['violations']]
+        self.infeasibility = []
+
+    def generate_async(self, executor=None, **kwargs):
         """
-        Returns a list of all variables from this clinician that satisfy
-        the supplied predicate.
+        Asyncio counterpart of `generate`, which takes the same keyword
+        arguments but `progress` and `cancel`. The program is built and
+        solved in `executor` (the default executor of the event loop if
+        `None`), so the event loop keeps running meanwhile.
+
+        Returns a `services.aio.AsyncRun`: awaiting it returns the
+        schedule, and `async for` over it yields the `Progress` events of
+        the run. Cancelling the task that awaits the run (or calling its
+        `cancel`) terminates the solver. Like `generate`, a scheduler runs
+        one solve at a time, use `fork` for concurrent runs.
         """
-        return list(filter(predicate, self._vars))
+        return AsyncRun(lambda progress, cancel: self.generate(progress=progress, cancel=cancel, **kwargs),
+                        executor)
 
-    def get_block_vars(self, predicate=None):
+    def generate_portfolio(self, num_runs=None, solvers=('cbc',), compiled=False, seed=1,
+                           threads=0, time_limit=None, gap_rel=None, gap_abs=None, elastic=False):
         """
-        Returns a list of all block variables from this clinician that
-        satisfy the supplied predicate.
+        Solves the scheduling program with a portfolio of `num_runs` (default:
+        one per core) differently seeded runs in separate processes, see
+        `services.portfolio.Portfolio`. All runs but the first shuffle the
+        clinicians with their own seed, and the runs cycle through `solvers`.
+        The first run that proves optimality (or reaches the target gap)
+        wins and the other runs are terminated.
+
+        The budget arguments and `elastic` apply to each run, as in
+        `generate`; keep `threads` low, the runs already use one core each.
+        """
+        self.stats = StageStats()
+        self.objective_loss = None
+        self.violations = []
+        self.elastic = elastic
+        if not self._precheck(): return None
+        portfolio = Portfolio(num_runs, solvers=solvers, compiled=compiled, seed=seed)
+        self.schedule = portfolio.solve(
+            logger=self._logger, threads=threads, time_limit=time_limit,
+            gap_rel=gap_rel, gap_abs=gap_abs, elastic=elastic, **self._inputs
+        )
+        winner = portfolio.winner
+        self.optimal = winner is not None and winner.optimal
+        self.gap = winner.gap if winner is not None else None
+        self.objective_value = winner.objective if winner is not None else None
+        self.violations = winner.violations if winner is not None else []
+        for violation in self.violations:
+            self._logger.write_line('Violated: {}'.format(violation), level='WARNING')
+        return self.schedule
+
+    def check_feasibility(self):
         """
-        return list(filter(predicate, self.get_vars(lambda x: type(x) is BlockVariable)))
+        Returns the reasons why no schedule can satisfy the current inputs
+        and constraints, as far as counting tells, without building the
+        program (see `services.feasibility.check_feasibility`). An empty list
+        does not guarantee that a schedule exists.
+        """
+        names = {func: key for key, func in Scheduler.CONSTRAINT_MAPPING.items()}
+        # elastic mode may violate the relaxed constraints
+        constraints = [names[func] for func in self.constraints
+                       if not (self.elastic and names[func] in Scheduler.ELASTIC_CONSTRAINTS)]
+        return check_feasibility(
+            self.num_blocks, list(self.divisions.values()), list(self.clinicians.values()),
+            constraints, self.long_weekends, self.carry
+        )
 
-    def get_weekend_vars(self, predicate=None):
+    def _precheck(self):
         """
-        Returns a list of all weekend variables from this clinician that
-        satisfy the supplied predicate.
+        Runs `check_feasibility` as a stage, before the program is built,
+        and logs the reasons found. They are kept in `self.infeasibility`,
+        and the run stops without solving. Returns whether the inputs passed.
         """
-        return list(filter(predicate, self.get_vars(lambda x: type(x) is WeekendVariable)))
+        if self._cancel is not None:
+            self._cancel.check()
+        with self.stats.stage('precheck'):
+            self.infeasibility = self.check_feasibility()
+        for reason in self.infeasibility:
+            self._logger.write_line(reason, level='ERROR')
+        if self.infeasibility:
+            self.schedule, self.optimal, self.gap = None, False, None
+        return not self.infeasibility
+
+    def _generate(self, verbose, shuffle, compiled, initial, solver, budget, seed, decompose, two_stage):
+        # the CBC log is needed for the gap, see `CbcSolver.read_gap`
+        log_fd, log_path = tempfile.mkstemp(prefix='scheduler-', suffix='.log')
+        os.close(log_fd)
+        try:
+            self.setup_solver(warm_start=initial is not None, budget=budget, log_path=log_path, seed=seed)
+            return self._solve(verbose, shuffle, compiled, initial, solver, budget, seed, decompose, two_stage,
+                               log_path)
+        finally:
+            os.remove(log_path)
+
+    def _solve(self, verbose, shuffle, compiled, initial, solver, budget, seed, decompose, two_stage, log_path):
+        reuse = not shuffle and (self.problem is None) == compiled and self.update_problem()
+        if not reuse:
+            self.setup_problem(shuffle=shuffle, compiled=compiled, seed=seed)
+            if verbose and self.presolve:
+                self._logger.write_line('Presolve removed {} column(s) and {} row(s).'.format(
+                    self.presolve_cols, self.presolve_rows))
+        elif verbose:
+            self._logger.write_line('Re-using the previous model.')
+
+        if self._presolve_infeasibility:
+            self.infeasibility = list(self._presolve_infeasibility)
+            for reason in self.infeasibility:
+                self._logger.write_line(reason, level='ERROR')
+            self.schedule, self.optimal, self.gap = None, False, None
+            return None
+
+        start = None
+        if initial is not None:
+            with self.stats.stage('warm_start'):
+                start = self.get_start_values(initial)
+                if not compiled:
+                    for lp_var, value in zip(self._lp_vars, start.tolist()):
+                        lp_var.setInitialValue(value)
+            if verbose:
+                self._logger.write_line('Warm start: {} of {} variables set to 1 by the initial schedule.'.format(
+                    np.count_nonzero(start), len(start)))
 
+        ret = self._solve_lazy(verbose, compiled, solver, budget, seed, decompose, two_stage, log_path, start)
 
-class Scheduler:
-    """
-    Implements a scheduling algorithm using LP in order to create a fair
-    schedule based on the supplied clinician and division data.
-    """
+        if ret:
+            with self.stats.stage('assign_schedule'):
+                self.assign_schedule()
 
-    def __init__(self, logger, num_blocks, clin_data={}, request_dict=[], holidays=[], constraints=[]):
-        self.num_blocks = num_blocks
-        self.num_weekends = num_blocks * BLOCK_SIZE
+            if self.elastic:
+                self.violations = self.get_violations()
+                for violation in self.violations:
+                    self._logger.write_line('Violated: {}'.format(violation), level='WARNING')
 
-        self.clinicians = {}
-        self.divisions = {}
-        self.holiday_map = {}
-        self.long_weekends = []
-        self._logger = logger
-        self.constraints = []
-        
-        self.set_long_weekends(holidays)
-        self.set_data(clin_data)
-        self.set_timeoff(request_dict)
-        self.set_constraints(constraints)
+            if verbose:
+                self._logger.write_line('Solved in: {} seconds'.format(self.solution_time))
+                self._logger.write_line('Objective function value: {}'.format(self.objective_value))
+                if not self.optimal:
+                    self._logger.write_line('Stopped at the solve budget, gap: {}'.format(
+                        'unknown' if self.gap is None else '{:.2%}'.format(self.gap)))
+                if self.objective_loss is not None:
+                    self._logger.write_line('Two-stage objective loss against the full solve: {}'.format(
+                        self.objective_loss))
+                self.log_conflicts()
+                self.log_stats()
+
+            return self.schedule
+
+        if verbose:
+            self.log_stats()
+
+    def _solve_lazy(self, verbose, compiled, solver, budget, seed, decompose, two_stage, log_path, start):
+        """
+        Solves the program, and returns whether a solution was found.
+        Constraints with a lazy formulation (see `CONSTRAINT_FORMULATIONS`)
+        start without rows: the rows that the solution violates are added,
+        and the program is re-solved, warm started from the previous
+        solution, until none are violated. `self.lazy_rounds` and
+        `self.lazy_rows` count the re-solves and the rows added.
+
+        The time limit of `budget` covers all rounds. If it runs out first,
+        the last solution is kept although it violates the rows added last,
+        which are counted in `self.lazy_unchecked`.
+        """
+        self.lazy_rounds, self.lazy_rows, self.lazy_unchecked = 0, 0, 0
+        begin = time.time()
+        round_budget = budget
+        solution_time = 0.0
+        incumbent = None
+        while True:
+            ret = self._solve_program(verbose, compiled, solver, round_budget, seed, decompose, two_stage,
+                                      log_path, start)
+            if self._cancel is not None:
+                self._cancel.check()
+            solution_time += self.solution_time or 0.0
+            if not ret:
+                if incumbent is not None and self._status == pulp.LpStatusNotSolved:
+                    # the round ran out of time before finding a solution
+                    self._load_solution(incumbent[0])
+                    self.objective_value = incumbent[1]
+                    self.lazy_unchecked = incumbent[2]
+                    ret = True
+                break
+            num_rows = self._add_lazy_rows()
+            if not num_rows: break
+
+            round_budget = budget.remaining(time.time() - begin)
+            if round_budget.exhausted():
+                self.lazy_unchecked = num_rows
+                break
+            self.lazy_rounds += 1
+            self.lazy_rows += num_rows
+            start = self.variables.values.copy()
+            incumbent = (start, self.objective_value, num_rows)
+            if not compiled:
+                self.setup_solver(warm_start=True, budget=round_budget, log_path=log_path, seed=seed)
+        self.solution_time = solution_time
+
+        if self.lazy_unchecked:
+            # the schedule violates rows of the program
+            self.optimal, self.gap = False, None
+            self._logger.write_line('The time limit ran out before {} violated lazy row(s) were enforced.'.format(
+                self.lazy_unchecked), level='WARNING')
+        if verbose and self.lazy_rounds:
+            self._logger.write_line('Added {} violated lazy row(s) in {} round(s).'.format(
+                self.lazy_rows, self.lazy_rounds))
+        return ret
+
+    def _solve_program(self, verbose, compiled, solver, budget, seed, decompose, two_stage, log_path, start):
+        """
+        Solves the current program once, and loads the solution into the
+        model variables. Returns whether a solution was found, the `pulp`
+        status of the solve is kept in `self._status`.
+
+        A compiled program is handed to the `solver` backend as arrays (see
+        `services.solvers.get_solver`). With `decompose`, its independent
+        parts are solved concurrently in worker processes (see
+        `services.solvers.DecomposedSolver`); note that with weekend
+        coverage, the weekend pool links all clinicians.
+        """
+        if compiled:
+            with self.stats.stage('compile'):
+                matrix = self.get_matrix()
+            on_line = None
+            if self._progress is not None:
+                on_line = lambda line: self._progress(Progress('solver', line, self.stats.elapsed()))
+            backends = []
+
+            def make_backend(budget):
+                backend = get_solver(solver, cbc_path=self.solver.path, msg=verbose, budget=budget, seed=seed,
+                                     cancel=self._cancel, on_line=on_line)
+                if decompose:
+                    backend = DecomposedSolver(backend)
+                backends.append(backend)
+                return backend
+
+            if two_stage:
+                result = self._solve_two_stage(make_backend, budget, start)
+            else:
+                result = make_backend(budget).solve(matrix, start=start)
+            if decompose and verbose:
+                self._logger.write_line('Solved {} independent part(s) of the model.'.format(backends[-1].num_parts))
+            self.stats.add('solver_io', result.io_time)
+            self.stats.add('solve', result.solution_time)
+
+            if result.values is not None:
+                self._load_solution(result.values)
+            self.solution_time = result.solution_time
+            self.objective_value = result.objective
+            self._status = result.status
+            self.optimal = result.status == pulp.LpStatusOptimal
+            self.gap = result.gap
+            ret = result.values is not None
+            if ret:
+                self._compare_full_solve(two_stage)
+        else:
+            # pulp writes and reads the solver files inside `solve`, so
+            # solver I/O is included in this stage
+            with self.stats.stage('solve'):
+                status = self.problem.solve(self.solver)
+            self._status = status
+            self._load_solution([lp_var.varValue or 0 for lp_var in self._lp_vars])
+            self.solution_time = self.problem.solutionTime
+            self.objective_value = pulp.value(self.problem.objective)
+
+            # pulp reports a solve stopped with an integer solution as optimal
+            with open(log_path, 'r') as f:
+                self.gap = CbcSolver.read_gap(f)
+            self.optimal = status == pulp.LpStatusOptimal and self.problem.sol_status == pulp.LpSolutionOptimal
+            ret = self.optimal or (status == pulp.LpStatusOptimal and self.gap is not None)
+            if self.optimal and self.gap is None:
+                self.gap = 0.0
+            if ret:
+                self._compare_full_solve(False)
+
+        return ret
+
+    def _solve_two_stage(self, make_backend, budget, start=None):
+        """
+        Solves the compiled program in two stages, and returns a
+        `SolveResult` of the whole program. Stage one solves the blocks,
+        with the rows and objective terms that only involve blocks. Stage
+        two solves the weekends with the blocks fixed. A helper is then
+        equal to its adjacent weekend if the clinician works the block, and
+        0 otherwise, so the adjacency objective becomes plain objective
+        coefficients of the weekends.
+
+        This is much faster than a full solve, but the schedule is only
+        optimal for the blocks chosen: `self.optimal` and `self.gap` refer to
+        the stages, and `self.objective_loss` is the objective lost against
+        the last optimal full solve of the same program, if there was one
+        (see `_compare_full_solve`). Elastic mode is not supported.
+
+        `make_backend` returns the solver of a stage for a `SolveBudget`.
+        Stage one may use `TWO_STAGE_SHARE` of the time limit of `budget`,
+        and stage two whatever stage one leaves.
+        """
+        layout = self.layout
+        begin = time.time()
+        # the clinicians of a symmetry class differ once their blocks are fixed
+        matrix = self.get_matrix(exclude=('symmetry',))
+
+        first_budget = budget
+        if budget.time_limit is not None:
+            first_budget = SolveBudget(budget.threads, budget.time_limit * Scheduler.TWO_STAGE_SHARE,
+                                       budget.gap_rel, budget.gap_abs)
+        blocks = layout.block_index[layout.block_index >= 0]
+        first = make_backend(first_budget).solve(
+            matrix.submatrix(blocks), start=None if start is None else start[blocks])
+        if first.values is None:
+            return combine_results([first], time.time() - begin, None)
+
+        second_budget = budget.remaining(time.time() - begin)
+        if second_budget.exhausted():
+            self._logger.write_line('The time limit ran out before the weekends were solved.', level='WARNING')
+            return combine_results([first, SolveResult(pulp.LpStatusNotSolved)], time.time() - begin, None)
+
+        values = np.zeros(layout.num_cols)
+        values[blocks] = first.values
+
+        helpers = layout.adjacency_index
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        adjacent_weekends = np.broadcast_to(layout.weekend_index[:, None, weeks - 1], helpers.shape)
+        mask = helpers >= 0
+        worked = mask & (layout.helper_blocks(values) > 0.5)
+
+        weekends = layout.weekend_index[layout.weekend_index >= 0]
+        position = np.zeros(layout.num_cols, dtype=np.int64)
+        position[weekends] = np.arange(len(weekends))
+        second_matrix = matrix.submatrix(weekends)
+        np.add.at(second_matrix.objective, position[adjacent_weekends[worked]],
+                  self.objective[helpers[worked]])
+        second = make_backend(second_budget).solve(second_matrix, start=None if start is None else start[weekends])
+
+        def stitch(results):
+            values[weekends] = second.values
+            values[helpers[mask]] = np.minimum(
+                layout.helper_blocks(values)[mask], values[adjacent_weekends[mask]])
+            return values, float(self.objective.dot(values))
+
+        return combine_results([first, second], time.time() - begin, stitch)
+
+    def _compare_full_solve(self, two_stage):
+        """
+        Remembers the objective value of an optimal full solve, and sets
+        `self.objective_loss` of a two-stage solve of the same program.
+        """
+        matrix = self.get_matrix()
+        key = (matrix.rows.indptr.tobytes(), matrix.rows.indices.tobytes(), matrix.rows.data.tobytes(),
+               matrix.rows.rhs.tobytes(), matrix.objective.tobytes())
+
+        self.objective_loss = None
+        if not two_stage:
+            if self.optimal:
+                self._full_solve = (key, self.objective_value)
+        elif self._full_solve is not None and self._full_solve[0] == key:
+            # the difference is rounding noise when both are optimal
+            self.objective_loss = max(0.0, self._full_solve[1] - self.objective_value)
+
+    def get_stats(self):
+        """
+        Returns the per-stage statistics of the last run as a dictionary
+        mapping each stage name to its `time`, `memory`, `rows`, `cols`
+        and `nnz`.
+        """
+        return self.stats.as_dict()
 
-    def generate(self, verbose=False, shuffle=False):
-        self.setup_solver()
-        self.setup_problem(shuffle=shuffle)
+    def log_stats(self):
+        self._logger.write_line('Stage statistics:')
+        for line in self.stats.lines():
+            self._logger.write_line('- ' + line)
 
-        ret = self.problem.solve(self.solver) == pulp.LpStatusOptimal
-                    
-        if ret:
-            if verbose:
-                self._logger.write_line('Solved in: {} seconds'.format(self.problem.solutionTime))
-                self._logger.write_line('Objective function value: {}'.format(pulp.value(self.problem.objective)))
-                conflicts_str = 'Schedule Conflicts:'
-                for clinician in self.clinicians.values():
-                    assigned_blocksoff = clinician.get_block_vars(
-                        lambda x, clinician=clinician: x.block_num in clinician.blocks_off and x.get_value() == 1.0)
-                    assigned_weekendsoff = clinician.get_weekend_vars(
-                        lambda x, clinician=clinician: x.week_num in clinician.weekends_off and x.get_value() == 1.0)
-                    
-                    conflicts_str += ' {0} ({1}/{2} blocks, {3}/{4} weekends)'.format(
-                        clinician.name, len(assigned_blocksoff), len(clinician.blocks_off),
-                        len(assigned_weekendsoff), len(clinician.weekends_off)
-                    )
-                self._logger.write_line(conflicts_str)
+    def get_problem(self):
+        return self.problem
 
-            self.assign_schedule()
-            # only keep assignments mapping
-            divAssignments = dict.fromkeys(self.divisions.keys())
-            for key in self.divisions.keys():
-                div = self.divisions[key]
-                divAssignments[key] = [clin.name for clin in div.assignments]
+    def get_matrix(self, exclude=(), names=False):
+        """
+        Returns the program built by `setup_problem` as a `ModelMatrix`,
+        without the rows of the constraint families in `exclude`. Column
+        names are only built if `names` is set, solvers use generic names.
+        """
+        return ModelMatrix(
+            RowBlock.concat([
+                _ for name, family in self._row_blocks.items() if name not in exclude for _ in family]),
+            self.objective, maximize=True,
+            col_names=[_.name for _ in self._columns] if names else None,
+            upper=np.array([_.max for _ in self._columns], dtype=float) if self._slack_cols else None
+        )
 
-            weekendAssignments = [None] * self.num_weekends
-            for clinician in self.clinicians.values():
-                for week_num in clinician.weekends_assigned:
-                    i = week_num - 1
-                    weekendAssignments[i] = clinician.name
+    def write_mps(self, path):
+        """
+        Writes the program built by `setup_problem` to an MPS file.
+        """
+        if self.problem is None:
+            self.get_matrix(names=True).write_mps(path)
+        else:
+            self.problem.writeMPS(path)
 
-            return (divAssignments, weekendAssignments, self.holiday_map)
+    def write_lp(self, path):
+        """
+        Writes the program built by `setup_problem` to an LP file.
+        """
+        if self.problem is None:
+            self.get_matrix(names=True).write_lp(path)
+        else:
+            self.problem.writeLP(path)
 
-    def get_problem(self):
-        return self.problem
+    def setup_solver(self, warm_start=False, budget=None, log_path=None, seed=None):
+        """
+        Sets up the `pulp` CBC solver. `budget` is an optional `SolveBudget`,
+        `log_path` an optional file receiving the CBC output instead of the
+        console and `seed` an optional random seed.
+        """
+        budget = budget or SolveBudget()
+        options = dict(
+            msg=log_path is None, warmStart=warm_start, logPath=log_path,
+            threads=budget.threads or None, timeLimit=budget.time_limit,
+            gapRel=budget.gap_rel, gapAbs=budget.gap_abs,
+            options=[] if seed is None else ['randomSeed {}'.format(seed), 'randomCbcSeed {}'.format(seed)]
+        )
 
-    def setup_solver(self):
         if getattr(sys, 'frozen', False):
             # running in a bundle
             cwd = os.getcwd()
             exe = 'cbc\\bin\\cbc.exe'
             if hasattr(sys, '_MEIPASS'): solverdir = os.path.join(sys._MEIPASS, exe)
             else: solverdir = exe
-            self.solver = pulp.COIN_CMD(path=solverdir, msg=1)
+            self.solver = pulp.COIN_CMD(path=solverdir, **options)
         else:
             # running from source
-            self.solver = pulp.PULP_CBC_CMD(msg=1)
+            self.solver = pulp.PULP_CBC_CMD(**options)
+
+    def get_start_values(self, schedule):
+        """
+        Converts a schedule, in the form returned by `generate`, to a vector
+        of column values of the current program, which is handed to the
+        solver as a MIP start (e.g. the previous schedule, or last year's).
+        Assignments to unknown clinicians or divisions, or outside of the
+        schedule, are ignored; the solver repairs or discards the rest.
+        """
+        layout = self.layout
+        values = np.zeros(layout.num_cols)
+        div_assignments, weekend_assignments = schedule[0], schedule[1]
+
+        # a block is assigned to the clinician covering its first week
+        for div_name, assignments in div_assignments.items():
+            if div_name not in self.divisions: continue
+            d = layout.division_pos(div_name)
+            for b, clin_name in enumerate(assignments[::BLOCK_SIZE][:self.num_blocks]):
+                if clin_name not in self.clinicians: continue
+                col = layout.block_index[layout.clinician_pos(clin_name), d, b]
+                if col >= 0: values[col] = 1
+
+        for w, clin_name in enumerate(weekend_assignments[:self.num_weekends]):
+            if clin_name not in self.clinicians: continue
+            col = layout.weekend_index[layout.clinician_pos(clin_name), w]
+            if col >= 0: values[col] = 1
+
+        # helper = block * adjacent weekend
+        helpers = layout.adjacency_index
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        adjacent_weekends = np.broadcast_to(layout.weekend_index[:, None, weeks - 1], helpers.shape)
+        mask = helpers >= 0
+        values[helpers[mask]] = np.minimum(
+            layout.helper_blocks(values)[mask], values[adjacent_weekends[mask]])
+
+        # relabel interchangeable clinicians to satisfy the symmetry ordering
+        for members in self._symmetry_classes:
+            cols = layout.weekend_index[members]
+            worked = (cols >= 0) & (values[cols] > 0)
+            first = np.where(worked.any(axis=1), worked.argmax(axis=1), self.num_weekends)
+            order = [members[i] for i in np.argsort(first, kind='stable')]
+            for index in (layout.block_index, layout.weekend_index, layout.adjacency_index):
+                cols = index[members]
+                values[cols[cols >= 0]] = values[index[order]][cols >= 0]
+
+        return values
 
     def set_data(self, data):
         """
@@ -301,9 +979,9 @@ class Scheduler:
             # populate blocks/weekends off
             blocks_off, weekends_off = [], []
             if 'blocks_off' in clin_object:
-                blocks_off = clin_object['blocks_off']
+                blocks_off = list(clin_object['blocks_off'])
             if 'weekends_off' in clin_object:
-                blocks_off = clin_object['weekends_off']
+                weekends_off = list(clin_object['weekends_off'])
 
             clinician = Clinician(
                 name=clin_name,
@@ -348,7 +1026,7 @@ class Scheduler:
                 weekends = []
                 curr = start
                 while curr <= end:
-                    week_num = curr.isocalendar()[1]
+                    week_num = self._week_num(curr)
                     if curr.isoweekday() in range(1, 6):
                         if week_num not in weeks:
                             weeks.append(week_num)
@@ -367,187 +1045,777 @@ class Scheduler:
                         clinician.weekends_off.append(week_num)
 
     def set_long_weekends(self, holidays):
-        self.holiday_map.clear()
+        self.holiday_map = {}
         for date in holidays:
             if date.isoweekday() == 1:
                 # Mon statutory holidays are associated with their weeknum - 1
                 #   (i.e.: the previous weeknum)
-                self.holiday_map[date] = date.isocalendar()[1] - 1
+                self.holiday_map[date] = self._week_num(date) - 1
 
             elif date.isoweekday() == 5:
                 # Fri statutory holidays are associated with their regular weeknum
-                self.holiday_map[date] = date.isocalendar()[1]
+                self.holiday_map[date] = self._week_num(date)
         
         self.long_weekends = list(self.holiday_map.values())
    
+    def _week_num(self, date):
+        """
+        Returns the week of the schedule that contains `date`: its ISO week
+        number, or the number of weeks since `start` if set (so that dates
+        of later years map past the end of the first year).
+        """
+        if self.start is None:
+            return date.isocalendar()[1]
+        return (date.toordinal() - self.start.toordinal()) // 7 + 1
+
     def set_constraints(self, constraint_dict):
-        for key in constraint_dict:
-            self.constraints.append(Scheduler.CONSTRAINT_MAPPING[key])
+        """
+        Replaces the enabled constraints with the given keys of
+        `CONSTRAINT_MAPPING`.
+        """
+        self.constraints = [Scheduler.CONSTRAINT_MAPPING[key] for key in constraint_dict]
+
+    def set_formulations(self, formulations):
+        """
+        Selects the row formulation of each constraint, see
+        `CONSTRAINT_FORMULATIONS`. Constraints that are not listed use their
+        default formulation.
+        """
+        self.formulations = {}
+        for key in formulations:
+            if formulations[key] not in Scheduler.CONSTRAINT_FORMULATIONS.get(key, ()):
+                raise ValueError('Unknown formulation "{}" of constraint "{}"'.format(formulations[key], key))
+            self.formulations[key] = formulations[key]
+
+    def get_formulation(self, key):
+        return self.formulations.get(key, Scheduler.CONSTRAINT_FORMULATIONS[key][0])
  
-    def setup_problem(self, shuffle=False):
+    def setup_problem(self, shuffle=False, compiled=False, seed=None):
         """
         Constructs an LP program based on the clinician, division data.
-        """
-        self.problem = pulp.LpProblem('scheduler', sense=pulp.LpMaximize)
 
-        for clinician in self.clinicians.values():
-            clinician.reset()
-        for division in self.divisions.values():
-            division.reset()
+        If `compiled` is set, rows are only kept in array form (see
+        `get_matrix`) and no `pulp` problem is built. If `shuffle` is set,
+        the clinicians are shuffled, with their own random generator seeded
+        by `seed` if it is given.
+        """
+        self.problem = None if compiled else pulp.LpProblem('scheduler', sense=pulp.LpMaximize)
+        self.variables = VariableRegistry()
+        # row blocks and `pulp` constraint names, per constraint family
+        self._row_blocks = OrderedDict()
+        self._constraint_names = OrderedDict()
 
         divisions = list(self.divisions.values())
         clinicians = list(self.clinicians.values())
 
-        if shuffle: random.shuffle(clinicians)
+        if shuffle: random.Random(seed).shuffle(clinicians)
 
-        self._build_clinician_variables(divisions, clinicians)
-        self._build_adjacency_variables(divisions)
+        self.layout = ModelLayout(
+            [_.name for _ in clinicians], [_.name for _ in divisions],
+            self.num_blocks, self.num_weekends
+        )
+        self._columns = []
+        self._lp_vars = []
+        self._slack_cols = []
+        self.objective = None
+        self.presolve_rows = 0
+
+        # rows that presolve finds infeasible, see `_presolve`
+        self._presolve_infeasibility = []
+        with self._stage('presolve'):
+            self._removed = self._presolve(self._presolve_infeasibility)
+        with self._stage('variables'):
+            self._build_clinician_variables(divisions, clinicians)
+        with self._stage('adjacency'):
+            self._build_adjacency_variables(divisions)
 
         # add all necessary constraints
         for func in self.constraints:
+            with self._stage(self._family_name(func)):
+                func(self, divisions, clinicians)
+
+        with self._stage('symmetry'):
+            self._break_symmetry(clinicians)
+
+        with self._stage('objective'):
+            self._set_objective(clinicians)
+
+        layout = self.layout
+        self.presolve_cols = sum(
+            int(np.count_nonzero(_ == ModelLayout.REMOVED))
+            for _ in (layout.block_index, layout.weekend_index, layout.adjacency_index))
+
+        # remember what the model was built from, see `update_problem`
+        self._model_structure = self._structure(compiled)
+        self._model_long_weekends = sorted(self.long_weekends)
+        self._model_carry = self._carry_key()
+        self._model_timeoff = self._timeoff_key()
+
+    def update_problem(self):
+        """
+        Patches the program built by a previous `setup_problem` call so that
+        it reflects the current time-off requests, min/max bounds, long
+        weekends and carry. Only the objective coefficients and constraint
+        families whose inputs changed are rebuilt.
+
+        Returns `False` (without changing anything) if the structure of the
+        problem changed since it was built, in which case `setup_problem`
+        must be used instead.
+        """
+        compiled = self.problem is None
+        # the slack columns of elastic mode are tied to the rows they relax
+        if self.elastic or getattr(self, '_model_structure', None) != self._structure(compiled):
+            return False
+
+        self._rebind_variables()
+
+        divisions = list(self.divisions.values())
+        clinicians = [self.clinicians[name] for name in self.layout.clinicians]
+        families = [self._family_name(func) for func in self.constraints]
+
+        # min/max bounds
+        min_blocks, max_blocks = self.layout.min_blocks.copy(), self.layout.max_blocks.copy()
+        self._set_bounds(divisions)
+        if not (np.array_equal(min_blocks, self.layout.min_blocks) and
+                np.array_equal(max_blocks, self.layout.max_blocks)):
+            self._rebuild_family('constraint:minMaxBlocks', divisions, clinicians, families)
+
+        # assignments before the schedule
+        carry = self._carry_key()
+        if carry != self._model_carry:
+            for family in ('constraint:preventConsecutiveBlocks', 'constraint:preventConsecutiveWeekends',
+                           'constraint:balancedWeekends'):
+                self._rebuild_family(family, divisions, clinicians, families)
+
+        # long weekend membership
+        if sorted(self.long_weekends) != self._model_long_weekends or carry != self._model_carry:
+            self._rebuild_family('constraint:balancedLongWeekends', divisions, clinicians, families)
+            self._model_long_weekends = sorted(self.long_weekends)
+        self._model_carry = carry
+
+        # blocks/weekends off
+        timeoff = self._timeoff_key()
+        if timeoff != self._model_timeoff:
+            self._rebuild_family('constraint:hardTimeOff', divisions, clinicians, families)
+            self._model_timeoff = timeoff
+        objective = self.objective
+        with self._stage('objective'):
+            self._set_objective(clinicians, previous=objective)
+
+        # interchangeable clinicians, which depend on both of the above
+        if self._find_symmetry_classes(clinicians) != self._symmetry_classes:
+            self._clear_family('symmetry')
+            with self._stage('symmetry'):
+                self._break_symmetry(clinicians)
+
+        return True
+
+    def _rebuild_family(self, family, divisions, clinicians, families):
+        """
+        Replaces the rows of the given constraint family, if it is enabled.
+        """
+        if family not in families: return
+
+        self._clear_family(family)
+        func = self.constraints[families.index(family)]
+        with self._stage(family):
             func(self, divisions, clinicians)
 
+    def _clear_family(self, family):
+        """
+        Removes the rows of the given constraint family, keeping the family
+        in place so that the rows stay in build order.
+        """
+        self._row_blocks[family] = []
+        for name in self._constraint_names.get(family, []):
+            del self.problem.constraints[name]
+        self._constraint_names[family] = []
+
+    def _rebind_variables(self):
+        """
+        Attaches the existing model variables to the current `Clinician`
+        objects, which are recreated whenever the data is set.
+        """
+        for var in self._columns:
+            var.clinician = self.clinicians[var.clinician.name]
+
+    def _structure(self, compiled):
+        """
+        Returns a key describing everything that determines the variables
+        and the shape of the rows of the program.
+        """
+        return (
+            compiled, self.num_blocks, tuple(self.constraints), tuple(self.clinicians),
+            tuple((div.name, tuple(_.name for _ in div.clinicians)) for div in self.divisions.values()),
+            tuple((key, self.get_formulation(key)) for key in sorted(Scheduler.CONSTRAINT_FORMULATIONS)),
+            self.elastic, self._presolve()
+        )
+
+    @staticmethod
+    def _family_name(func):
+        names = {func: key for key, func in Scheduler.CONSTRAINT_MAPPING.items()}
+        return 'constraint:{}'.format(names.get(func, func.__name__))
+
+    @contextmanager
+    def _stage(self, name):
+        """
+        Measures the enclosed block as a stage of the run in `self.stats`
+        (see `get_stats`), and files the rows it adds under the constraint
+        family `name`. The `progress` callable of `generate` receives a
+        `services.stats.Progress` event when a stage ends, and for each line
+        of CBC output.
+
+        A run whose `services.solvers.CancelToken` was cancelled stops before
+        the stage, with `services.solvers.SolveCancelled`, and the program is
+        rebuilt by the next run; the CBC process is terminated right away.
+        In-process solvers and the parts of a decomposed solve only stop
+        once they finish. See `generate_async` for the asyncio counterpart
+        of `generate`.
+        """
+        if self._cancel is not None:
+            self._cancel.check()
+        self._family = name
+        with self.stats.stage(name, self._model_size):
+            yield
+
+    def _set_objective(self, clinicians, previous=None):
+        """
+        Builds the objective vector. If it is equal to `previous`, the
+        `pulp` objective is left untouched.
+        """
         block_conflicts_obj = self._build_block_objective(clinicians)
         weekend_conflicts_obj = self._build_weekend_objective(clinicians)
         adjacency_obj = self._build_adjacency_objective(clinicians)
 
-        # make sure to normalize objectives, and weigh them equally
-        self.problem.setObjective(
-              (1 / 3) * (1 / len(block_conflicts_obj)) * block_conflicts_obj
-            + (1 / 3) * (1 / len(weekend_conflicts_obj)) * weekend_conflicts_obj
-            + (1 / 3) * (1 / len(adjacency_obj)) * adjacency_obj
+        # make sure to normalize objectives, and weigh them equally. the
+        # columns removed by presolve count as well, so that a schedule has
+        # the same objective value with or without presolve. the adjacency
+        # objective is normalized by the number of (per division) helpers,
+        # i.e. of blocks, whichever helpers the model uses
+        layout = self.layout
+        num_blocks = np.count_nonzero(layout.block_index != -1)
+        self.objective = (
+              (1 / 3) * (1 / num_blocks) * block_conflicts_obj
+            + (1 / 3) * (1 / np.count_nonzero(layout.weekend_index != -1)) * weekend_conflicts_obj
+            + (1 / 3) * (1 / num_blocks) * adjacency_obj
         )
-        
+        self.objective[self._slack_cols] = -Scheduler.ELASTIC_PENALTY
+        if previous is not None and np.array_equal(previous, self.objective):
+            return
+
+        if self.problem is not None:
+            nonzero = np.flatnonzero(self.objective)
+            self.problem.setObjective(pulp.LpAffineExpression(
+                (self._lp_vars[j], self.objective[j]) for j in nonzero.tolist()
+            ))
+
+    def _model_size(self):
+        """
+        Returns the current (rows, cols, nonzeros) of the model, counting
+        objective coefficients as nonzeros.
+        """
+        blocks = [_ for family in self._row_blocks.values() for _ in family]
+        nnz = sum(_.nnz for _ in blocks)
+        if self.objective is not None:
+            nnz += np.count_nonzero(self.objective)
+        return (sum(len(_) for _ in blocks), self.layout.num_cols, nnz)
+
+    def _add_column(self, var):
+        """
+        Registers a new variable and returns its column index. Its `pulp`
+        variable is only built for the `pulp` problem.
+        """
+        var.col = self.layout.new_column()
+        self.variables.add(var)
+        self._columns.append(var)
+        if self.problem is not None:
+            self._lp_vars.append(var.get_var())
+        return var.col
+
+    def _add_rows(self, block):
+        """
+        Adds the rows of the supplied `RowBlock` to the problem, under the
+        current constraint family.
+        """
+        self.presolve_rows += block.num_removed
+        if self.elastic and self._family in ['constraint:{}'.format(_) for _ in Scheduler.ELASTIC_CONSTRAINTS]:
+            block = self._add_slack(block)
+        self._row_blocks.setdefault(self._family, []).append(block)
+        if self.problem is None: return
+
+        names = self._constraint_names.setdefault(self._family, [])
+        for constraint in block.to_pulp(self._lp_vars):
+            name = self.problem.unusedConstraintName()
+            self.problem.addConstraint(constraint, name)
+            names.append(name)
+
+    def _add_slack(self, block):
+        """
+        Returns the supplied row block with a new slack column in each row,
+        which lets the row be violated (elastic mode, for the rows of the
+        `ELASTIC_CONSTRAINTS`):
+            a x - s <= b    or    a x + s >= b
+        The slack is bounded by the largest violation of the row over 0-1
+        values of `x`, and keeps the block or week number of its row.
+
+        With the slacks, a schedule is found whenever the other constraints
+        allow one, and it violates the relaxed rows as little as possible.
+        The violations are logged and kept in `self.violations`, see
+        `get_violations`.
+        """
+        constraint = self._family.split(':', 1)[1]
+        starts = block.indptr[:-1]
+        signs = np.where(block.sense == pulp.LpConstraintLE, -1.0, 1.0)
+        above = np.add.reduceat(np.maximum(block.data, 0), starts) if len(starts) else np.zeros(0)
+        below = np.add.reduceat(np.minimum(block.data, 0), starts) if len(starts) else np.zeros(0)
+        bounds = np.where(block.sense == pulp.LpConstraintLE, above - block.rhs, block.rhs - below)
+        nums = block.nums.tolist() if block.nums is not None else [None] * len(block)
+        slack_cols = np.array([
+            self._add_column(SlackVariable(
+                len(self._slack_cols) + i, constraint, sense, self._columns[j], num, max(math.ceil(bound), 0)))
+            for i, (sense, j, num, bound) in enumerate(zip(
+                block.sense.tolist(), block.indices[starts].tolist(), nums, bounds.tolist()))
+        ], dtype=np.int64)
+        self._slack_cols.extend(slack_cols.tolist())
+
+        # append the slack column to the end of each row
+        ends = block.indptr[1:]
+        return RowBlock(
+            block.indptr + np.arange(len(block.indptr)), np.insert(block.indices, ends, slack_cols),
+            np.insert(block.data, ends, signs), block.sense, block.rhs
+        )
+
+    def get_violations(self):
+        """
+        Returns the `Violation` of each relaxed row that the current solution
+        of elastic mode violates.
+        """
+        violations = []
+        for j in self._slack_cols:
+            slack = self._columns[j]
+            amount = slack.get_value() or 0
+            if amount < 1e-6: continue
+            violations.append(Violation(
+                slack.constraint, slack.clinician.name, slack.division, slack.num,
+                amount, slack.sense == pulp.LpConstraintLE
+            ))
+        return violations
+
+    def _load_solution(self, values):
+        """
+        Stores the supplied vector of column values as the solution read by
+        the model variables.
+        """
+        self.variables.values = np.asarray(values, dtype=float)
+
+    def _set_bounds(self, divisions):
+        layout = self.layout
+        for div in divisions:
+            d = layout.division_pos(div.name)
+            for clinician in div.clinicians:
+                c = layout.clinician_pos(clinician.name)
+                layout.min_blocks[c, d], layout.max_blocks[c, d] = div.bound_dict[clinician.name]
+
     def _build_clinician_variables(self, divisions, clinicians):
+        layout = self.layout
+        self._set_bounds(divisions)
+        removed_blocks, removed_weekends = self._removed
         # create clinician BlockVariables
         for div in divisions:
+            d = layout.division_pos(div.name)
             for clinician in div.clinicians:
+                c = layout.clinician_pos(clinician.name)
                 for block_num in range(1, self.num_blocks + 1):
-                    clinician.add_var(
+                    if (clinician.name, div.name, block_num) in removed_blocks:
+                        layout.block_index[c, d, block_num - 1] = ModelLayout.REMOVED
+                        continue
+                    layout.block_index[c, d, block_num - 1] = self._add_column(
                         BlockVariable(clinician, block_num,
                                       div.name)
                     )
         # create clinician WeekendVariables
         for clinician in clinicians:
+            c = layout.clinician_pos(clinician.name)
             for week_num in range(1, self.num_weekends + 1):
-                clinician.add_var(
+                if (clinician.name, week_num) in removed_weekends:
+                    layout.weekend_index[c, week_num - 1] = ModelLayout.REMOVED
+                    continue
+                layout.weekend_index[c, week_num - 1] = self._add_column(
                     WeekendVariable(clinician, week_num)
                 )
 
+    def _presolve(self, reasons=None):
+        """
+        Returns the block and weekend columns that are fixed to 0 by the
+        enabled constraints, as sets of (clinician, division, block number)
+        and (clinician, week number) name tuples. These columns are left out
+        of the program, together with the rows that only involve them
+        (`self.presolve_cols` and `self.presolve_rows` count them):
+            - the blocks of a division whose maximum is 0 (with a minimum of 0)
+            - blocks and weekends off, with hard time off
+            - the first block/weekend of clinicians who worked the last
+              block/weekend before the schedule (see `carry`)
+            - all weekends, or all long weekends, of clinicians whose
+              balance leaves them none to work, given the carry
+        Constraints relaxed by elastic mode fix nothing. Columns of a
+        coverage row, or of a row with a minimum above 0, are kept if all of
+        them would be removed, so that the row makes the program infeasible
+        (or is violated, in elastic mode) rather than disappear. The reasons
+        of such infeasibility are appended to `reasons`, if given.
+        """
+        if not self.presolve: return (frozenset(), frozenset())
+        blocks, weekends = set(), set()
+
+        names = {func: key for key, func in Scheduler.CONSTRAINT_MAPPING.items()}
+        enabled = set(names[func] for func in self.constraints
+                      if not (self.elastic and names[func] in Scheduler.ELASTIC_CONSTRAINTS))
+        block_nums = range(1, self.num_blocks + 1)
+        week_nums = range(1, self.num_weekends + 1)
+
+        if 'minMaxBlocks' in enabled:
+            for div in self.divisions.values():
+                for name, (min_, max_) in div.bound_dict.items():
+                    if max_ <= 0 and min_ <= 0:
+                        blocks.update((name, div.name, b) for b in block_nums)
+
+        if 'hardTimeOff' in enabled:
+            for div in self.divisions.values():
+                for clinician in div.clinicians:
+                    blocks.update((clinician.name, div.name, b) for b in clinician.blocks_off if b in block_nums)
+            for clinician in self.clinicians.values():
+                weekends.update((clinician.name, w) for w in clinician.weekends_off if w in week_nums)
+
+        if self.carry is not None:
+            if 'preventConsecutiveBlocks' in enabled and self.num_blocks:
+                for div in self.divisions.values():
+                    blocks.update((_.name, div.name, 1) for _ in div.clinicians if _.name in self.carry.last_block)
+            if 'preventConsecutiveWeekends' in enabled and self.num_weekends:
+                weekends.update((name, 1) for name in self.carry.last_weekend if name in self.clinicians)
+
+        clinicians = list(self.clinicians.values())
+        if 'balancedWeekends' in enabled and clinicians:
+            bounds = balance_bounds(clinicians, self.num_weekends, self.carry.num_weekends if self.carry else 0,
+                                    self.carry.weekends if self.carry else {})
+            for name, (_, max_) in bounds.items():
+                if max_ <= 0: weekends.update((name, w) for w in week_nums)
+
+        long_weekends = sorted(set(w for w in self.long_weekends if w in week_nums))
+        if 'balancedLongWeekends' in enabled and clinicians and long_weekends:
+            bounds = balance_bounds(
+                clinicians, len(long_weekends), self.carry.num_long_weekends if self.carry else 0,
+                self.carry.long_weekends if self.carry else {})
+            for name, (_, max_) in bounds.items():
+                if max_ <= 0: weekends.update((name, w) for w in long_weekends)
+
+        for key, name, min_, row_blocks, row_weekends, what in self._min_rows(long_weekends):
+            if not (row_blocks <= blocks and row_weekends <= weekends): continue
+            blocks -= row_blocks
+            weekends -= row_weekends
+            if reasons is not None and key in enabled:
+                reasons.append('{}: none of {} can be worked, but at least {} must be.'.format(name, what, min_))
+
+        if 'coverage' in enabled:
+            for div in self.divisions.values():
+                for b in block_nums:
+                    row = set((_.name, div.name, b) for _ in div.clinicians)
+                    if row <= blocks: blocks -= row
+            for w in week_nums:
+                row = set((name, w) for name in self.clinicians)
+                if row and row <= weekends: weekends -= row
+
+        return (frozenset(blocks), frozenset(weekends))
+
+    def _min_rows(self, long_weekends):
+        """
+        Yields the rows with a minimum above 0, as (constraint key,
+        clinician name, minimum, block columns, weekend columns, description)
+        tuples, where the columns are the name tuples of `_presolve`.
+        """
+        names = {func: key for key, func in Scheduler.CONSTRAINT_MAPPING.items()}
+        keys = set(names[func] for func in self.constraints)
+        clinicians = list(self.clinicians.values())
+
+        if 'minMaxBlocks' in keys:
+            for div in self.divisions.values():
+                for name, (min_, _) in div.bound_dict.items():
+                    if min_ > 0:
+                        row = set((name, div.name, b) for b in range(1, self.num_blocks + 1))
+                        yield ('minMaxBlocks', name, min_, row, set(), 'the blocks of division {}'.format(div.name))
+
+        rows = [('balancedWeekends', list(range(1, self.num_weekends + 1)), 'the weekends')]
+        if long_weekends:
+            rows.append(('balancedLongWeekends', long_weekends, 'the long weekends'))
+        for key, weeks, what in rows:
+            if key not in keys or not clinicians: continue
+            if key == 'balancedWeekends':
+                past, counts = (self.carry.num_weekends, self.carry.weekends) if self.carry else (0, {})
+            else:
+                past, counts = (self.carry.num_long_weekends, self.carry.long_weekends) if self.carry else (0, {})
+            for name, (min_, _) in balance_bounds(clinicians, len(weeks), past, counts).items():
+                if min_ > 0:
+                    yield (key, name, min_, set(), set((name, w) for w in weeks), what)
+
     def _constraint_coverage(self, divisions=None, clinicians=None):
+        blocks = self.layout.block_index
         # no holes + no overlap over all divisions (BLOCKS)
-        for div in divisions:
-            for block_num in range(1, self.num_blocks + 1):
-                self.problem.add(
-                    pulp.lpSum(
-                        [_.get_var()
-                         for _ in div.get_vars_by_block_num(block_num)]
-                    ) == 1
-                )
+        # one row per (division, block), across all clinicians
+        self._add_rows(RowBlock.from_padded(
+            blocks.transpose(1, 2, 0), pulp.LpConstraintEQ, 1))
 
         # no holes + no overlap (WEEKENDS)
-        for week_num in range(1, self.num_weekends + 1):
-            vars_ = \
-                [_ for clinician in clinicians
-                    for _ in clinician.get_weekend_vars(
-                        lambda x, week_num=week_num: x.week_num == week_num
-                )
-                ]
-            self.problem.add(pulp.lpSum(
-                [_.get_var() for _ in vars_]) == 1)
+        self._add_rows(RowBlock.from_padded(
+            self.layout.weekend_index.T, pulp.LpConstraintEQ, 1))
 
     def _constraint_minmax_blocks(self, divisions=None, clinicians=None):
-        # mins/maxes per division
-        for div in divisions:
-            for clinician in div.clinicians:
-                (min_, max_) = div.bound_dict[clinician.name]
-                sum_ = pulp.lpSum(
-                    [_.get_var() for _ in div.get_vars_by_name(clinician.name)])
-                self.problem.add(sum_ <= max_)
-                self.problem.add(sum_ >= min_)
+        layout = self.layout
+        # mins/maxes per division, one row per (clinician, division) pair
+        mask = layout.coverage_mask()
+        cols = layout.block_index[mask]
+        self._add_rows(RowBlock.from_padded(
+            cols, pulp.LpConstraintLE, layout.max_blocks[mask]))
+        self._add_rows(RowBlock.from_padded(
+            cols, pulp.LpConstraintGE, layout.min_blocks[mask]))
 
     def _constraint_consec_blocks(self, divisions=None, clinicians=None):
-        for clinician in clinicians:
-            for block_num in range(1, self.num_blocks):
-                # if a clinician works a given block, they should not work any
-                # adjacent block (even in a different division)
-                sum_ = pulp.lpSum(
-                    [_.get_var() for _ in clinician.get_block_vars(
-                        lambda x, block_num=block_num: x.block_num in (block_num, block_num + 1))]
-                )
-                self.problem.add(sum_ <= 1)
+        blocks = self.layout.block_index
+        # if a clinician works a given block, they should not work any
+        # adjacent block (even in a different division)
+        # cols[c, b] = blocks b and b + 1 of clinician c, across all divisions
+        cols = np.concatenate((blocks[:, :, :-1], blocks[:, :, 1:]), axis=1)
+        self._add_rows(RowBlock.from_padded(
+            cols.transpose(0, 2, 1), pulp.LpConstraintLE, 1, nums=np.arange(1, self.num_blocks)))
+
+        # nor the first block, if they worked the last block before the schedule
+        carried = self._carried_positions('last_block')
+        if len(carried):
+            self._add_rows(RowBlock.from_padded(blocks[carried, :, 0], pulp.LpConstraintLE, 0, nums=1))
+
+        # the compact helpers already cover all divisions of a block
+        if (self.get_formulation('preventConsecutiveBlocks') == 'pairwise' or self._compact_adjacency() or
+                self.num_blocks < 2):
+            return
+
+        # the rows above also keep a clinician from working two divisions in
+        # the same block, so at most one of the block-adjacent weekend helpers
+        # of a block can be set, and only if the clinician works that weekend:
+        #   H[c, 1, b] + ... + H[c, D, b] <= X[c, w(b)]
+        # on their own, the helper <= weekend rows allow one helper per
+        # division, which makes the relaxation of the adjacency objective
+        # very weak
+        layout = self.layout
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        helpers = layout.adjacency_index.transpose(0, 2, 1)
+        cols = np.concatenate((helpers, layout.weekend_index[:, weeks - 1, None]), axis=-1)
+        coefs = np.concatenate((np.ones(helpers.shape[-1]), [-1]))
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, 0, coefs=coefs,
+                                            nums=np.arange(1, self.num_blocks + 1)))
 
     def _constraint_consec_weekends(self, divisions=None, clinicians=None):
-        for clinician in clinicians:
-            for week_num in range(1, self.num_weekends):
-                    sum_ = pulp.lpSum(
-                        [_.get_var() for _ in clinician.get_weekend_vars(
-                            lambda x, week_num=week_num: x.week_num in (
-                                week_num, week_num + 1)
-                        )]
-                    )
-                    self.problem.add(sum_ <= 1)
+        weekends = self.layout.weekend_index
+        cols = np.stack((weekends[:, :-1], weekends[:, 1:]), axis=-1)
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, 1, nums=np.arange(1, self.num_weekends)))
+
+        carried = self._carried_positions('last_weekend')
+        if len(carried):
+            self._add_rows(RowBlock.from_padded(weekends[carried, :1], pulp.LpConstraintLE, 0, nums=1))
+
+    def _constraint_hard_timeoff(self, divisions=None, clinicians=None):
+        # clinicians cannot work their blocks/weekends off. presolve leaves
+        # these columns out, so rows are only added for the columns it keeps
+        layout = self.layout
+        blocks_off, weekends_off = self._timeoff_masks(self.clinicians.values())
+        blocks_off = np.broadcast_to(blocks_off[:, None, :], layout.block_index.shape)
+
+        cols = np.concatenate((layout.block_index[blocks_off], layout.weekend_index[weekends_off]))
+        self._add_rows(RowBlock.from_padded(cols[:, None], pulp.LpConstraintLE, 0))
 
     def _constraint_spread_blocks(self, divisions=None, clinicians=None):
         # on-off-on-off-on constraint for block assignment
-        # we need at least 5 consecutive blocks to implement this constraint
-        if self.num_blocks < 5: return
+        # with the lazy formulation, rows are only added once a solution
+        # violates them, see `_add_lazy_rows`
+        windows = self._spread_blocks_windows()
+        if windows is None or self.get_formulation('spreadBlocks') == 'lazy': return
 
-        for clinician in clinicians:
-            for block_num in range(1, self.num_blocks - 3):
-                # constraint: X_i + X_{i+2} + X_{i+4} <= 2
-                sum_ = pulp.lpSum(
-                    [_.get_var() for _ in clinician.get_block_vars(
-                        lambda x, block_num=block_num: x.block_num in (block_num, block_num + 2, block_num + 4))]
-                )
-                self.problem.add(sum_ <= 2)
+        cols, rhs = windows
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, rhs))
 
     def _constraint_spread_weekends(self, divisions=None, clinicians=None):
-        # spreading out weekend assignments
+        # spreading out weekend assignments, see `_constraint_spread_blocks`
+        windows = self._spread_weekends_windows()
+        if windows is None or self.get_formulation('spreadWeekends') == 'lazy': return
+
+        cols, rhs = windows
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, rhs))
+
+    def _spread_blocks_windows(self):
+        # we need at least 5 consecutive blocks to implement this constraint
+        if self.num_blocks < 5: return None
+
+        # constraint: X_i + X_{i+2} + X_{i+4} <= 2
+        # cols[c, i] = blocks i, i + 2 and i + 4 of clinician c, across all divisions
+        blocks = self.layout.block_index
+        n = self.num_blocks - 4
+        cols = np.concatenate([blocks[:, :, k:k + n] for k in (0, 2, 4)], axis=1)
+        return cols.transpose(0, 2, 1), 2
+
+    def _spread_weekends_windows(self):
         # needs at least 4 weekends
-        if self.num_weekends < 4: return
+        if self.num_weekends < 4: return None
 
-        for clinician in clinicians:
-            for week_num in range(1, self.num_weekends - 2):
-                # constraint: X_i + X_{i+1} + X_{i+2} + X_{i+3} <= 1
-                sum_ = pulp.lpSum(
-                    [_.get_var() for _ in clinician.get_weekend_vars(
-                        lambda x, week_num=week_num: x.week_num in list(range(week_num, week_num + 4))
-                    )]
-                )
-                self.problem.add(sum_ <= 1)
+        # constraint: X_i + X_{i+1} + X_{i+2} + X_{i+3} <= 1
+        weekends = self.layout.weekend_index
+        n = self.num_weekends - 3
+        return np.stack([weekends[:, k:k + n] for k in range(4)], axis=-1), 1
+
+    def _add_lazy_rows(self):
+        """
+        Adds the rows of the lazy constraint families (see `LAZY_WINDOWS`)
+        that the current solution violates. Returns the number of rows added.
+        """
+        values = self.variables.values
+        num_rows = 0
+        for key, windows in Scheduler.LAZY_WINDOWS.items():
+            func = Scheduler.CONSTRAINT_MAPPING[key]
+            if func not in self.constraints or self.get_formulation(key) != 'lazy': continue
+            windows = windows(self)
+            if windows is None: continue
+
+            # one row per window, padded with -1. fixing a window tends to
+            # move the violation to a neighbouring window of the same
+            # clinician, so all windows of a violating clinician are added
+            cols, rhs = windows
+            taken = np.where(cols >= 0, values[cols], 0).sum(axis=-1)
+            violated = cols[(taken > rhs + 1e-6).any(axis=1)].reshape(-1, cols.shape[-1])
+            if not len(violated): continue
+
+            with self._stage(self._family_name(func)):
+                self._add_rows(RowBlock.from_padded(violated, pulp.LpConstraintLE, rhs))
+            num_rows += len(violated)
+        return num_rows
 
     def _constraint_balance_longweekends(self, divisions=None, clinicians=None):
-        if self.long_weekends:
-            # (roughly) equal distribution of long weekends
-            max_long_weekends = math.ceil(
-                len(self.long_weekends) / len(self.clinicians))
-            min_long_weekends = math.floor(
-                len(self.long_weekends) / len(self.clinicians))
-            for clinician in clinicians:
-                sum_ = pulp.lpSum(
-                    [_.get_var() for _ in clinician.get_weekend_vars(
-                        lambda x, l=self.long_weekends: x.week_num in l
-                    )]
-                )
-                self.problem.add(sum_ <= max_long_weekends)
-                self.problem.add(sum_ >= min_long_weekends)
+        weeks = np.array(sorted(
+            w for w in set(self.long_weekends) if 1 <= w <= self.num_weekends
+        ), dtype=np.int64)
+        if len(weeks):
+            # (roughly) equal distribution of long weekends, counting the
+            # long weekends worked before the schedule
+            total = len(weeks) + (self.carry.num_long_weekends if self.carry else 0)
+            done = self._carried_counts('long_weekends')
+            max_long_weekends = np.maximum(math.ceil(total / len(self.clinicians)) - done, 0)
+            min_long_weekends = np.maximum(math.floor(total / len(self.clinicians)) - done, 0)
+
+            cols = self.layout.weekend_index[:, weeks - 1]
+            self._add_rows(RowBlock.from_padded(
+                cols, pulp.LpConstraintLE, max_long_weekends))
+            self._add_rows(RowBlock.from_padded(
+                cols, pulp.LpConstraintGE, min_long_weekends))
 
     def _constraint_balance_weekends(self, divisions=None, clinicians=None):
-        # (roughly) equal distribution of weekends
-        max_weekends = math.ceil(
-            self.num_weekends / len(clinicians)
+        # (roughly) equal distribution of weekends, counting the weekends
+        # worked before the schedule
+        total = self.num_weekends + (self.carry.num_weekends if self.carry else 0)
+        done = self._carried_counts('weekends')
+        max_weekends = np.maximum(math.ceil(
+            total / len(clinicians)
+        ) - done, 0)
+        min_weekends = np.maximum(math.floor(
+            total / len(clinicians)
+        ) - done, 0)
+
+        cols = self.layout.weekend_index
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, max_weekends))
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintGE, min_weekends))
+
+    def _carried_counts(self, kind):
+        """
+        Returns the number of `kind` assignments (an attribute of `carry`)
+        of each clinician before the schedule, in model order.
+        """
+        counts = getattr(self.carry, kind, {})
+        return np.array([counts.get(name, 0) for name in self.layout.clinicians], dtype=np.int64)
+
+    def _carried_positions(self, kind):
+        """
+        Returns the model positions of the clinicians in the `kind` set of
+        `carry` (e.g. the clinicians who worked the last block before the
+        schedule).
+        """
+        names = getattr(self.carry, kind, ())
+        return np.array(sorted(
+            self.layout.clinician_pos(name) for name in names if name in self.clinicians
+        ), dtype=np.int64)
+
+    def _find_symmetry_classes(self, clinicians):
+        """
+        Groups the clinicians into classes of interchangeable clinicians,
+        i.e. with the same divisions, min/max bounds, blocks/weekends off and
+        carried assignments.
+        Returns the classes with more than one clinician, as lists of
+        clinician positions in model order.
+        """
+        layout = self.layout
+        classes = OrderedDict()
+        for c, clinician in sorted((layout.clinician_pos(_.name), _) for _ in clinicians):
+            key = (
+                tuple(layout.coverage_mask()[c].tolist()),
+                tuple(layout.min_blocks[c].tolist()), tuple(layout.max_blocks[c].tolist()),
+                tuple(sorted(b for b in set(clinician.blocks_off) if 1 <= b <= self.num_blocks)),
+                tuple(sorted(w for w in set(clinician.weekends_off) if 1 <= w <= self.num_weekends)),
+                self._carry_key(clinician.name)
+            )
+            classes.setdefault(key, []).append(c)
+        return [_ for _ in classes.values() if len(_) > 1]
+
+    def _timeoff_key(self):
+        """
+        Returns a key describing the blocks/weekends off of all clinicians.
+        """
+        return tuple(
+            (name, tuple(sorted(set(_.blocks_off))), tuple(sorted(set(_.weekends_off))))
+            for name, _ in sorted(self.clinicians.items())
         )
-        min_weekends = math.floor(
-            self.num_weekends / len(clinicians)
+
+    def _carry_key(self, name=None):
+        """
+        Returns a key describing what `carry` holds for the given clinician,
+        or for all clinicians.
+        """
+        if self.carry is None: return None
+        if name is None:
+            return (self.carry.num_weekends, self.carry.num_long_weekends,
+                    tuple(self._carry_key(_) for _ in sorted(self.clinicians)))
+        return (
+            self.carry.weekends.get(name, 0), self.carry.long_weekends.get(name, 0),
+            name in self.carry.last_block, name in self.carry.last_weekend
         )
 
-        for clinician in clinicians:
-            sum_ = pulp.lpSum(
-                [_.get_var() for _ in clinician.get_weekend_vars()]
-            )
-            self.problem.add(sum_ <= max_weekends)
-            self.problem.add(sum_ >= min_weekends)
+    def _break_symmetry(self, clinicians):
+        # any schedule stays feasible, with the same objective value, when
+        # interchangeable clinicians swap their assignments. to keep the
+        # solver from exploring all of these copies, the clinicians of each
+        # class are ordered by their first weekend:
+        #   X[c_i+1, t] <= X[c_i, 1] + ... + X[c_i, t - 1]
+        # i.e. the next clinician of a class can only work a weekend once
+        # the previous clinician has worked an earlier one. the rows are
+        # only added for the first weekends (as many as clinicians in the
+        # class), which is where the first weekends of a class fall.
+        # weekends are only disjoint with coverage, otherwise first weekends
+        # may be equal
+        self._symmetry_classes = self._find_symmetry_classes(clinicians)
+        strict = Scheduler._constraint_coverage in self.constraints
+
+        blocks = []
+        for members in self._symmetry_classes:
+            n = min(len(members), self.num_weekends)
+            weekends = self.layout.weekend_index[:, :n]
+            earlier = np.tril(np.ones((n, n), dtype=bool), -1 if strict else 0)
+            previous = np.where(earlier, weekends[members[:-1], None, :], -1)
+            cols = np.concatenate((weekends[members[1:], :, None], previous), axis=-1)
+            coefs = np.concatenate(([1], np.full(n, -1)))
+            blocks.append(RowBlock.from_padded(cols, pulp.LpConstraintLE, 0, coefs=coefs))
+        if blocks:
+            self._add_rows(RowBlock.concat(blocks))
 
     def _build_adjacency_variables(self, divisions):
         # block-adjacent weekends
@@ -561,101 +1829,229 @@ class Scheduler:
         #
         # note: maximizing a product of variables is NOT a linear program
         # which is precisely why we need a helper variable.
+        # a helper is removed with its block or weekend
+        if self._compact_adjacency():
+            self._build_compact_adjacency_variables()
+            return
+
+        layout = self.layout
         for div in divisions:
+            d = layout.division_pos(div.name)
             for clinician in div.clinicians:
+                c = layout.clinician_pos(clinician.name)
                 for block_num in range(1, self.num_blocks + 1):
                     week_num = block_num * BLOCK_SIZE - 1
+                    if layout.block_index[c, d, block_num - 1] < 0 or layout.weekend_index[c, week_num - 1] < 0:
+                        layout.adjacency_index[c, d, block_num - 1] = ModelLayout.REMOVED
+                        continue
+                    layout.adjacency_index[c, d, block_num - 1] = self._add_column(
+                        AdjacencyVariable(clinician, block_num, div.name, week_num)
+                    )
+
+        # helper <= block, helper <= weekend
+        helpers = layout.adjacency_index
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        adjacent_weekends = np.broadcast_to(
+            layout.weekend_index[:, None, weeks - 1], helpers.shape)
+
+        for other in (layout.block_index, adjacent_weekends):
+            self._add_rows(RowBlock.from_padded(
+                np.stack((helpers, np.where(helpers >= 0, other, -1)), axis=-1), pulp.LpConstraintLE, 0,
+                coefs=(1, -1)
+            ))
+
+    def _build_compact_adjacency_variables(self):
+        # with the consecutive blocks rows, a clinician works at most one
+        # division per block, so a single helper per (clinician, block)
+        # covers all divisions:
+        #   H[c, b] <= B[c, 1, b] + ... + B[c, D, b],    H[c, b] <= X[c, w(b)]
+        # which cuts the helpers and their rows by the number of divisions
+        layout = self.layout
+        shape = (len(layout.clinicians), 1, self.num_blocks)
+        layout.adjacency_index = np.full(shape, -1, dtype=np.int64)
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        covered = (layout.block_index >= 0).any(axis=1)
+        present = (layout.block_index != -1).any(axis=1)
+
+        for clinician in self.clinicians.values():
+            c = layout.clinician_pos(clinician.name)
+            for block_num in range(1, self.num_blocks + 1):
+                week_num = block_num * BLOCK_SIZE - 1
+                if not present[c, block_num - 1]: continue
+                if not covered[c, block_num - 1] or layout.weekend_index[c, week_num - 1] < 0:
+                    layout.adjacency_index[c, 0, block_num - 1] = ModelLayout.REMOVED
+                    continue
+                layout.adjacency_index[c, 0, block_num - 1] = self._add_column(
+                    AdjacencyVariable(clinician, block_num, None, week_num)
+                )
 
-                    block_var = clinician.get_block_vars(
-                        lambda x, d=div.name, b=block_num:
-                            x.block_num == b and
-                            x.division == d
-                    )[0].get_var()
-                    weekend_var = clinician.get_weekend_vars(
-                        lambda x, w=week_num: x.week_num == w)[0].get_var()
-
-                    var_ = Variable(
-                        '{}_adjacency,div_{},block_{}__weekend_{}'.format(
-                            clinician.name,
-                            div.name,
-                            block_num,
-                            week_num
-                        ),
-                        0, 1)
-                    clinician.add_var(var_)
-                    self.problem.add(var_.get_var() <= block_var)
-                    self.problem.add(var_.get_var() <= weekend_var)
+        helpers = layout.adjacency_index[:, 0, :]
+        blocks = np.where(helpers[:, None, :] >= 0, layout.block_index, -1)
+        cols = np.concatenate((helpers[:, None, :], blocks), axis=1).transpose(0, 2, 1)
+        coefs = np.concatenate(([1], np.full(blocks.shape[1], -1)))
+        self._add_rows(RowBlock.from_padded(cols, pulp.LpConstraintLE, 0, coefs=coefs))
+
+        weekends = np.where(helpers >= 0, layout.weekend_index[:, weeks - 1], -1)
+        self._add_rows(RowBlock.from_padded(
+            np.stack((helpers, weekends), axis=-1), pulp.LpConstraintLE, 0, coefs=(1, -1)))
+
+    def _compact_adjacency(self):
+        """
+        Returns whether the block-adjacent weekend helpers are built with
+        the compact formulation, which needs the consecutive blocks rows to
+        keep clinicians from working two divisions in the same block.
+        """
+        return (self.get_formulation('preventConsecutiveBlocks') == 'compact' and
+                Scheduler._constraint_consec_blocks in self.constraints and
+                not (self.elastic and 'preventConsecutiveBlocks' in Scheduler.ELASTIC_CONSTRAINTS))
 
     def _build_adjacency_objective(self, clinicians):
-        adjacency_vars = []
-        for clinician in clinicians:
-            adjacency_vars.extend(
-                [_.get_var() for _ in clinician.get_vars(
-                    lambda x: 'adjacency' in x.name
-                )]
-            )
-        return pulp.lpSum(adjacency_vars)
+        obj = np.zeros(self.layout.num_cols)
+        obj[self.layout.adjacency_index[self.layout.adjacency_index >= 0]] = 1
+        return obj
 
     def _build_weekend_objective(self, clinicians):
-        wa_variables = []
-        for clinician in clinicians:
-            wa_variables.extend(
-                [_.get_var() for _ in clinician.get_weekend_vars(
-                    lambda x, clinician=clinician: x.week_num not in clinician.weekends_off)
-                 ]
-            )
-
-            wa_variables.extend(
-                [-_.get_var() for _ in clinician.get_weekend_vars(
-                    lambda x, clinician=clinician: x.week_num in clinician.weekends_off)
-                 ]
-            )
+        layout = self.layout
+        _, weekends_off = self._timeoff_masks(clinicians)
 
-        return pulp.lpSum(wa_variables)
+        # +1 for each weekend assignment, -1 if it conflicts with a request
+        mask = layout.weekend_index >= 0
+        obj = np.zeros(layout.num_cols)
+        obj[layout.weekend_index[mask]] = np.where(weekends_off, -1, 1)[mask]
+        return obj
 
     def _build_block_objective(self, clinicians):
-        ba_variables = []
+        layout = self.layout
+        blocks_off, _ = self._timeoff_masks(clinicians)
+
+        # +1 for each block assignment, -1 if it conflicts with a request
+        mask = layout.block_index >= 0
+        coefs = np.broadcast_to(np.where(blocks_off, -1, 1)[:, None, :], mask.shape)
+        obj = np.zeros(layout.num_cols)
+        obj[layout.block_index[mask]] = coefs[mask]
+        return obj
+
+    def _timeoff_masks(self, clinicians):
+        """
+        Returns a clinician x block and a clinician x week boolean array in
+        model order, true where one of `clinicians` requested the block or
+        weekend off.
+        """
+        layout = self.layout
+        blocks_off = np.zeros((len(layout.clinicians), self.num_blocks), dtype=bool)
+        weekends_off = np.zeros(layout.weekend_index.shape, dtype=bool)
         for clinician in clinicians:
-            ba_variables.extend(
-                [_.get_var() for _ in clinician.get_block_vars(
-                    lambda x, clinician=clinician: x.block_num not in clinician.blocks_off)
-                 ]
-            )
+            c = layout.clinician_pos(clinician.name)
+            blocks = [b for b in set(clinician.blocks_off) if 1 <= b <= self.num_blocks]
+            weeks = [w for w in set(clinician.weekends_off) if 1 <= w <= self.num_weekends]
+            blocks_off[c, np.array(blocks, dtype=np.int64) - 1] = True
+            weekends_off[c, np.array(weeks, dtype=np.int64) - 1] = True
+        return blocks_off, weekends_off
+
+    def get_solution(self):
+        """
+        Returns the current solution in the layout of the model: a
+        clinician x division x block and a clinician x week boolean array,
+        true where the clinician is assigned the block or weekend.
+        """
+        layout = self.layout
+        assigned = self.variables.values > 0.5
+        blocks = np.where(layout.block_index >= 0, assigned[layout.block_index], False)
+        weekends = np.where(layout.weekend_index >= 0, assigned[layout.weekend_index], False)
+        return blocks, weekends
+
+    def log_conflicts(self):
+        """
+        Logs the blocks and weekends off that the current solution assigns
+        to each clinician, and the number of block-adjacent weekends.
+        """
+        layout = self.layout
+        blocks, weekends = self.get_solution()
+        blocks_off, weekends_off = self._timeoff_masks(self.clinicians.values())
+        block_conflicts = np.count_nonzero(blocks & blocks_off[:, None, :], axis=(1, 2))
+        weekend_conflicts = np.count_nonzero(weekends & weekends_off, axis=1)
 
-            ba_variables.extend(
-                [-_.get_var() for _ in clinician.get_block_vars(
-                    lambda x, clinician=clinician: x.block_num in clinician.blocks_off)
-                 ]
+        conflicts_str = 'Schedule Conflicts:'
+        for clinician in self.clinicians.values():
+            c = layout.clinician_pos(clinician.name)
+            conflicts_str += ' {0} ({1}/{2} blocks, {3}/{4} weekends)'.format(
+                clinician.name, block_conflicts[c], len(clinician.blocks_off),
+                weekend_conflicts[c], len(clinician.weekends_off)
             )
+        self._logger.write_line(conflicts_str)
 
-        return pulp.lpSum(ba_variables)
+        # the weekend of the second week of each block
+        weeks = np.arange(1, self.num_blocks + 1) * BLOCK_SIZE - 1
+        adjacent = blocks.any(axis=1) & weekends[:, weeks - 1]
+        self._logger.write_line('Block-adjacent weekends: {} of {} blocks'.format(
+            np.count_nonzero(adjacent), np.count_nonzero(blocks)))
 
     def assign_schedule(self):
         """
-        Assigns blocks and weekends to clinicians using the results of
-        the LP program solution.
+        Builds the schedule from the current solution of the program, in
+        the form returned by `generate`, and keeps it in `self.schedule`.
         """
-        for div in self.divisions.values():
-            for block_num in range(1, self.num_blocks + 1):
-                assignments = list(filter(lambda x: x.get_value(
-                ) == 1.0, div.get_vars_by_block_num(block_num)))
+        layout = self.layout
+        blocks, weekends = self.get_solution()
 
-                for _ in range(BLOCK_SIZE):
-                    div.assignments.extend(
-                        [__.clinician for __ in assignments]
-                    )
+        divAssignments = {}
+        for d, div_name in enumerate(layout.divisions):
+            # the assigned (block, clinician) pairs, in block order
+            block_pos, clin_pos = np.nonzero(blocks[:, d, :].T)
+            splits = np.cumsum(np.bincount(block_pos, minlength=self.num_blocks))[:-1]
+            divAssignments[div_name] = []
+            for group in np.split(clin_pos, splits):
+                divAssignments[div_name].extend([layout.clinicians[c] for c in group.tolist()] * BLOCK_SIZE)
 
-        for clinician in self.clinicians.values():
-            vars_ = clinician.get_weekend_vars(lambda x: x.get_value() == 1.0)
-            clinician.weekends_assigned = [_.week_num for _ in vars_]
+        weekendAssignments = [None] * self.num_weekends
+        for c, w in zip(*np.nonzero(weekends)):
+            weekendAssignments[w] = layout.clinicians[c]
+
+        self.schedule = (divAssignments, weekendAssignments, self.holiday_map)
+        return self.schedule
 
     CONSTRAINT_MAPPING = {
         'coverage': _constraint_coverage,
         'minMaxBlocks': _constraint_minmax_blocks,
         'preventConsecutiveBlocks': _constraint_consec_blocks,
         'preventConsecutiveWeekends': _constraint_consec_weekends,
-        # 'spreadBlocks': _constraint_spread_blocks,
-        # 'spreadWeekends': _constraint_spread_weekends,
+        'spreadBlocks': _constraint_spread_blocks,
+        'spreadWeekends': _constraint_spread_weekends,
         'balancedLongWeekends': _constraint_balance_longweekends,
-        'balancedWeekends': _constraint_balance_weekends
+        'balancedWeekends': _constraint_balance_weekends,
+        'hardTimeOff': _constraint_hard_timeoff
+    }
+
+    # row formulations of each constraint that has several, the first one is
+    # the default. 'tight' adds rows that tighten the relaxation, 'pairwise'
+    # only forbids each pair of consecutive blocks, and 'compact' uses one
+    # block-adjacent weekend helper per clinician and block across all
+    # divisions, instead of one per division. 'full' adds all window
+    # rows up front, 'lazy' only adds the rows that solutions violate (CBC
+    # is usually faster with all rows, the re-solves cost more than the rows)
+    CONSTRAINT_FORMULATIONS = {
+        'preventConsecutiveBlocks': ('tight', 'pairwise', 'compact'),
+        'spreadBlocks': ('full', 'lazy'),
+        'spreadWeekends': ('full', 'lazy')
+    }
+
+    # the constraints whose rows get a penalized slack column in elastic
+    # mode. the objective lies within [-1, 1], so each unit of violation
+    # outweighs any gain in the objective
+    ELASTIC_CONSTRAINTS = (
+        'minMaxBlocks', 'preventConsecutiveBlocks', 'preventConsecutiveWeekends',
+        'balancedLongWeekends', 'balancedWeekends'
+    )
+    ELASTIC_PENALTY = 10
+
+    # the share of the time limit that the block stage of a two-stage solve
+    # may use, the weekend stage gets the rest. with the blocks fixed, the
+    # weekends solve quickly
+    TWO_STAGE_SHARE = 0.8
+
+    # the windows (one row per window, and the right hand side) of each
+    # constraint with a lazy formulation
+    LAZY_WINDOWS = {
+        'spreadBlocks': _spread_blocks_windows,
+        'spreadWeekends': _spread_weekends_windows
     }
@@ -0,0 +1,661 @@
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from fractions import Fraction
+from functools import reduce
+from math import gcd
+
+import numpy as np
+import pulp
+
+try:
+    import highspy
+except ImportError:
+    # optional, only needed by `HighsSolver`
+    highspy = None
+
+try:
+    from ortools.sat.python import cp_model
+except ImportError:
+    # optional, only needed by `CpSatSolver`
+    cp_model = None
+
+# solver key -> display name
+SOLVER_NAMES = OrderedDict([
+    ('cbc', 'CBC'),
+    ('highs', 'HiGHS'),
+    ('cpsat', 'CP-SAT')
+])
+
+
+class SolveCancelled(Exception):
+    """
+    Raised by a solve that was cancelled with its `CancelToken`.
+    """
+
+
+class CancelToken:
+    """
+    Cancels a running solve from another thread. The solver processes
+    registered with the token are terminated when it is cancelled, and the
+    scheduler checks the token between the stages of the run (see `check`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._processes = set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Cancels the solve, terminating its running solver processes.
+        """
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            process.kill()
+
+    def check(self):
+        """
+        Raises `SolveCancelled` if the solve was cancelled.
+        """
+        if self._cancelled:
+            raise SolveCancelled('The solve was cancelled')
+
+    @contextmanager
+    def process(self, process):
+        """
+        Registers `process` for the enclosed block, terminating it right
+        away if the solve was already cancelled.
+        """
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._cancelled
+        if cancelled:
+            process.kill()
+        try:
+            yield process
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+
+class SolveResult:
+    """
+    The outcome of solving a compiled program.
+
+    Attributes:
+        status (int): The `pulp` status code of the solve (e.g. `pulp.LpStatusOptimal`),
+            `pulp.LpStatusNotSolved` if the solve budget ran out
+        values (numpy.ndarray): The value of each column, or `None` if no
+            solution is available. If the budget ran out, this is the best
+            solution found so far
+        objective (float): The objective value of the solution
+        solution_time (float): The wall time spent by the solver, in seconds
+        io_time (float): The wall time spent writing the model and reading
+            the solution back, in seconds
+        gap (float): The proven relative gap of the solution, or `None` if unknown
+    """
+
+    def __init__(self, status, values=None, objective=None, solution_time=0.0, io_time=0.0, gap=None):
+        self.status = status
+        self.values = values
+        self.objective = objective
+        self.solution_time = solution_time
+        self.io_time = io_time
+        self.gap = gap
+
+
+class SolveBudget:
+    """
+    Limits on a single solve. When a limit is hit, the solver stops and the
+    best solution found so far is returned.
+
+    Attributes:
+        threads (int): The number of threads / parallel search workers, 0 to
+            use the solver default (all cores for CP-SAT)
+        time_limit (float): The wall clock limit in seconds, or `None`
+        gap_rel (float): The relative gap at which the search stops, or `None`
+        gap_abs (float): The absolute gap at which the search stops, or `None`
+    """
+
+    def __init__(self, threads=0, time_limit=None, gap_rel=None, gap_abs=None):
+        self.threads = threads
+        self.time_limit = time_limit
+        self.gap_rel = gap_rel
+        self.gap_abs = gap_abs
+
+    def remaining(self, elapsed):
+        """
+        Returns the budget that is left after `elapsed` seconds of it were
+        spent, with a time limit of at least 0.
+        """
+        if self.time_limit is None: return self
+        return SolveBudget(self.threads, max(self.time_limit - elapsed, 0.0), self.gap_rel, self.gap_abs)
+
+    def exhausted(self):
+        """
+        Returns whether no time is left.
+        """
+        return self.time_limit is not None and self.time_limit <= 0
+
+
+class CbcSolver:
+    """
+    Solves a compiled `ModelMatrix` with the CBC executable. The MPS file
+    is streamed straight from the model arrays and the solution file is
+    parsed back into a vector of column values.
+
+    Attributes:
+        path (str): The path to the CBC executable
+        msg (bool): Whether to show the solver output
+        budget (SolveBudget): The limits of the solve
+        seed (int): The random seed of the solver, or `None` for the default
+        cancel (CancelToken): An optional token that terminates the CBC
+            process, in which case `solve` raises `SolveCancelled`
+        on_line (callable): An optional callable that receives each line of
+            the CBC output
+    """
+
+    # first word of the CBC solution file -> pulp status
+    STATUS = {
+        'Optimal': pulp.LpStatusOptimal,
+        'Infeasible': pulp.LpStatusInfeasible,
+        'Integer': pulp.LpStatusInfeasible,
+        'Unbounded': pulp.LpStatusUnbounded,
+        'Stopped': pulp.LpStatusNotSolved
+    }
+
+    def __init__(self, path, msg=True, budget=None, seed=None, cancel=None, on_line=None):
+        self.path = path
+        self.msg = msg
+        self.budget = budget or SolveBudget()
+        self.seed = seed
+        self.cancel = cancel
+        self.on_line = on_line
+
+    def __getstate__(self):
+        # the parts of a decomposed solve run in worker processes, which
+        # can neither be cancelled nor report back through callbacks
+        return dict(self.__dict__, cancel=None, on_line=None)
+
+    def solve(self, matrix, start=None):
+        """
+        Solves `matrix` and returns a `SolveResult`. `start` is an optional
+        vector of column values handed to CBC as a MIP start.
+        """
+        tmpdir = tempfile.mkdtemp(prefix='scheduler-')
+        mps_path = os.path.join(tmpdir, 'scheduler.mps')
+        mst_path = os.path.join(tmpdir, 'scheduler.mst')
+        sol_path = os.path.join(tmpdir, 'scheduler.sol')
+
+        try:
+            begin = time.time()
+            col_names = matrix.write_mps(mps_path, rename=True)
+            if start is not None:
+                CbcSolver.write_start(mst_path, col_names, start)
+            io_time = time.time() - begin
+
+            cmd = [self.path, mps_path, '-max' if matrix.maximize else '-min']
+            if start is not None:
+                cmd += ['-mips', mst_path]
+            cmd += CbcSolver.budget_options(self.budget)
+            if self.seed is not None:
+                cmd += ['-randomSeed', str(self.seed), '-randomCbcSeed', str(self.seed)]
+            cmd += [
+                '-timeMode', 'elapsed', '-solve', '-printingOptions', 'all',
+                '-solution', sol_path
+            ]
+
+            # the log is needed for the gap, echo it while CBC runs
+            begin = time.time()
+            log = []
+            process = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+            with self.cancel.process(process) if self.cancel is not None else nullcontext():
+                for line in process.stdout:
+                    log.append(line)
+                    if self.msg: sys.stdout.write(line)
+                    if self.on_line is not None: self.on_line(line.rstrip())
+                process.wait()
+            solution_time = time.time() - begin
+            if self.cancel is not None:
+                self.cancel.check()
+
+            if not os.path.exists(sol_path):
+                raise pulp.PulpSolverError('CBC did not produce a solution file: {}'.format(sol_path))
+            begin = time.time()
+            status, values = CbcSolver.read_solution(sol_path, matrix.num_cols)
+            io_time += time.time() - begin
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        gap = CbcSolver.read_gap(log)
+        if status == pulp.LpStatusOptimal and gap is None:
+            gap = 0.0
+        elif status == pulp.LpStatusNotSolved and gap is None:
+            # stopped without an integer solution, the values are the relaxation
+            values = None
+        elif status != pulp.LpStatusNotSolved and status != pulp.LpStatusOptimal:
+            values = None
+
+        objective = float(matrix.objective.dot(values)) if values is not None else None
+        return SolveResult(status, values, objective, solution_time, io_time, gap)
+
+    @staticmethod
+    def budget_options(budget):
+        """
+        Returns the CBC command line options for the supplied `SolveBudget`.
+        """
+        options = []
+        if budget.threads:
+            options += ['-threads', str(budget.threads)]
+        if budget.time_limit is not None:
+            options += ['-sec', str(budget.time_limit)]
+        if budget.gap_rel is not None:
+            options += ['-ratio', str(budget.gap_rel)]
+        if budget.gap_abs is not None:
+            options += ['-allow', str(budget.gap_abs)]
+        return options
+
+    @staticmethod
+    def read_gap(lines):
+        """
+        Parses the proven relative gap of the best integer solution from
+        the lines of a CBC log. Returns `None` if CBC did not report an
+        integer solution.
+        """
+        best, abs_gap = None, 0.0
+        for line in lines:
+            match = re.search(r'Exiting as integer gap of (\S+)', line)
+            if match:
+                abs_gap = float(match.group(1))
+                continue
+
+            match = re.search(
+                r'(?:Search completed|Partial search) - best objective ([^\s,]+),? (?:\(best possible ([^\s,)]+)\))?', line)
+            if match:
+                best = float(match.group(1))
+                if match.group(2) is not None:
+                    abs_gap = abs(best - float(match.group(2)))
+
+        # CBC reports 1e+50 if there is no integer solution
+        if best is None or abs(best) >= 1e50:
+            return None
+        return abs_gap / max(abs(best), 1e-10)
+
+    @staticmethod
+    def write_start(path, col_names, values):
+        """
+        Writes a MIP start in the CBC solution file format, which is what
+        CBC expects for `-mips`.
+        """
+        with open(path, 'w') as f:
+            f.write('Stopped on time - objective value 0\n')
+            for j, (name, value) in enumerate(zip(col_names, values.tolist())):
+                f.write('{:>7} {} {:>15} {:>23}\n'.format(j, name, value, 0))
+
+    @staticmethod
+    def read_solution(path, num_cols):
+        """
+        Parses a CBC solution file written for a program with generic column
+        names. Returns the status and the vector of column values.
+        """
+        values = np.zeros(num_cols)
+        with open(path, 'r') as f:
+            status = CbcSolver.STATUS.get(f.readline().split()[0], pulp.LpStatusUndefined)
+
+            for line in f:
+                fields = line.split()
+                if fields[0] == '**':
+                    fields = fields[1:]
+                # skip rows, only columns have generic `C` names
+                if fields[1].startswith('C'):
+                    values[int(fields[1][1:])] = float(fields[2])
+
+        return status, values
+
+
+class HighsSolver:
+    """
+    Solves a compiled `ModelMatrix` in-process with HiGHS. The constraint
+    matrix is handed over from memory and the solution vector is read back
+    directly, without temporary files or a solver process.
+
+    Requires the optional `highspy` package.
+
+    Attributes:
+        msg (bool): Whether to show the solver output
+        budget (SolveBudget): The limits of the solve
+        seed (int): The random seed of the solver, or `None` for the default
+    """
+
+    # `highspy.HighsModelStatus` name -> pulp status
+    STATUS = {
+        'kOptimal': pulp.LpStatusOptimal,
+        'kInfeasible': pulp.LpStatusInfeasible,
+        'kUnboundedOrInfeasible': pulp.LpStatusInfeasible,
+        'kUnbounded': pulp.LpStatusUnbounded
+    }
+
+    def __init__(self, msg=True, budget=None, seed=None):
+        if highspy is None:
+            raise pulp.PulpSolverError('HiGHS is not available, please install the `highspy` package')
+        self.msg = msg
+        self.budget = budget or SolveBudget()
+        self.seed = seed
+
+    def solve(self, matrix, start=None):
+        """
+        Solves `matrix` and returns a `SolveResult`. `start` is an optional
+        vector of column values handed to HiGHS as a starting solution.
+        """
+        begin = time.time()
+        highs = highspy.Highs()
+        highs.setOptionValue('output_flag', bool(self.msg))
+        if self.budget.threads:
+            highs.setOptionValue('threads', int(self.budget.threads))
+        if self.budget.time_limit is not None:
+            highs.setOptionValue('time_limit', float(self.budget.time_limit))
+        if self.budget.gap_rel is not None:
+            highs.setOptionValue('mip_rel_gap', float(self.budget.gap_rel))
+        if self.budget.gap_abs is not None:
+            highs.setOptionValue('mip_abs_gap', float(self.budget.gap_abs))
+        if self.seed is not None:
+            highs.setOptionValue('random_seed', int(self.seed))
+        highs.passModel(HighsSolver.to_highs_lp(matrix))
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = start.tolist()
+            solution.value_valid = True
+            highs.setSolution(solution)
+        io_time = time.time() - begin
+
+        begin = time.time()
+        highs.run()
+        solution_time = time.time() - begin
+
+        model_status = highs.getModelStatus()
+        status = HighsSolver.STATUS.get(model_status.name, pulp.LpStatusNotSolved)
+        values, gap = None, None
+        info = highs.getInfo()
+        if info.primal_solution_status == 2:  # kSolutionStatusFeasible
+            # binaries come back with a small integrality tolerance
+            values = np.round(np.asarray(highs.getSolution().col_value))
+            gap = info.mip_gap
+
+        objective = float(matrix.objective.dot(values)) if values is not None else None
+        return SolveResult(status, values, objective, solution_time, io_time, gap)
+
+    @staticmethod
+    def to_highs_lp(matrix):
+        """
+        Returns `matrix` as a `highspy.HighsLp` with integer columns.
+        """
+        rows = matrix.rows
+        inf = highspy.kHighsInf
+        lower = np.where(rows.sense == pulp.LpConstraintLE, -inf, rows.rhs)
+        upper = np.where(rows.sense == pulp.LpConstraintGE, inf, rows.rhs)
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = matrix.num_cols
+        lp.num_row_ = matrix.num_rows
+        lp.sense_ = highspy.ObjSense.kMaximize if matrix.maximize else highspy.ObjSense.kMinimize
+        lp.col_cost_ = matrix.objective
+        lp.col_lower_ = np.zeros(matrix.num_cols)
+        lp.col_upper_ = matrix.col_upper()
+        lp.row_lower_ = lower
+        lp.row_upper_ = upper
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.num_col_ = matrix.num_cols
+        lp.a_matrix_.num_row_ = matrix.num_rows
+        lp.a_matrix_.start_ = rows.indptr.astype(np.int32)
+        lp.a_matrix_.index_ = rows.indices.astype(np.int32)
+        lp.a_matrix_.value_ = rows.data
+        lp.integrality_ = [highspy.HighsVarType.kInteger] * matrix.num_cols
+        return lp
+
+
+class CpSatSolver:
+    """
+    Solves a compiled `ModelMatrix` with the CP-SAT solver of OR-Tools,
+    using several parallel search workers. Rows over binaries with unit
+    coefficients and a right-hand side of 1 are posted as at-most-one /
+    exactly-one constraints, all other rows as linear constraints.
+
+    Requires the optional `ortools` package.
+
+    Attributes:
+        msg (bool): Whether to show the search log
+        budget (SolveBudget): The limits of the solve, `threads` is the number
+            of parallel search workers
+        seed (int): The random seed of the solver, or `None` for the default
+    """
+
+    # `CpSolver.StatusName` -> pulp status
+    STATUS = {
+        'OPTIMAL': pulp.LpStatusOptimal,
+        'INFEASIBLE': pulp.LpStatusInfeasible,
+        'FEASIBLE': pulp.LpStatusNotSolved,
+        'UNKNOWN': pulp.LpStatusNotSolved
+    }
+
+    def __init__(self, msg=True, budget=None, seed=None):
+        if cp_model is None:
+            raise pulp.PulpSolverError('CP-SAT is not available, please install the `ortools` package')
+        self.msg = msg
+        self.budget = budget or SolveBudget()
+        self.seed = seed
+
+    def solve(self, matrix, start=None):
+        """
+        Solves `matrix` and returns a `SolveResult`. `start` is an optional
+        vector of column values handed to CP-SAT as a solution hint.
+        """
+        begin = time.time()
+        model, cols, scale = CpSatSolver.to_cp_model(matrix)
+        if start is not None:
+            for col, value in zip(cols, start.tolist()):
+                model.AddHint(col, int(round(value)))
+        io_time = time.time() - begin
+
+        solver = cp_model.CpSolver()
+        solver.parameters.num_search_workers = self.budget.threads or os.cpu_count() or 1
+        solver.parameters.log_search_progress = bool(self.msg)
+        if self.seed is not None:
+            solver.parameters.random_seed = int(self.seed)
+        if self.budget.time_limit is not None:
+            solver.parameters.max_time_in_seconds = float(self.budget.time_limit)
+        if self.budget.gap_rel is not None:
+            solver.parameters.relative_gap_limit = float(self.budget.gap_rel)
+        if self.budget.gap_abs is not None:
+            # the objective is scaled to integers, see `to_cp_model`
+            solver.parameters.absolute_gap_limit = float(self.budget.gap_abs) * scale
+
+        begin = time.time()
+        cp_status = solver.Solve(model)
+        solution_time = time.time() - begin
+
+        status = CpSatSolver.STATUS.get(solver.StatusName(cp_status), pulp.LpStatusUndefined)
+        values, gap = None, None
+        if cp_status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            values = np.array([solver.Value(_) for _ in cols], dtype=float)
+            best, bound = solver.ObjectiveValue(), solver.BestObjectiveBound()
+            gap = abs(bound - best) / max(abs(best), 1e-10)
+
+        objective = float(matrix.objective.dot(values)) if values is not None else None
+        return SolveResult(status, values, objective, solution_time, io_time, gap)
+
+    @staticmethod
+    def to_cp_model(matrix):
+        """
+        Returns `matrix` as a `cp_model.CpModel`, together with the Boolean
+        variable of each column and the objective scale. CP-SAT only accepts
+        integer coefficients, so the constraint rows must be integral and the
+        objective is scaled to integers.
+        """
+        rows = matrix.rows
+        if not (np.array_equal(rows.data, np.round(rows.data)) and np.array_equal(rows.rhs, np.round(rows.rhs))):
+            raise pulp.PulpSolverError('CP-SAT requires integral constraint coefficients')
+
+        model = cp_model.CpModel()
+        cols = [
+            model.NewBoolVar('C{:07d}'.format(j)) if upper == 1 else model.NewIntVar(0, int(upper), 'C{:07d}'.format(j))
+            for j, upper in enumerate(matrix.col_upper().tolist())
+        ]
+
+        indptr, indices = rows.indptr.tolist(), rows.indices.tolist()
+        data = rows.data.astype(np.int64).tolist()
+        rhs, sense = rows.rhs.astype(np.int64).tolist(), rows.sense.tolist()
+        for i in range(len(rows)):
+            start, end = indptr[i], indptr[i + 1]
+            literals = [cols[j] for j in indices[start:end]]
+            coefs = data[start:end]
+
+            if rhs[i] == 1 and all(a == 1 for a in coefs) and sense[i] != pulp.LpConstraintGE:
+                if sense[i] == pulp.LpConstraintLE:
+                    model.AddAtMostOne(literals)
+                else:
+                    model.AddExactlyOne(literals)
+                continue
+
+            expr = cp_model.LinearExpr.WeightedSum(literals, coefs)
+            if sense[i] == pulp.LpConstraintLE:
+                model.Add(expr <= rhs[i])
+            elif sense[i] == pulp.LpConstraintGE:
+                model.Add(expr >= rhs[i])
+            else:
+                model.Add(expr == rhs[i])
+
+        nonzero = np.flatnonzero(matrix.objective)
+        coefs, scale = CpSatSolver.integral_coefficients(matrix.objective[nonzero])
+        objective = cp_model.LinearExpr.WeightedSum([cols[j] for j in nonzero.tolist()], coefs)
+        if matrix.maximize:
+            model.Maximize(objective)
+        else:
+            model.Minimize(objective)
+
+        return model, cols, scale
+
+    @staticmethod
+    def integral_coefficients(coefs, max_denominator=10 ** 6):
+        """
+        Scales the supplied (rational) coefficients to integers with the
+        same ratios. Returns the integer coefficients and the scale.
+        """
+        fractions = [Fraction(_).limit_denominator(max_denominator) for _ in coefs.tolist()]
+        scale = reduce(lambda a, b: a * b // gcd(a, b), (_.denominator for _ in fractions), 1)
+        return [int(_ * scale) for _ in fractions], scale
+
+
+def _solve_part(solver, matrix, start):
+    return solver.solve(matrix, start=start)
+
+
+class DecomposedSolver:
+    """
+    Splits a compiled program into its independent parts (see
+    `ModelMatrix.components`) and solves them concurrently in worker
+    processes, each with the wrapped solver. The solutions of the parts are
+    stitched back into a single vector of column values.
+
+    Attributes:
+        solver: The solver of each part, e.g. a `CbcSolver`
+        max_workers (int): The maximum number of worker processes, or
+            `None` for one per core
+        num_parts (int): The number of parts of the last program solved
+    """
+
+    def __init__(self, solver, max_workers=None):
+        self.solver = solver
+        self.max_workers = max_workers
+        self.num_parts = 0
+
+    def solve(self, matrix, start=None):
+        """
+        Solves `matrix` and returns a `SolveResult`, see `CbcSolver.solve`.
+        A program that does not split is solved in-process.
+        """
+        begin = time.time()
+        parts = matrix.components()
+        self.num_parts = len(parts)
+        if len(parts) < 2:
+            return self.solver.solve(matrix, start=start)
+
+        with ProcessPoolExecutor(self.max_workers) as pool:
+            futures = [
+                pool.submit(_solve_part, self.solver, matrix.submatrix(cols),
+                            None if start is None else start[cols])
+                for cols in parts
+            ]
+            results = [_.result() for _ in futures]
+
+        def stitch(results):
+            values = np.zeros(matrix.num_cols)
+            for cols, result in zip(parts, results):
+                values[cols] = result.values
+            return values, float(matrix.objective.dot(values))
+
+        return combine_results(results, time.time() - begin, stitch)
+
+
+def combine_results(results, solution_time, stitch):
+    """
+    Returns the `SolveResult` of a program that was solved in parts (whose
+    objectives add up), from the results of the parts. `stitch` is only
+    called if all parts have a solution; it takes the results and returns
+    the column values and objective value of the whole program.
+    """
+    io_time = sum(_.io_time for _ in results)
+    for result in results:
+        if result.status not in (pulp.LpStatusOptimal, pulp.LpStatusNotSolved):
+            return SolveResult(result.status, solution_time=solution_time, io_time=io_time)
+    if any(_.values is None for _ in results):
+        return SolveResult(pulp.LpStatusNotSolved, solution_time=solution_time, io_time=io_time)
+
+    values, objective = stitch(results)
+
+    # the absolute gaps of the parts add up
+    gap = None
+    if all(_.gap is not None for _ in results):
+        gap_abs = sum(_.gap * abs(_.objective) for _ in results)
+        gap = gap_abs / abs(objective) if objective else (0.0 if gap_abs == 0 else None)
+
+    optimal = all(_.status == pulp.LpStatusOptimal for _ in results)
+    return SolveResult(
+        pulp.LpStatusOptimal if optimal else pulp.LpStatusNotSolved,
+        values, objective, solution_time, io_time, gap
+    )
+
+
+def get_solver(name, cbc_path=None, msg=True, budget=None, seed=None, cancel=None, on_line=None):
+    """
+    Returns the solver for a compiled program with the given key (see
+    `SOLVER_NAMES`). `cbc_path` is the path to the CBC executable,
+    `budget` the `SolveBudget` of each solve and `seed` the random seed.
+    `cancel` and `on_line` only apply to CBC, see `CbcSolver`: the other
+    solvers run in-process until they finish.
+    """
+    if name == 'cbc':
+        return CbcSolver(cbc_path, msg=msg, budget=budget, seed=seed, cancel=cancel, on_line=on_line)
+    elif name == 'highs':
+        return HighsSolver(msg=msg, budget=budget, seed=seed)
+    elif name == 'cpsat':
+        return CpSatSolver(msg=msg, budget=budget, seed=seed)
+
+    raise ValueError('Unknown solver: {}'.format(name))
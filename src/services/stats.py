@@ -0,0 +1,131 @@
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Progress:
+    """
+    A progress event of a scheduler run.
+
+    Attributes:
+        kind (str): `'stage'` when a stage of the run finished, `'solver'`
+            for a line of solver output
+        message (str): The name of the stage, or the line of output
+        elapsed (float): The wall time since the start of the run, in seconds
+    """
+
+    def __init__(self, kind, message, elapsed):
+        self.kind = kind
+        self.message = message
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return '[{:.1f} s] {}: {}'.format(self.elapsed, self.kind, self.message)
+
+
+class StageStats:
+    """
+    Collects the wall time, allocated memory and model growth of each stage
+    of a scheduler run.
+
+    Attributes:
+        stages (OrderedDict): Maps each stage name to a dictionary with keys
+            `time` (seconds), `memory` (net bytes allocated, or `None` when
+            memory is not traced), `rows`, `cols` and `nnz` (model growth)
+        trace_memory (bool): Whether allocations are traced with `tracemalloc`
+        listener (callable): An optional callable that receives a `Progress`
+            event whenever a stage is recorded
+    """
+    # tracing is process wide: it is started by the first run that traces,
+    # and stopped when the last one stops. concurrent runs in threads count
+    # each other's allocations
+    _tracing_lock = threading.Lock()
+    _tracing_runs = 0
+    _started_tracing = False
+
+    def __init__(self, trace_memory=False, listener=None):
+        self.stages = OrderedDict()
+        self.trace_memory = trace_memory
+        self.listener = listener
+        self._tracing = False
+        self._begin = time.perf_counter()
+
+    def elapsed(self):
+        """
+        Returns the wall time since the run started, in seconds.
+        """
+        return time.perf_counter() - self._begin
+
+    def start(self):
+        """
+        Starts the clock of the run, and tracing allocations, if enabled.
+        """
+        self._begin = time.perf_counter()
+        if not self.trace_memory or self._tracing: return
+        with StageStats._tracing_lock:
+            if StageStats._tracing_runs == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                StageStats._started_tracing = True
+            StageStats._tracing_runs += 1
+        self._tracing = True
+
+    def stop(self):
+        if not self._tracing: return
+        with StageStats._tracing_lock:
+            StageStats._tracing_runs -= 1
+            if StageStats._tracing_runs == 0 and StageStats._started_tracing:
+                tracemalloc.stop()
+                StageStats._started_tracing = False
+        self._tracing = False
+
+    def add(self, name, seconds, memory=None, size_before=(0, 0, 0), size_after=(0, 0, 0)):
+        """
+        Records a stage that was measured externally.
+        """
+        rows, cols, nnz = (after - before for before, after in zip(size_before, size_after))
+        stage = self.stages.setdefault(
+            name, {'time': 0.0, 'memory': None, 'rows': 0, 'cols': 0, 'nnz': 0})
+
+        stage['time'] += seconds
+        if memory is not None:
+            stage['memory'] = (stage['memory'] or 0) + memory
+        stage['rows'] += rows
+        stage['cols'] += cols
+        stage['nnz'] += nnz
+        if self.listener is not None:
+            self.listener(Progress('stage', name, self.elapsed()))
+
+    @contextmanager
+    def stage(self, name, size=None):
+        """
+        Measures the enclosed block as stage `name`. `size` is a callable
+        returning the current (rows, cols, nnz) of the model.
+        """
+        tracing = tracemalloc.is_tracing()
+        size_before = size() if size else (0, 0, 0)
+        memory_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        start = time.perf_counter()
+
+        yield
+
+        seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0] - memory_before if tracing else None
+        size_after = size() if size else (0, 0, 0)
+        self.add(name, seconds, memory, size_before, size_after)
+
+    def as_dict(self):
+        return OrderedDict((name, dict(stage)) for name, stage in self.stages.items())
+
+    def lines(self):
+        """
+        Returns a human readable line for each stage.
+        """
+        lines = []
+        for name, stage in self.stages.items():
+            memory = 'n/a' if stage['memory'] is None else '{:.1f} MiB'.format(stage['memory'] / 2 ** 20)
+            lines.append('{}: {:.3f} s, {}, +{} rows, +{} cols, +{} nonzeros'.format(
+                name, stage['time'], memory, stage['rows'], stage['cols'], stage['nnz']
+            ))
+        return lines
@@ -14,6 +14,8 @@ from helpers.excelhelper import ExcelHelper
 from helpers.logger import Logger
 from helpers.uihelper import UiHelper
 from services import scheduler
+from services.cache import SolutionCache
+from services.solvers import SOLVER_NAMES
 
 from .dialog import DialogWindow
 from .models import TreeModel
@@ -28,6 +30,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self._configPath = ''
         self._requests = {}
         self._holidays = []
+        # scheduler of the last generated schedule, re-used by the next one
+        self._scheduler = None
+        # schedules solved before, by their inputs and settings
+        self._cache = SolutionCache()
 
         self.setupUi(self)
 
@@ -83,6 +89,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.loadConfigButton.clicked.connect(self.openConfig)
         self.loadRequestsButton.clicked.connect(self.openRequests)
         self.loadHolidaysButton.clicked.connect(self.openHolidays)
+        self.loadStartScheduleButton.clicked.connect(self.openStartSchedule)
         self.generateScheduleButton.clicked.connect(self.generateSchedule)
         self.exportScheduleButton.clicked.connect(self.exportSchedule)
         self.exportMonthlyButton.clicked.connect(self.exportMonthlySchedule)
@@ -90,6 +97,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.exportMpsButton.clicked.connect(partial(self.exportLpProblem, mps=True))
 
         self.calendarYearSpinBox.setValue(datetime.now().year + 1)
+        for key, name in SOLVER_NAMES.items():
+            self.solverComboBox.addItem(name, key)
 
         # misc vars
         self.holidayMap = {}
@@ -159,6 +168,24 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 QMessageBox.critical(self, "", "Unable to load holidays!\nDetails: {}".format(str(ex)))
                 self._logger.write_line('Unable to load holidays. {}'.format(str(ex)), level='ERROR')
 
+    def openStartSchedule(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Open yearly schedule", "", "Excel files (*.xlsx *.xlsm)"
+        )
+
+        if path != '':
+            try:
+                divAssignments, weekendAssignments, longWeekends = ExcelHelper.loadYearlySchedule(path)
+                self.clearScheduleTable()
+                self.showSchedule(divAssignments, weekendAssignments, longWeekends)
+                # holidays of the loaded schedule are unknown
+                self.holidayMap = {}
+                self._logger.write_line('Loaded start schedule: {}'.format(path))
+
+            except Exception as ex:
+                QMessageBox.critical(self, "", "Unable to load schedule!\nDetails: {}".format(str(ex)))
+                self._logger.write_line('Unable to load start schedule. {}'.format(str(ex)), level='ERROR')
+
     def saveConfig(self):
         fileName, _ = QFileDialog.getSaveFileName(
             self, "Save Configuration", "", "JSON files (*.json)"
@@ -222,7 +249,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             del self.configuration[clinName]
             UiHelper.syncTreeView(self.treeView, self.model, self.configuration)
 
-    def setupScheduler(self):
+    def setupScheduler(self, reuse=False):
         numClinicians = len(self.configuration.keys())
         if numClinicians <= 0:
             self._logger.write_line('No clinicians configured! Please load a configuration file with at least one clinician!', level='ERROR')
@@ -238,14 +265,31 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             if widget.isChecked():
                 constraints.append(widget.objectName().replace('CheckBox', ''))
 
+        formulation = 'tight' if self.tightFormulationCheckBox.isChecked() else 'pairwise'
+        if self.compactAdjacencyCheckBox.isChecked():
+            formulation = 'compact'
+        spreadRows = 'lazy' if self.lazySpreadCheckBox.isChecked() else 'full'
+        formulations = {'preventConsecutiveBlocks': formulation,
+                        'spreadBlocks': spreadRows, 'spreadWeekends': spreadRows}
+
+        # the previous scheduler keeps its model, and patches it if possible
+        if reuse and self._scheduler is not None:
+            self._scheduler.update(
+                num_blocks=numBlocks, clin_data=self.configuration,
+                request_dict=self._requests, holidays=self._holidays,
+                constraints=constraints, formulations=formulations
+            )
+            return self._scheduler
+
         return scheduler.Scheduler(
             logger=self._logger, num_blocks=numBlocks, clin_data=self.configuration,
             request_dict=self._requests, holidays=self._holidays,
-            constraints=constraints
+            constraints=constraints, formulations=formulations
         )
         
     def exportLpProblem(self, mps=False):
         shuffle = self.shuffleCheckBox.isChecked()
+        compiled = self.compileModelCheckBox.isChecked()
 
         scheduler = self.setupScheduler()
         if scheduler is None:
@@ -253,18 +297,17 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             return
 
         scheduler.setup_solver()
-        scheduler.setup_problem(shuffle=shuffle)
-
-        problem = scheduler.get_problem()
+        scheduler.presolve = self.presolveCheckBox.isChecked()
+        scheduler.setup_problem(shuffle=shuffle, compiled=compiled)
 
         if mps:
             dialogName = "Save MPS file"
             dialogExt = "MPS File (*.mps)"
-            export = problem.writeMPS
+            export = scheduler.write_mps
         else:
             dialogName = "Save LP file"
             dialogExt = "LP File (*.lp)"
-            export = problem.writeLP
+            export = scheduler.write_lp
 
         # choose save location
         path, _ = QFileDialog.getSaveFileName(
@@ -282,52 +325,115 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
     def generateSchedule(self):
+        # the schedule shown in the table is the starting point of the solver
+        initial = self.currentSchedule() if self.warmStartCheckBox.isChecked() else None
+
         self.clearScheduleTable()
         shuffle = self.shuffleCheckBox.isChecked()
         verbose = self.verboseCheckBox.isChecked()
-
-        scheduler = self.setupScheduler()
+        compiled = self.compileModelCheckBox.isChecked()
+        decompose = self.decomposeCheckBox.isChecked()
+        twoStage = self.twoStageCheckBox.isChecked()
+        elastic = self.elasticCheckBox.isChecked()
+        presolve = self.presolveCheckBox.isChecked()
+        cache = self._cache if self.useCacheCheckBox.isChecked() else None
+        solver = self.solverComboBox.currentData()
+        # solve budget, 0 means no limit
+        threads = self.threadsSpinBox.value()
+        timeLimit = self.timeLimitSpinBox.value() or None
+        gapRel = self.gapRelSpinBox.value() / 100 or None
+        gapAbs = self.gapAbsSpinBox.value() or None
+        portfolioRuns = self.portfolioSpinBox.value()
+
+        scheduler = self.setupScheduler(reuse=True)
         if scheduler is None:
             self._logger.write_line('Could not setup scheduler!', level='ERROR')
             return
 
-        schedule = scheduler.generate(verbose=verbose, shuffle=shuffle)
-        if schedule is None:
+        self._scheduler = scheduler
+        try:
+            if portfolioRuns > 1:
+                # race seeded runs of the same program in parallel
+                schedule = scheduler.generate_portfolio(
+                    portfolioRuns, solvers=(solver,), compiled=compiled, elastic=elastic,
+                    threads=threads, time_limit=timeLimit, gap_rel=gapRel, gap_abs=gapAbs)
+            else:
+                schedule = scheduler.generate(
+                    verbose=verbose, shuffle=shuffle, compiled=compiled, initial=initial, solver=solver,
+                    threads=threads, time_limit=timeLimit, gap_rel=gapRel, gap_abs=gapAbs,
+                    decompose=decompose, two_stage=twoStage, elastic=elastic, presolve=presolve,
+                    cache=cache)
+        except Exception as ex:
+            QMessageBox.critical(self, "", "Unable to generate schedule!\nDetails: {}".format(str(ex)))
+            self._logger.write_line('Unable to generate schedule. {}'.format(str(ex)), level='ERROR')
+            return
+
+        if schedule is None and scheduler.infeasibility:
+            # the reasons were logged by the feasibility check
+            self._logger.write_line('Could not generate schedule! The configuration cannot be scheduled, see above.', level='ERROR')
+
+        elif schedule is None:
             self._logger.write_line('Could not generate schedule! Try adjusting min/max values in the configuration tab.', level='ERROR')
         
         else:
             self._logger.write_line('Generated schedule!')
+            if scheduler.violations:
+                # each violation was logged by the scheduler
+                self._logger.write_line(
+                    'The schedule violates {} constraint row(s), see above.'.format(len(scheduler.violations)),
+                    level='WARNING')
+            if not scheduler.optimal:
+                gap = 'unknown' if scheduler.gap is None else '{:.2%}'.format(scheduler.gap)
+                self._logger.write_line(
+                    'The solve budget ran out, this is the best schedule found (gap: {}).'.format(gap), level='WARNING')
+            if scheduler.objective_loss is not None:
+                self._logger.write_line(
+                    'The two-stage schedule loses {:.6f} of the objective of the last full solve.'.format(
+                        scheduler.objective_loss))
             divAssignments = schedule[0]
             weekendAssignments = schedule[1]
             self.holidayMap = schedule[2]
             longWeekends = list(self.holidayMap.values())
-            
-            # create rows for each week num
-            for weekNum in range(1, len(weekendAssignments) + 1):
-                rowCount = self.scheduleTable.rowCount()
-                self.scheduleTable.insertRow(rowCount)
-                value = str(weekNum) + '*' if weekNum in longWeekends else str(weekNum)
-                self.scheduleTable.setItem(rowCount, 0, QTableWidgetItem(value))
-
-            for divName in divAssignments:
-                # create division columns
-                assignments = divAssignments[divName]
-                columnCount = self.scheduleTable.columnCount()
-                self.scheduleTable.insertColumn(columnCount)
-                self.scheduleTable.setHorizontalHeaderItem(columnCount, QTableWidgetItem(divName))
-
-                for i in range(len(assignments)):
-                    clinName = assignments[i]
-                    self.scheduleTable.setItem(i, columnCount, QTableWidgetItem(clinName))
-
-            weekendCol = self.scheduleTable.columnCount()
-            self.scheduleTable.insertColumn(weekendCol)
-            self.scheduleTable.setHorizontalHeaderItem(weekendCol, QTableWidgetItem("Weekend"))
-
-            for i in range(len(weekendAssignments)):
-                clinName = weekendAssignments[i]
-                self.scheduleTable.setItem(i, weekendCol, QTableWidgetItem(clinName))               
-    
+            self.showSchedule(divAssignments, weekendAssignments, longWeekends)
+
+    def showSchedule(self, divAssignments, weekendAssignments, longWeekends):
+        # create rows for each week num
+        for weekNum in range(1, len(weekendAssignments) + 1):
+            rowCount = self.scheduleTable.rowCount()
+            self.scheduleTable.insertRow(rowCount)
+            value = str(weekNum) + '*' if weekNum in longWeekends else str(weekNum)
+            self.scheduleTable.setItem(rowCount, 0, QTableWidgetItem(value))
+
+        for divName in divAssignments:
+            # create division columns
+            assignments = divAssignments[divName]
+            columnCount = self.scheduleTable.columnCount()
+            self.scheduleTable.insertColumn(columnCount)
+            self.scheduleTable.setHorizontalHeaderItem(columnCount, QTableWidgetItem(divName))
+
+            for i in range(len(assignments)):
+                clinName = assignments[i]
+                self.scheduleTable.setItem(i, columnCount, QTableWidgetItem(clinName))
+
+        weekendCol = self.scheduleTable.columnCount()
+        self.scheduleTable.insertColumn(weekendCol)
+        self.scheduleTable.setHorizontalHeaderItem(weekendCol, QTableWidgetItem("Weekend"))
+
+        for i in range(len(weekendAssignments)):
+            clinName = weekendAssignments[i]
+            self.scheduleTable.setItem(i, weekendCol, QTableWidgetItem(clinName))
+
+    def currentSchedule(self):
+        # schedule shown in the table, in the form returned by the scheduler
+        if self.scheduleTable.rowCount() == 0: return None
+
+        headers = ExcelHelper.getHorizontalHeaders(self.scheduleTable)
+        divAssignments = {
+            headers[i]: ExcelHelper.getColumn(self.scheduleTable, i) for i in range(1, len(headers) - 1)
+        }
+        weekendAssignments = ExcelHelper.getColumn(self.scheduleTable, len(headers) - 1)
+        return (divAssignments, weekendAssignments)
+
     def exportSchedule(self):
         # open save dialog to let user choose folder + filename
         fileName, _ = QFileDialog.getSaveFileName(
@@ -115,12 +115,18 @@ class Ui_MainWindow(object):
         self.numberOfBlocksSpinBox.setProperty("value", 26)
         self.numberOfBlocksSpinBox.setObjectName("numberOfBlocksSpinBox")
         self.setupForm.setWidget(4, QtWidgets.QFormLayout.FieldRole, self.numberOfBlocksSpinBox)
+        self.startScheduleLabel = QtWidgets.QLabel(self.setupGroupBox)
+        self.startScheduleLabel.setObjectName("startScheduleLabel")
+        self.setupForm.setWidget(5, QtWidgets.QFormLayout.LabelRole, self.startScheduleLabel)
+        self.loadStartScheduleButton = QtWidgets.QPushButton(self.setupGroupBox)
+        self.loadStartScheduleButton.setObjectName("loadStartScheduleButton")
+        self.setupForm.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.loadStartScheduleButton)
         self.exportLpButton = QtWidgets.QPushButton(self.setupGroupBox)
         self.exportLpButton.setObjectName("exportLpButton")
-        self.setupForm.setWidget(5, QtWidgets.QFormLayout.LabelRole, self.exportLpButton)
+        self.setupForm.setWidget(6, QtWidgets.QFormLayout.LabelRole, self.exportLpButton)
         self.exportMpsButton = QtWidgets.QPushButton(self.setupGroupBox)
         self.exportMpsButton.setObjectName("exportMpsButton")
-        self.setupForm.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.exportMpsButton)
+        self.setupForm.setWidget(6, QtWidgets.QFormLayout.FieldRole, self.exportMpsButton)
         self.horizontalLayout_6.addLayout(self.setupForm)
         self.setupScheduleGroupBox.addWidget(self.setupGroupBox)
         self.scheduleActions = QtWidgets.QGroupBox(self.schedulerTab)
@@ -148,6 +154,54 @@ class Ui_MainWindow(object):
         self.verboseCheckBox.setObjectName("verboseCheckBox")
         self.formLayout.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.verboseCheckBox)
         self.setupScheduleGroupBox.addWidget(self.scheduleActions)
+        self.budgetGroupBox = QtWidgets.QGroupBox(self.schedulerTab)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.budgetGroupBox.sizePolicy().hasHeightForWidth())
+        self.budgetGroupBox.setSizePolicy(sizePolicy)
+        self.budgetGroupBox.setObjectName("budgetGroupBox")
+        self.budgetForm = QtWidgets.QFormLayout(self.budgetGroupBox)
+        self.budgetForm.setObjectName("budgetForm")
+        self.threadsLabel = QtWidgets.QLabel(self.budgetGroupBox)
+        self.threadsLabel.setObjectName("threadsLabel")
+        self.budgetForm.setWidget(0, QtWidgets.QFormLayout.LabelRole, self.threadsLabel)
+        self.threadsSpinBox = QtWidgets.QSpinBox(self.budgetGroupBox)
+        self.threadsSpinBox.setMaximum(256)
+        self.threadsSpinBox.setObjectName("threadsSpinBox")
+        self.budgetForm.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.threadsSpinBox)
+        self.timeLimitLabel = QtWidgets.QLabel(self.budgetGroupBox)
+        self.timeLimitLabel.setObjectName("timeLimitLabel")
+        self.budgetForm.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.timeLimitLabel)
+        self.timeLimitSpinBox = QtWidgets.QSpinBox(self.budgetGroupBox)
+        self.timeLimitSpinBox.setMaximum(604800)
+        self.timeLimitSpinBox.setObjectName("timeLimitSpinBox")
+        self.budgetForm.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.timeLimitSpinBox)
+        self.gapRelLabel = QtWidgets.QLabel(self.budgetGroupBox)
+        self.gapRelLabel.setObjectName("gapRelLabel")
+        self.budgetForm.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.gapRelLabel)
+        self.gapRelSpinBox = QtWidgets.QDoubleSpinBox(self.budgetGroupBox)
+        self.gapRelSpinBox.setMaximum(100.0)
+        self.gapRelSpinBox.setObjectName("gapRelSpinBox")
+        self.budgetForm.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.gapRelSpinBox)
+        self.gapAbsLabel = QtWidgets.QLabel(self.budgetGroupBox)
+        self.gapAbsLabel.setObjectName("gapAbsLabel")
+        self.budgetForm.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.gapAbsLabel)
+        self.gapAbsSpinBox = QtWidgets.QDoubleSpinBox(self.budgetGroupBox)
+        self.gapAbsSpinBox.setDecimals(4)
+        self.gapAbsSpinBox.setMaximum(1.0)
+        self.gapAbsSpinBox.setSingleStep(0.001)
+        self.gapAbsSpinBox.setObjectName("gapAbsSpinBox")
+        self.budgetForm.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.gapAbsSpinBox)
+        self.portfolioLabel = QtWidgets.QLabel(self.budgetGroupBox)
+        self.portfolioLabel.setObjectName("portfolioLabel")
+        self.budgetForm.setWidget(4, QtWidgets.QFormLayout.LabelRole, self.portfolioLabel)
+        self.portfolioSpinBox = QtWidgets.QSpinBox(self.budgetGroupBox)
+        self.portfolioSpinBox.setMinimum(1)
+        self.portfolioSpinBox.setMaximum(64)
+        self.portfolioSpinBox.setObjectName("portfolioSpinBox")
+        self.budgetForm.setWidget(4, QtWidgets.QFormLayout.FieldRole, self.portfolioSpinBox)
+        self.setupScheduleGroupBox.addWidget(self.budgetGroupBox)
         self.controlsLayout.addLayout(self.setupScheduleGroupBox)
         self.outputGroupBox = QtWidgets.QGroupBox(self.schedulerTab)
         self.outputGroupBox.setObjectName("outputGroupBox")
@@ -221,8 +275,100 @@ class Ui_MainWindow(object):
         self.preventConsecutiveWeekendsCheckBox.setChecked(True)
         self.preventConsecutiveWeekendsCheckBox.setObjectName("preventConsecutiveWeekendsCheckBox")
         self.constraintsForm.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.preventConsecutiveWeekendsCheckBox)
+        self.spreadBlocksLabel = QtWidgets.QLabel(self.constraintsGroupBox)
+        self.spreadBlocksLabel.setObjectName("spreadBlocksLabel")
+        self.constraintsForm.setWidget(6, QtWidgets.QFormLayout.LabelRole, self.spreadBlocksLabel)
+        self.spreadBlocksCheckBox = QtWidgets.QCheckBox(self.constraintsGroupBox)
+        self.spreadBlocksCheckBox.setObjectName("spreadBlocksCheckBox")
+        self.constraintsForm.setWidget(6, QtWidgets.QFormLayout.FieldRole, self.spreadBlocksCheckBox)
+        self.spreadWeekendsLabel = QtWidgets.QLabel(self.constraintsGroupBox)
+        self.spreadWeekendsLabel.setObjectName("spreadWeekendsLabel")
+        self.constraintsForm.setWidget(7, QtWidgets.QFormLayout.LabelRole, self.spreadWeekendsLabel)
+        self.spreadWeekendsCheckBox = QtWidgets.QCheckBox(self.constraintsGroupBox)
+        self.spreadWeekendsCheckBox.setObjectName("spreadWeekendsCheckBox")
+        self.constraintsForm.setWidget(7, QtWidgets.QFormLayout.FieldRole, self.spreadWeekendsCheckBox)
+        self.hardTimeOffLabel = QtWidgets.QLabel(self.constraintsGroupBox)
+        self.hardTimeOffLabel.setObjectName("hardTimeOffLabel")
+        self.constraintsForm.setWidget(8, QtWidgets.QFormLayout.LabelRole, self.hardTimeOffLabel)
+        self.hardTimeOffCheckBox = QtWidgets.QCheckBox(self.constraintsGroupBox)
+        self.hardTimeOffCheckBox.setObjectName("hardTimeOffCheckBox")
+        self.constraintsForm.setWidget(8, QtWidgets.QFormLayout.FieldRole, self.hardTimeOffCheckBox)
         self.formLayout1.setLayout(0, QtWidgets.QFormLayout.LabelRole, self.constraintsForm)
         self.verticalLayout_3.addWidget(self.constraintsGroupBox)
+        self.solverGroupBox = QtWidgets.QGroupBox(self.settingsTab)
+        self.solverGroupBox.setObjectName("solverGroupBox")
+        self.solverForm = QtWidgets.QFormLayout(self.solverGroupBox)
+        self.solverForm.setObjectName("solverForm")
+        self.compileModelLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.compileModelLabel.setObjectName("compileModelLabel")
+        self.solverForm.setWidget(0, QtWidgets.QFormLayout.LabelRole, self.compileModelLabel)
+        self.compileModelCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.compileModelCheckBox.setObjectName("compileModelCheckBox")
+        self.solverForm.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.compileModelCheckBox)
+        self.warmStartLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.warmStartLabel.setObjectName("warmStartLabel")
+        self.solverForm.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.warmStartLabel)
+        self.warmStartCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.warmStartCheckBox.setObjectName("warmStartCheckBox")
+        self.solverForm.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.warmStartCheckBox)
+        self.solverLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.solverLabel.setObjectName("solverLabel")
+        self.solverForm.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.solverLabel)
+        self.solverComboBox = QtWidgets.QComboBox(self.solverGroupBox)
+        self.solverComboBox.setObjectName("solverComboBox")
+        self.solverForm.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.solverComboBox)
+        self.tightFormulationLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.tightFormulationLabel.setObjectName("tightFormulationLabel")
+        self.solverForm.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.tightFormulationLabel)
+        self.tightFormulationCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.tightFormulationCheckBox.setChecked(True)
+        self.tightFormulationCheckBox.setObjectName("tightFormulationCheckBox")
+        self.solverForm.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.tightFormulationCheckBox)
+        self.decomposeLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.decomposeLabel.setObjectName("decomposeLabel")
+        self.solverForm.setWidget(4, QtWidgets.QFormLayout.LabelRole, self.decomposeLabel)
+        self.decomposeCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.decomposeCheckBox.setObjectName("decomposeCheckBox")
+        self.solverForm.setWidget(4, QtWidgets.QFormLayout.FieldRole, self.decomposeCheckBox)
+        self.twoStageLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.twoStageLabel.setObjectName("twoStageLabel")
+        self.solverForm.setWidget(5, QtWidgets.QFormLayout.LabelRole, self.twoStageLabel)
+        self.twoStageCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.twoStageCheckBox.setObjectName("twoStageCheckBox")
+        self.solverForm.setWidget(5, QtWidgets.QFormLayout.FieldRole, self.twoStageCheckBox)
+        self.lazySpreadLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.lazySpreadLabel.setObjectName("lazySpreadLabel")
+        self.solverForm.setWidget(6, QtWidgets.QFormLayout.LabelRole, self.lazySpreadLabel)
+        self.lazySpreadCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.lazySpreadCheckBox.setObjectName("lazySpreadCheckBox")
+        self.solverForm.setWidget(6, QtWidgets.QFormLayout.FieldRole, self.lazySpreadCheckBox)
+        self.elasticLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.elasticLabel.setObjectName("elasticLabel")
+        self.solverForm.setWidget(7, QtWidgets.QFormLayout.LabelRole, self.elasticLabel)
+        self.elasticCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.elasticCheckBox.setObjectName("elasticCheckBox")
+        self.solverForm.setWidget(7, QtWidgets.QFormLayout.FieldRole, self.elasticCheckBox)
+        self.presolveLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.presolveLabel.setObjectName("presolveLabel")
+        self.solverForm.setWidget(8, QtWidgets.QFormLayout.LabelRole, self.presolveLabel)
+        self.presolveCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.presolveCheckBox.setChecked(True)
+        self.presolveCheckBox.setObjectName("presolveCheckBox")
+        self.solverForm.setWidget(8, QtWidgets.QFormLayout.FieldRole, self.presolveCheckBox)
+        self.compactAdjacencyLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.compactAdjacencyLabel.setObjectName("compactAdjacencyLabel")
+        self.solverForm.setWidget(9, QtWidgets.QFormLayout.LabelRole, self.compactAdjacencyLabel)
+        self.compactAdjacencyCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.compactAdjacencyCheckBox.setObjectName("compactAdjacencyCheckBox")
+        self.solverForm.setWidget(9, QtWidgets.QFormLayout.FieldRole, self.compactAdjacencyCheckBox)
+        self.useCacheLabel = QtWidgets.QLabel(self.solverGroupBox)
+        self.useCacheLabel.setObjectName("useCacheLabel")
+        self.solverForm.setWidget(10, QtWidgets.QFormLayout.LabelRole, self.useCacheLabel)
+        self.useCacheCheckBox = QtWidgets.QCheckBox(self.solverGroupBox)
+        self.useCacheCheckBox.setChecked(True)
+        self.useCacheCheckBox.setObjectName("useCacheCheckBox")
+        self.solverForm.setWidget(10, QtWidgets.QFormLayout.FieldRole, self.useCacheCheckBox)
+        self.verticalLayout_3.addWidget(self.solverGroupBox)
         spacerItem = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.verticalLayout_3.addItem(spacerItem)
         self.tabWidget.addTab(self.settingsTab, "")
@@ -233,12 +379,32 @@ class Ui_MainWindow(object):
         self.holidaysLabel.setBuddy(self.loadHolidaysButton)
         self.calendarYearLabel.setBuddy(self.calendarYearSpinBox)
         self.numberOfBlocksLabel.setBuddy(self.numberOfBlocksSpinBox)
+        self.startScheduleLabel.setBuddy(self.loadStartScheduleButton)
+        self.threadsLabel.setBuddy(self.threadsSpinBox)
+        self.timeLimitLabel.setBuddy(self.timeLimitSpinBox)
+        self.gapRelLabel.setBuddy(self.gapRelSpinBox)
+        self.gapAbsLabel.setBuddy(self.gapAbsSpinBox)
+        self.portfolioLabel.setBuddy(self.portfolioSpinBox)
         self.coverageLabel.setBuddy(self.coverageCheckBox)
         self.minMaxBlocksLabel.setBuddy(self.minMaxBlocksCheckBox)
         self.balancedWeekendsLabel.setBuddy(self.balancedWeekendsCheckBox)
         self.balancedLongWeekendsLabel.setBuddy(self.balancedLongWeekendsCheckBox)
         self.preventConsecutiveBlocksLabel.setBuddy(self.preventConsecutiveBlocksCheckBox)
         self.preventConsecutiveWeekendsLabel.setBuddy(self.preventConsecutiveWeekendsCheckBox)
+        self.spreadBlocksLabel.setBuddy(self.spreadBlocksCheckBox)
+        self.spreadWeekendsLabel.setBuddy(self.spreadWeekendsCheckBox)
+        self.hardTimeOffLabel.setBuddy(self.hardTimeOffCheckBox)
+        self.compileModelLabel.setBuddy(self.compileModelCheckBox)
+        self.warmStartLabel.setBuddy(self.warmStartCheckBox)
+        self.solverLabel.setBuddy(self.solverComboBox)
+        self.tightFormulationLabel.setBuddy(self.tightFormulationCheckBox)
+        self.decomposeLabel.setBuddy(self.decomposeCheckBox)
+        self.twoStageLabel.setBuddy(self.twoStageCheckBox)
+        self.lazySpreadLabel.setBuddy(self.lazySpreadCheckBox)
+        self.elasticLabel.setBuddy(self.elasticCheckBox)
+        self.presolveLabel.setBuddy(self.presolveCheckBox)
+        self.compactAdjacencyLabel.setBuddy(self.compactAdjacencyCheckBox)
+        self.useCacheLabel.setBuddy(self.useCacheCheckBox)
 
         self.retranslateUi(MainWindow)
         self.tabWidget.setCurrentIndex(1)
@@ -272,6 +438,9 @@ class Ui_MainWindow(object):
         self.calendarYearLabel.setText(_translate("MainWindow", "Calendar Year"))
         self.calendarYearSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Set the calendar year to be used by the scheduler</p></body></html>"))
         self.numberOfBlocksLabel.setText(_translate("MainWindow", "Number of Blocks"))
+        self.startScheduleLabel.setText(_translate("MainWindow", "Start Schedule"))
+        self.loadStartScheduleButton.setToolTip(_translate("MainWindow", "<html><head/><body><p>Load a yearly schedule (e.g. last year\'s) into the schedule table, to be used as a warm start</p></body></html>"))
+        self.loadStartScheduleButton.setText(_translate("MainWindow", "Load"))
         self.exportLpButton.setText(_translate("MainWindow", "Export as LP"))
         self.exportMpsButton.setText(_translate("MainWindow", "Export as MPS"))
         self.scheduleActions.setTitle(_translate("MainWindow", "Schedule"))
@@ -282,6 +451,17 @@ class Ui_MainWindow(object):
         self.exportScheduleButton.setText(_translate("MainWindow", "Export Yearly"))
         self.exportMonthlyButton.setText(_translate("MainWindow", "Export Monthly"))
         self.verboseCheckBox.setText(_translate("MainWindow", "Verbose Output"))
+        self.budgetGroupBox.setTitle(_translate("MainWindow", "Solve Budget"))
+        self.threadsLabel.setText(_translate("MainWindow", "Threads"))
+        self.threadsSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Number of threads used by the solver, 0 uses the solver default (all cores for CP-SAT)</p></body></html>"))
+        self.timeLimitLabel.setText(_translate("MainWindow", "Time Limit (s)"))
+        self.timeLimitSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Stop the solver after this many seconds and use the best schedule found so far, 0 for no limit</p></body></html>"))
+        self.gapRelLabel.setText(_translate("MainWindow", "Relative Gap (%)"))
+        self.gapRelSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Stop the solver once the best schedule found is proven to be within this percentage of the optimum</p></body></html>"))
+        self.gapAbsLabel.setText(_translate("MainWindow", "Absolute Gap"))
+        self.gapAbsSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Stop the solver once the best schedule found is proven to be within this objective value of the optimum</p></body></html>"))
+        self.portfolioLabel.setText(_translate("MainWindow", "Portfolio Runs"))
+        self.portfolioSpinBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Number of differently seeded solver runs started in parallel, the first run that proves its schedule optimal wins. 1 runs a single solver</p></body></html>"))
         self.outputGroupBox.setTitle(_translate("MainWindow", "Output"))
         item = self.scheduleTable.horizontalHeaderItem(0)
         item.setText(_translate("MainWindow", "Week Number"))
@@ -293,5 +473,31 @@ class Ui_MainWindow(object):
         self.balancedLongWeekendsLabel.setText(_translate("MainWindow", "Balance Long Weekends"))
         self.preventConsecutiveBlocksLabel.setText(_translate("MainWindow", "Prevent Consecutive Blocks"))
         self.preventConsecutiveWeekendsLabel.setText(_translate("MainWindow", "Prevent Consecutive Weekends"))
+        self.spreadBlocksLabel.setText(_translate("MainWindow", "Spread Out Blocks"))
+        self.spreadWeekendsLabel.setText(_translate("MainWindow", "Spread Out Weekends"))
+        self.hardTimeOffLabel.setText(_translate("MainWindow", "Never Assign Time Off"))
+        self.solverGroupBox.setTitle(_translate("MainWindow", "Solver"))
+        self.compileModelLabel.setText(_translate("MainWindow", "Compile Model Directly"))
+        self.compileModelCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Build the constraint matrix as arrays and write the MPS/LP file straight from them, bypassing PuLP expressions</p></body></html>"))
+        self.warmStartLabel.setText(_translate("MainWindow", "Warm Start From Current Schedule"))
+        self.warmStartCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Hand the schedule shown in the schedule table (the last generated or a loaded one) to the solver as a starting solution</p></body></html>"))
+        self.solverLabel.setText(_translate("MainWindow", "Solver"))
+        self.solverComboBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Solver used to generate the schedule. Solvers other than CBC run in-process on the compiled model</p></body></html>"))
+        self.tightFormulationLabel.setText(_translate("MainWindow", "Tight Formulation"))
+        self.decomposeLabel.setText(_translate("MainWindow", "Solve Independent Parts in Parallel"))
+        self.twoStageLabel.setText(_translate("MainWindow", "Two-Stage Solve"))
+        self.twoStageCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Solve the blocks first and then the weekends with the blocks fixed. Much faster, but may lose a little of the objective against a full solve</p></body></html>"))
+        self.lazySpreadLabel.setText(_translate("MainWindow", "Add Spread Rows Lazily"))
+        self.lazySpreadCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Leave the Spread Out rows out of the model, and only add the rows that a schedule violates before solving again. Smaller models, but usually slower than adding all rows</p></body></html>"))
+        self.elasticLabel.setText(_translate("MainWindow", "Elastic Mode"))
+        self.elasticCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Always return a schedule: the min/max, consecutive and balance constraints may be violated at a penalty, and the violations are listed in the log. Cannot be combined with the two-stage solve</p></body></html>"))
+        self.presolveLabel.setText(_translate("MainWindow", "Presolve"))
+        self.compactAdjacencyLabel.setText(_translate("MainWindow", "Compact Adjacency Helpers"))
+        self.compactAdjacencyCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Use one block-adjacent weekend helper per clinician and block, across all divisions, instead of one per division. Needs Prevent Consecutive Blocks, and replaces the Tight Formulation rows</p></body></html>"))
+        self.useCacheLabel.setText(_translate("MainWindow", "Reuse Stored Schedules"))
+        self.useCacheCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Return the stored schedule when the same configuration, requests, holidays and settings were solved before, instead of solving again. Shuffled runs are always solved</p></body></html>"))
+        self.presolveCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Leave the columns that the constraints fix to 0 (divisions with a maximum of 0, hard time off, assignments ruled out by the previous schedule) out of the model, together with the rows that only involve them</p></body></html>"))
+        self.decomposeCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Split the model into independent parts, if it has any, and solve them in parallel processes. With weekend coverage, the shared weekends link all clinicians</p></body></html>"))
+        self.tightFormulationCheckBox.setToolTip(_translate("MainWindow", "<html><head/><body><p>Add rows that tighten the relaxation of the Prevent Consecutive Blocks constraint, which usually speeds up the solver a lot. Unchecked, only the pairwise rows are used</p></body></html>"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.settingsTab), _translate("MainWindow", "Settings"))
 